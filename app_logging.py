@@ -0,0 +1,145 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is emitted as a field
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_EMAIL_RE = re.compile(r"([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9.-]+)")
+_SECRET_KEYS = {"password", "access_token", "refresh_token", "token", "authorization", "apikey", "body"}
+
+# High-volume events are sampled; override with LOG_SAMPLE_RATES="event=rate,..."
+DEFAULT_SAMPLE_RATES = {"login_attempt": 0.1, "user_fallback": 0.1}
+
+
+def redact_email(value: str) -> str:
+    """alice@example.com -> a***@example.com"""
+    return _EMAIL_RE.sub(r"\1***@\2", value)
+
+
+def _redact(value: Any, key: Optional[str] = None) -> Any:
+    if key is not None and key.lower() in _SECRET_KEYS:
+        return "[redacted]"
+    if isinstance(value, str):
+        return redact_email(value)
+    if isinstance(value, dict):
+        return {k: _redact(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact(v) for v in value]
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with emails and secrets redacted"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": redact_email(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and key != "sample_rate":
+                entry[key] = _redact(value, key)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records for high-volume events (warnings and above are never sampled)"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            rate = self.rates.get(getattr(record, "event", None), 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread without formatting them on the request path
+
+    The queue is bounded; when it is full the record is dropped and counted rather than
+    blocking the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting (including tracebacks) happens in the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def _sample_rates_from_env() -> Dict[str, float]:
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in os.getenv("LOG_SAMPLE_RATES", "").split(","):
+        if "=" in item:
+            event, rate = item.split("=", 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+def configure_logging() -> None:
+    """Route the app's loggers through a bounded queue to a JSON stdout writer thread"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    if _queue_handler is None:
+        _queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+        _queue_handler.addFilter(SamplingFilter(_sample_rates_from_env()))
+        root = logging.getLogger("wallet")
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        root.addHandler(_queue_handler)
+        root.propagate = False
+        # Flush whatever is still queued if the process exits without the lifespan shutdown hook
+        atexit.register(shutdown_logging)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"wallet.{name}")
+
+
+def logging_stats() -> Dict[str, Any]:
+    return {
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+    }
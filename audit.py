@@ -0,0 +1,156 @@
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from app_logging import get_logger
+
+logger = get_logger("audit")
+
+
+class AuditLog:
+    """Append-only audit trail of admin actions (create_audit_log_table.sql)
+
+    record() only enqueues; a background thread inserts events in batches of up to
+    `max_batch`, at least every `interval` seconds. Failed inserts are retried on the next
+    flush; if the table doesn't exist, events are written to the application log instead
+    so they are never silently dropped.
+    """
+
+    def __init__(self, client: Callable[[], Any], max_batch: int = 100, interval: float = 1.0, max_buffer: int = 10000):
+        # Callable so the client can be swapped after import
+        self._client = client
+        self.max_batch = max_batch
+        self.interval = interval
+        self.persistent = True
+        self.written = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_buffer)
+        self._retry: List[Dict[str, Any]] = []
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def record(
+        self,
+        actor: Any,
+        action: str,
+        target_type: str,
+        target_id: Optional[str] = None,
+        before: Optional[Dict[str, Any]] = None,
+        after: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Queue one event; `actor` is the authenticated user (anything with .id and .email)"""
+        event = {
+            "occurred_at": datetime.now(timezone.utc).isoformat(),
+            "actor_id": getattr(actor, "id", None),
+            "actor_email": getattr(actor, "email", None),
+            "action": action,
+            "target_type": target_type,
+            "target_id": None if target_id is None else str(target_id),
+            "before": before,
+            "after": after,
+        }
+        self.start()
+        try:
+            self._queue.put_nowait(event)
+            if self._queue.qsize() >= self.max_batch:
+                self._wake.set()
+        except queue.Full:
+            # Never block an admin request on the audit trail; keep the event in the app log
+            self.dropped += 1
+            logger.warning("Audit buffer full, event logged only", extra={"audit_event": event})
+
+    def flush(self) -> None:
+        """Write everything queued so far (also called by the background thread)"""
+        with self._flush_lock:
+            batch, self._retry = self._retry, []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for i in range(0, len(batch), self.max_batch):
+                if not self._write(batch[i:i + self.max_batch]):
+                    self._retry = batch[i:]
+                    overflow = len(self._retry) - self._queue.maxsize
+                    if overflow > 0:
+                        # Database down for a long time: keep the newest events, log the rest
+                        self.dropped += overflow
+                        logger.error("Audit retry buffer full, events logged only", extra={"audit_events": self._retry[:overflow]})
+                        self._retry = self._retry[overflow:]
+                    return
+
+    def _write(self, events: List[Dict[str, Any]]) -> bool:
+        if not self.persistent:
+            for event in events:
+                logger.info("Audit event", extra={"event": "audit", "audit_event": event})
+            return True
+        try:
+            self._client().table("audit_log").insert(events).execute()
+            self.written += len(events)
+            return True
+        except Exception as e:
+            if "Could not find the table" in str(e) or "PGRST205" in str(e):
+                logger.warning("audit_log table does not exist, audit events go to the application log. Run create_audit_log_table.sql.")
+                self.persistent = False
+                return self._write(events)
+            self.failed_flushes += 1
+            logger.error("Error writing audit events, will retry: %s", e)
+            return False
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Stop the writer thread and flush what is left"""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self.flush()
+        if self._retry:
+            logger.error("Audit events could not be written before shutdown", extra={"audit_events": self._retry})
+
+    def _run(self) -> None:
+        # Flush every `interval` seconds, or as soon as a full batch is waiting
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def query(
+        self,
+        limit: int = 50,
+        before_id: Optional[int] = None,
+        action: Optional[str] = None,
+        actor_id: Optional[str] = None,
+        target_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Newest events first; pass the returned next_cursor as before_id for the next page"""
+        query = self._client().table("audit_log").select("*")
+        if before_id is not None:
+            query = query.lt("id", before_id)
+        if action:
+            query = query.eq("action", action)
+        if actor_id:
+            query = query.eq("actor_id", actor_id)
+        if target_id:
+            query = query.eq("target_id", target_id)
+        rows = query.order("id", desc=True).limit(limit).execute().data or []
+        return {"events": rows, "next_cursor": rows[-1]["id"] if len(rows) == limit else None}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "persistent": self.persistent,
+            "buffered": self._queue.qsize() + len(self._retry),
+            "written": self.written,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+        }
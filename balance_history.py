@@ -0,0 +1,225 @@
+import math
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app_logging import get_logger
+
+logger = get_logger("balance_history")
+
+PAGE_SIZE = 1000
+DAY_SECONDS = 86400
+
+# Sub-day bucket sizes, smallest first; anything coarser is a whole number of days
+INTRADAY_INTERVALS = (60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600)
+
+# Ranges longer than this are always served from the daily rollups
+INTRADAY_MAX_DAYS = float(os.getenv("BALANCE_HISTORY_INTRADAY_DAYS", "7"))
+
+# refresh_daily_balances() rolls a day up 5 minutes after it ends; waiting longer here keeps a
+# day that the database hasn't rolled up yet (clock skew) replayed from the ledger
+ROLLUP_GRACE = timedelta(minutes=10)
+
+
+def _is_missing_rollups(e: Exception) -> bool:
+    # Rollups come from create_balance_rollups.sql
+    message = str(e)
+    return (
+        "Could not find the function" in message
+        or "Could not find the table" in message
+        or "PGRST202" in message
+        or "PGRST205" in message
+    )
+
+
+def _parse_ts(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _day_start(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def pick_interval(start: datetime, end: datetime, max_points: int) -> int:
+    """Bucket size in seconds so that [start, end) fits in at most `max_points` buckets"""
+    span = (end - start).total_seconds()
+    wanted = span / max_points
+    if span <= INTRADAY_MAX_DAYS * DAY_SECONDS:
+        for interval in INTRADAY_INTERVALS:
+            if interval >= wanted:
+                return interval
+    # Daily buckets cover whole UTC days, starting with the day `start` falls on
+    days = ((end - timedelta(microseconds=1)).date() - start.date()).days + 1
+    return max(1, math.ceil(days / max_points)) * DAY_SECONDS
+
+
+def _bucket_entries(
+    opening: float, entries: Sequence[Dict[str, Any]], starts: Sequence[datetime], interval: timedelta
+) -> List[Dict[str, Any]]:
+    """Replay entries (oldest first) into buckets: last value, low and high per bucket"""
+    points: List[Dict[str, Any]] = []
+    balance = opening
+    i = 0
+    for bucket_start in starts:
+        bucket_end = bucket_start + interval
+        low = high = balance
+        while i < len(entries) and _parse_ts(entries[i]["created_at"]) < bucket_end:
+            amount = float(entries[i]["amount"])
+            balance += amount if entries[i]["direction"] == "credit" else -amount
+            low = min(low, balance)
+            high = max(high, balance)
+            i += 1
+        points.append({"t": bucket_start.isoformat(), "balance": round(balance, 2), "low": round(low, 2), "high": round(high, 2)})
+    return points
+
+
+class BalanceHistory:
+    """Balance-over-time series for one wallet, downsampled on the server
+
+    Each point is one fixed-size bucket: the balance at the end of the bucket (bucketed last value)
+    plus the lowest and highest balance inside it, so short spikes survive downsampling.
+    Ranges of up to a week at sub-day resolution replay ledger entries; everything else is built
+    from wallet_daily_balances (one row per active day) and only the days that aren't rolled up
+    yet (today, and yesterday until shortly after midnight) are replayed.
+    """
+
+    def __init__(self, client: Callable[[], Any], ledger: Any):
+        # Callable so the client can be swapped/routed after import
+        self._client = client
+        self._ledger = ledger
+        self.available = True
+
+    def _entries(self, user_id: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            page = self._client().table("ledger_entries").select(
+                "seq, direction, amount, created_at"
+            ).eq("user_id", user_id).gte("created_at", start.isoformat()).lt(
+                "created_at", end.isoformat()
+            ).order("created_at").order("seq").range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
+
+    def _balance_before(self, user_id: str, moment: datetime) -> float:
+        return float(self._ledger.balance(user_id, (moment - timedelta(microseconds=1)).isoformat()) or 0.0)
+
+    def _intraday(self, user_id: str, start: datetime, end: datetime, interval: int) -> List[Dict[str, Any]]:
+        step = timedelta(seconds=interval)
+        # Align buckets to the interval grid so repeated requests share bucket boundaries
+        first = datetime.fromtimestamp(start.timestamp() // interval * interval, tz=timezone.utc)
+        starts = []
+        bucket_start = first
+        while bucket_start < end:
+            starts.append(bucket_start)
+            bucket_start += step
+        opening = self._balance_before(user_id, first)
+        return _bucket_entries(opening, self._entries(user_id, first, end), starts, step)
+
+    def _rollups(self, user_id: str, first_day: date, last_day: date) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            page = self._client().table("wallet_daily_balances").select(
+                "day, closing_balance, low_balance, high_balance"
+            ).eq("user_id", user_id).gte("day", first_day.isoformat()).lte(
+                "day", last_day.isoformat()
+            ).order("day").range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
+
+    def _daily(self, user_id: str, start: datetime, end: datetime, interval: int, now: datetime) -> List[Dict[str, Any]]:
+        db = self._client()
+        # Extend the rollups over any closed days since the last refresh (cheap when up to date)
+        db.rpc("refresh_daily_balances", {"p_user_id": user_id}).execute()
+
+        first_day = start.date()
+        last_day = (end - timedelta(microseconds=1)).date()
+        today = now.date()
+        open_day = (now - ROLLUP_GRACE).date()
+
+        # Open days are replayed even if the database has rolled them up, so never start from one
+        previous = db.table("wallet_daily_balances").select("closing_balance").eq("user_id", user_id).lt(
+            "day", min(first_day, open_day).isoformat()
+        ).order("day", desc=True).limit(1).execute().data or []
+        balance = float(previous[0]["closing_balance"]) if previous else 0.0
+
+        days: Dict[date, Dict[str, float]] = {}
+        if first_day < open_day:
+            for row in self._rollups(user_id, first_day, min(last_day, open_day - timedelta(days=1))):
+                days[date.fromisoformat(row["day"])] = {
+                    "balance": float(row["closing_balance"]),
+                    "low": float(row["low_balance"]),
+                    "high": float(row["high_balance"]),
+                }
+        if open_day <= last_day:
+            # Open days aren't rolled up yet: replay their entries from the last rolled-up balance
+            closed = [day for day in days if day < open_day]
+            carry = days[max(closed)]["balance"] if closed else balance
+            open_days = [open_day + timedelta(days=i) for i in range((min(last_day, today) - open_day).days + 1)]
+            replayed = _bucket_entries(
+                carry,
+                self._entries(user_id, _day_start(open_day), min(end, now)),
+                [_day_start(day) for day in open_days],
+                timedelta(days=1),
+            )
+            for day, point in zip(open_days, replayed):
+                if day < first_day:
+                    # Replayed only to carry the balance into the range
+                    balance = point["balance"]
+                else:
+                    days[day] = point
+
+        step = interval // DAY_SECONDS
+        points: List[Dict[str, Any]] = []
+        day = first_day
+        while day <= last_day:
+            bucket_start = day
+            low = high = None
+            for _ in range(step):
+                if day > last_day:
+                    break
+                rolled = days.get(day)
+                if rolled is not None:
+                    balance = rolled["balance"]
+                    low = rolled["low"] if low is None else min(low, rolled["low"])
+                    high = rolled["high"] if high is None else max(high, rolled["high"])
+                else:
+                    # No activity that day: the balance carries over
+                    low = balance if low is None else min(low, balance)
+                    high = balance if high is None else max(high, balance)
+                day += timedelta(days=1)
+            points.append({
+                "t": _day_start(bucket_start).isoformat(),
+                "balance": round(balance, 2),
+                "low": round(low, 2),
+                "high": round(high, 2),
+            })
+        return points
+
+    def series(
+        self, user_id: str, start: datetime, end: datetime, max_points: int, now: Optional[datetime] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Downsampled balance history over [start, end); None if the ledger or rollups aren't installed"""
+        now = now or datetime.now(timezone.utc)
+        end = min(end, now)
+        interval = pick_interval(start, end, max_points)
+        if interval >= DAY_SECONDS and not self.available:
+            return None
+        try:
+            if interval < DAY_SECONDS:
+                points, source = self._intraday(user_id, start, end, interval), "ledger"
+            else:
+                points, source = self._daily(user_id, start, end, interval, now), "rollups"
+        except Exception as e:
+            if _is_missing_rollups(e):
+                logger.warning("Balance history needs create_ledger_tables.sql and create_balance_rollups.sql")
+                if interval >= DAY_SECONDS:
+                    self.available = False
+                return None
+            raise
+        return {"interval_seconds": interval, "source": source, "points": points}
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """Collect items submitted within a few milliseconds and send them as one batch
+
+    `send_batch` receives the items in submission order and must return one result per
+    item, in the same order; a result that is an exception is raised to that item's caller
+    only. Batching is adaptive: while no batch is in flight, items go out on the next loop
+    iteration (no added latency when idle); under load they wait up to `max_wait` seconds
+    for company, and a full batch is sent immediately.
+    """
+
+    def __init__(
+        self,
+        send_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 50,
+        max_wait: float = 0.005,
+    ):
+        self._send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight = 0
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            delay = 0 if self._in_flight == 0 else self.max_wait
+            self._timer = loop.call_later(delay, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            # Skip callers that gave up (e.g. client disconnected) before the batch left
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        self._in_flight += 1
+        self.batches += 1
+        self.items += len(batch)
+        self.max_seen_batch = max(self.max_seen_batch, len(batch))
+        try:
+            results = await self._send_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} items")
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            self._in_flight -= 1
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "average_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size_seen": self.max_seen_batch,
+            "in_flight_batches": self._in_flight,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,66 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Merge concurrent identical calls into one execution whose result all callers share"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.requests = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        self.requests += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._inflight[key] = task
+            # Drop the key as soon as the upstream call finishes so later requests see fresh data
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        # Shield so one caller disconnecting doesn't cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    async def do_sync(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Like do(), but runs a blocking function in a worker thread"""
+        return await self.do(key, asyncio.to_thread, fn, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "coalescing_ratio": round(self.coalesced / self.requests, 4) if self.requests else 0.0,
+        }
+
+
+# Registry so the metrics endpoint can report every flight group
+_groups: Dict[str, SingleFlight] = {}
+
+
+def single_flight(name: str) -> SingleFlight:
+    """Get or create the named single-flight group"""
+    group = _groups.get(name)
+    if group is None:
+        group = SingleFlight(name)
+        _groups[name] = group
+    return group
+
+
+def coalescing_stats() -> Dict[str, Any]:
+    groups = [group.stats() for group in _groups.values()]
+    requests = sum(g["requests"] for g in groups)
+    coalesced = sum(g["coalesced"] for g in groups)
+    return {
+        "groups": groups,
+        "total_requests": requests,
+        "total_coalesced": coalesced,
+        "coalescing_ratio": round(coalesced / requests, 4) if requests else 0.0,
+    }
@@ -0,0 +1,142 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+ADMIN_SCOPE = "__admin__"
+
+
+class VersionTracker:
+    """Per-user data versions, bumped by anything that changes a user's balance or history
+
+    Every bump also moves the admin scope, whose views (all users / all transactions)
+    are affected by any transfer.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope: str) -> int:
+        return self._versions.get(scope, 0)
+
+    def bump(self, *user_ids: Optional[str]) -> None:
+        with self._lock:
+            for user_id in {u for u in user_ids if u}:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._versions[ADMIN_SCOPE] = self._versions.get(ADMIN_SCOPE, 0) + 1
+
+
+class _Entry:
+    __slots__ = ("version", "etag", "body", "encoded", "computed_at")
+
+    def __init__(self, version: int, etag: str, body: bytes):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.encoded: Dict[str, bytes] = {}
+        self.computed_at = time.monotonic()
+
+
+class ConditionalResponder:
+    """Serve JSON with strong ETags, 304s and cached gzip/brotli bodies
+
+    ETags are a hash of the body, so they are correct across workers. While the data
+    version hasn't moved (and the entry is younger than `revalidate_after` seconds, which
+    bounds staleness from changes made in other processes) the cached body and ETag are
+    reused without touching the database or re-serialising.
+    """
+
+    def __init__(self, versions: VersionTracker, revalidate_after: float = 5.0, min_compress_size: int = 1024, max_entries: int = 10000):
+        self.versions = versions
+        self.revalidate_after = revalidate_after
+        self.min_compress_size = min_compress_size
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, _Entry] = {}
+        self.not_modified = 0
+        self.cache_hits = 0
+        self.rendered = 0
+
+    async def respond(self, request: Request, key: Hashable, scope: str, build: Callable[[], Awaitable[Any]]) -> Response:
+        version = self.versions.get(scope)
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version or time.monotonic() - entry.computed_at > self.revalidate_after:
+            payload = await build()
+            body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode()
+            etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+            if entry is not None and entry.etag == etag:
+                # Same content: keep the compressed variants, just refresh the timestamps
+                entry.version = version
+                entry.computed_at = time.monotonic()
+            else:
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+                entry = _Entry(version, etag, body)
+                self._entries[key] = entry
+            self.rendered += 1
+        else:
+            self.cache_hits += 1
+
+        encoding = self._choose_encoding(request, len(entry.body))
+        etag = entry.etag if encoding is None else f'{entry.etag[:-1]}-{encoding}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding, Authorization"}
+
+        if self._matches(request.headers.get("if-none-match"), entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        if encoding is None:
+            return Response(content=entry.body, media_type="application/json", headers=headers)
+        body = entry.encoded.get(encoding)
+        if body is None:
+            body = brotli.compress(entry.body, quality=5) if encoding == "br" else gzip.compress(entry.body, compresslevel=6)
+            entry.encoded[encoding] = body
+        headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def _choose_encoding(self, request: Request, size: int) -> Optional[str]:
+        if size < self.min_compress_size:
+            return None
+        accepted = request.headers.get("accept-encoding", "")
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    @staticmethod
+    def _matches(if_none_match: Optional[str], etag: str) -> bool:
+        """True if any listed tag is this body's ETag (any encoding variant)"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        base = etag.strip('"')
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            tag = tag.strip('"')
+            if tag == base or tag.startswith(base + "-"):
+                return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "not_modified": self.not_modified,
+            "cache_hits": self.cache_hits,
+            "rendered": self.rendered,
+            "brotli_available": brotli is not None,
+        }
@@ -0,0 +1,47 @@
+-- Audit trail of admin actions (approvals, rule changes, Action Blocker start/stop)
+-- Run this in your Supabase SQL Editor
+
+CREATE TABLE IF NOT EXISTS public.audit_log (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    occurred_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    recorded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    actor_id UUID,
+    actor_email TEXT,
+    action TEXT NOT NULL,
+    target_type TEXT NOT NULL,
+    target_id TEXT,
+    before JSONB,
+    after JSONB
+);
+
+CREATE INDEX IF NOT EXISTS idx_audit_log_action ON public.audit_log(action, id DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_log_actor ON public.audit_log(actor_id, id DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_log_target ON public.audit_log(target_id, id DESC);
+
+-- Append-only: rows can be inserted and read, never changed or removed
+CREATE OR REPLACE FUNCTION public.audit_log_append_only()
+RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'audit_log is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS audit_log_no_update ON public.audit_log;
+CREATE TRIGGER audit_log_no_update
+    BEFORE UPDATE OR DELETE ON public.audit_log
+    FOR EACH ROW EXECUTE FUNCTION public.audit_log_append_only();
+
+DROP TRIGGER IF EXISTS audit_log_no_truncate ON public.audit_log;
+CREATE TRIGGER audit_log_no_truncate
+    BEFORE TRUNCATE ON public.audit_log
+    FOR EACH STATEMENT EXECUTE FUNCTION public.audit_log_append_only();
+
+ALTER TABLE public.audit_log ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role insert" ON public.audit_log;
+DROP POLICY IF EXISTS "Service role read" ON public.audit_log;
+
+CREATE POLICY "Service role insert" ON public.audit_log FOR INSERT WITH CHECK (true);
+CREATE POLICY "Service role read" ON public.audit_log FOR SELECT USING (true);
+
+NOTIFY pgrst, 'reload schema';
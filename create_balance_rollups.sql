@@ -0,0 +1,128 @@
+-- Daily balance rollups for balance-over-time charts
+-- Run this in your Supabase SQL Editor (after create_ledger_tables.sql)
+--
+-- One row per wallet per UTC day with activity: opening/closing balance, the day's low and high,
+-- and credit/debit totals. Rows are only written for closed days, so they never change once
+-- written; refresh_daily_balances() extends a wallet's rollups from its last rolled day, reading
+-- only the ledger entries written since then. A day counts as closed five minutes after midnight
+-- UTC, so transfers that started just before midnight have committed before it is rolled up.
+-- GET /api/balance/history serves long ranges from these rows and replays only the open days.
+
+-- ============================================
+-- 1. ROLLUP TABLE
+-- ============================================
+CREATE TABLE IF NOT EXISTS public.wallet_daily_balances (
+    user_id UUID NOT NULL,
+    day DATE NOT NULL,
+    opening_balance DECIMAL(15, 2) NOT NULL,
+    closing_balance DECIMAL(15, 2) NOT NULL,
+    low_balance DECIMAL(15, 2) NOT NULL,
+    high_balance DECIMAL(15, 2) NOT NULL,
+    credits DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    debits DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    entry_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+ALTER TABLE public.wallet_daily_balances ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role full access" ON public.wallet_daily_balances;
+DROP POLICY IF EXISTS "Users can view own daily balances" ON public.wallet_daily_balances;
+
+CREATE POLICY "Service role full access" ON public.wallet_daily_balances FOR ALL USING (true);
+CREATE POLICY "Users can view own daily balances" ON public.wallet_daily_balances
+    FOR SELECT USING (auth.uid() = user_id);
+
+-- ============================================
+-- 2. INCREMENTAL REFRESH
+-- ============================================
+-- Roll up every closed day since the wallet's last rollup; returns the number of days written.
+-- Entries are stamped with their transaction's start time, so a transfer that began at 23:59:59
+-- can commit after midnight with yesterday's date. Yesterday is only rolled up once that grace
+-- period has passed; a rolled-up day is never revisited.
+CREATE OR REPLACE FUNCTION public.refresh_daily_balances(p_user_id UUID)
+RETURNS INTEGER AS $$
+DECLARE
+    last_day DATE;
+    carry DECIMAL(15, 2) := 0;
+    -- Start of the oldest day that may still receive entries
+    open_start TIMESTAMP WITH TIME ZONE :=
+        date_trunc('day', (NOW() - INTERVAL '5 minutes') AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+    inserted INTEGER;
+BEGIN
+    -- Serialise concurrent refreshes of the same wallet
+    PERFORM pg_advisory_xact_lock(hashtext('wallet_daily_balances:' || p_user_id::text));
+
+    SELECT day, closing_balance INTO last_day, carry
+    FROM public.wallet_daily_balances
+    WHERE user_id = p_user_id
+    ORDER BY day DESC
+    LIMIT 1;
+
+    IF NOT FOUND THEN
+        last_day := NULL;
+        carry := 0;
+    END IF;
+
+    WITH entries AS (
+        SELECT
+            seq,
+            (created_at AT TIME ZONE 'UTC')::date AS day,
+            direction,
+            amount,
+            CASE WHEN direction = 'credit' THEN amount ELSE -amount END AS signed
+        FROM public.ledger_entries
+        WHERE user_id = p_user_id
+          AND (last_day IS NULL OR created_at >= (last_day + 1)::timestamp AT TIME ZONE 'UTC')
+          AND created_at < open_start
+    ),
+    running AS (
+        SELECT
+            day, direction, amount, signed,
+            carry + SUM(signed) OVER (ORDER BY day, seq) AS balance,
+            ROW_NUMBER() OVER (PARTITION BY day ORDER BY seq) AS first_rank,
+            ROW_NUMBER() OVER (PARTITION BY day ORDER BY seq DESC) AS last_rank
+        FROM entries
+    )
+    INSERT INTO public.wallet_daily_balances (
+        user_id, day, opening_balance, closing_balance, low_balance, high_balance, credits, debits, entry_count
+    )
+    SELECT
+        p_user_id,
+        day,
+        MAX(CASE WHEN first_rank = 1 THEN balance - signed END),
+        MAX(CASE WHEN last_rank = 1 THEN balance END),
+        MIN(LEAST(balance, balance - signed)),
+        MAX(GREATEST(balance, balance - signed)),
+        COALESCE(SUM(amount) FILTER (WHERE direction = 'credit'), 0),
+        COALESCE(SUM(amount) FILTER (WHERE direction = 'debit'), 0),
+        COUNT(*)
+    FROM running
+    GROUP BY day
+    ON CONFLICT DO NOTHING;
+
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Refresh every wallet with activity in the last two days.
+-- Optional: keep rollups warm nightly with pg_cron; the API refreshes on demand anyway.
+-- SELECT cron.schedule('daily-balances', '5 0 * * *', 'SELECT public.refresh_all_daily_balances()');
+CREATE OR REPLACE FUNCTION public.refresh_all_daily_balances()
+RETURNS INTEGER AS $$
+DECLARE
+    wallet RECORD;
+    total INTEGER := 0;
+BEGIN
+    FOR wallet IN
+        SELECT DISTINCT user_id FROM public.ledger_entries WHERE created_at >= NOW() - INTERVAL '2 days'
+    LOOP
+        total := total + public.refresh_daily_balances(wallet.user_id);
+    END LOOP;
+    RETURN total;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Make the new table and functions visible to the REST API
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,223 @@
+-- Append-only double-entry ledger with periodic balance snapshots
+-- Run this in your Supabase SQL Editor
+--
+-- Every completed transfer (a row in public.transactions, whoever inserts it) is recorded
+-- as an immutable debit/credit pair. A wallet's balance is its latest snapshot plus the
+-- small delta of entries written after it, so balances at any point in time are cheap.
+-- wallets.balance is kept as-is for the Action Blocker; the backend reads the ledger.
+--
+-- Note: this does not reduce write contention yet. Whatever executes a transfer (the Action
+-- Blocker) still updates wallets.balance, so every balance change still locks that row; the
+-- ledger only adds cheap, append-only history and point-in-time balances. Contention only
+-- drops once the Action Blocker stops updating wallets.balance and relies on the ledger.
+
+-- ============================================
+-- 1. LEDGER ENTRIES (append-only)
+-- ============================================
+CREATE TABLE IF NOT EXISTS public.ledger_entries (
+    seq BIGSERIAL PRIMARY KEY,
+    transaction_id UUID,
+    user_id UUID NOT NULL,
+    direction TEXT NOT NULL CHECK (direction IN ('debit', 'credit')),
+    amount DECIMAL(15, 2) NOT NULL CHECK (amount > 0),
+    entry_type TEXT NOT NULL DEFAULT 'transfer' CHECK (entry_type IN ('opening', 'transfer', 'adjustment')),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ledger_entries_user_seq ON public.ledger_entries(user_id, seq);
+CREATE INDEX IF NOT EXISTS idx_ledger_entries_user_created_at ON public.ledger_entries(user_id, created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ledger_entries_tx_direction
+    ON public.ledger_entries(transaction_id, direction) WHERE transaction_id IS NOT NULL;
+
+ALTER TABLE public.ledger_entries ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role full access" ON public.ledger_entries;
+DROP POLICY IF EXISTS "Users can view own ledger entries" ON public.ledger_entries;
+
+CREATE POLICY "Service role full access" ON public.ledger_entries FOR ALL USING (true);
+CREATE POLICY "Users can view own ledger entries" ON public.ledger_entries
+    FOR SELECT USING (auth.uid() = user_id);
+
+-- Entries are immutable: corrections are new 'adjustment' entries
+CREATE OR REPLACE FUNCTION public.ledger_entries_immutable()
+RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'ledger_entries is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ledger_entries_no_update ON public.ledger_entries;
+CREATE TRIGGER ledger_entries_no_update
+    BEFORE UPDATE OR DELETE ON public.ledger_entries
+    FOR EACH ROW
+    EXECUTE FUNCTION public.ledger_entries_immutable();
+
+-- ============================================
+-- 2. BALANCE SNAPSHOTS
+-- ============================================
+CREATE TABLE IF NOT EXISTS public.wallet_snapshots (
+    user_id UUID NOT NULL,
+    last_seq BIGINT NOT NULL,
+    balance DECIMAL(15, 2) NOT NULL,
+    as_of TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, last_seq)
+);
+
+CREATE INDEX IF NOT EXISTS idx_wallet_snapshots_user_as_of ON public.wallet_snapshots(user_id, as_of DESC);
+
+ALTER TABLE public.wallet_snapshots ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role full access" ON public.wallet_snapshots;
+CREATE POLICY "Service role full access" ON public.wallet_snapshots FOR ALL USING (true);
+
+-- ============================================
+-- 3. WRITE PATH: transfers and new wallets append entries
+-- ============================================
+CREATE OR REPLACE FUNCTION public.ledger_record_transfer()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO public.ledger_entries (transaction_id, user_id, direction, amount, created_at)
+    VALUES
+        (NEW.id, NEW.from_user_id, 'debit', NEW.amount, COALESCE(NEW.created_at, NOW())),
+        (NEW.id, NEW.to_user_id, 'credit', NEW.amount, COALESCE(NEW.created_at, NOW()))
+    ON CONFLICT DO NOTHING;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS ledger_on_transaction ON public.transactions;
+CREATE TRIGGER ledger_on_transaction
+    AFTER INSERT ON public.transactions
+    FOR EACH ROW
+    EXECUTE FUNCTION public.ledger_record_transfer();
+
+CREATE OR REPLACE FUNCTION public.ledger_record_opening()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.balance > 0 THEN
+        INSERT INTO public.ledger_entries (user_id, direction, amount, entry_type, created_at)
+        VALUES (NEW.user_id, 'credit', NEW.balance, 'opening', COALESCE(NEW.created_at, NOW()));
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS ledger_on_wallet_created ON public.wallets;
+CREATE TRIGGER ledger_on_wallet_created
+    AFTER INSERT ON public.wallets
+    FOR EACH ROW
+    EXECUTE FUNCTION public.ledger_record_opening();
+
+-- ============================================
+-- 4. READ PATH: snapshot + delta
+-- ============================================
+-- Returns NULL when the user has no ledger history at all
+CREATE OR REPLACE FUNCTION public.ledger_balance(p_user_id UUID, p_as_of TIMESTAMP WITH TIME ZONE DEFAULT NULL)
+RETURNS DECIMAL AS $$
+DECLARE
+    snap_seq BIGINT := 0;
+    snap_balance DECIMAL(15, 2) := 0;
+    has_snapshot BOOLEAN := FALSE;
+    delta DECIMAL(15, 2);
+    entry_count BIGINT;
+BEGIN
+    SELECT last_seq, balance, TRUE INTO snap_seq, snap_balance, has_snapshot
+    FROM public.wallet_snapshots
+    WHERE user_id = p_user_id AND (p_as_of IS NULL OR as_of <= p_as_of)
+    ORDER BY last_seq DESC
+    LIMIT 1;
+
+    IF NOT FOUND THEN
+        snap_seq := 0;
+        snap_balance := 0;
+        has_snapshot := FALSE;
+    END IF;
+
+    SELECT
+        COALESCE(SUM(CASE WHEN direction = 'credit' THEN amount ELSE -amount END), 0),
+        COUNT(*)
+    INTO delta, entry_count
+    FROM public.ledger_entries
+    WHERE user_id = p_user_id
+      AND seq > snap_seq
+      AND (p_as_of IS NULL OR created_at <= p_as_of);
+
+    IF NOT has_snapshot AND entry_count = 0 THEN
+        RETURN NULL;
+    END IF;
+    RETURN snap_balance + delta;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER;
+
+-- Snapshot every wallet that has settled entries since its last snapshot.
+-- Schedule it (e.g. pg_cron) or call POST /api/admin/ledger/snapshot.
+--
+-- seq values are handed out in allocation order, not commit order: while a transfer that
+-- drew seq 104 is still uncommitted, seq 105 may already be visible. A snapshot that moved
+-- last_seq past 104 would leave that entry below every later cutoff, and no balance would
+-- ever include it. So a snapshot only covers entries stamped before a one-minute settle
+-- horizon, and stops at the wallet's first entry stamped after it. This assumes no
+-- transfer transaction stays open for longer than the horizon.
+CREATE OR REPLACE FUNCTION public.take_wallet_snapshots()
+RETURNS INTEGER AS $$
+DECLARE
+    inserted INTEGER;
+    horizon TIMESTAMP WITH TIME ZONE := NOW() - INTERVAL '1 minute';
+BEGIN
+    WITH last_snap AS (
+        SELECT DISTINCT ON (user_id) user_id, last_seq, balance
+        FROM public.wallet_snapshots
+        ORDER BY user_id, last_seq DESC
+    ),
+    unsnapped AS (
+        SELECT
+            e.user_id,
+            e.seq,
+            e.created_at,
+            CASE WHEN e.direction = 'credit' THEN e.amount ELSE -e.amount END AS signed
+        FROM public.ledger_entries e
+        LEFT JOIN last_snap s ON s.user_id = e.user_id
+        WHERE e.seq > COALESCE(s.last_seq, 0)
+    ),
+    cutoffs AS (
+        -- First entry that may still have uncommitted neighbours below it
+        SELECT user_id, MIN(seq) FILTER (WHERE created_at >= horizon) AS first_unsettled
+        FROM unsnapped
+        GROUP BY user_id
+    ),
+    deltas AS (
+        SELECT u.user_id, MAX(u.seq) AS last_seq, SUM(u.signed) AS delta
+        FROM unsnapped u
+        JOIN cutoffs c ON c.user_id = u.user_id
+        WHERE c.first_unsettled IS NULL OR u.seq < c.first_unsettled
+        GROUP BY u.user_id
+    )
+    INSERT INTO public.wallet_snapshots (user_id, last_seq, balance, as_of)
+    -- as_of is the horizon: every entry the snapshot covers was stamped before it
+    SELECT d.user_id, d.last_seq, COALESCE(s.balance, 0) + d.delta, horizon
+    FROM deltas d
+    LEFT JOIN last_snap s ON s.user_id = d.user_id
+    ON CONFLICT DO NOTHING;
+
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Optional: hourly snapshots with pg_cron
+-- SELECT cron.schedule('wallet-snapshots', '0 * * * *', 'SELECT public.take_wallet_snapshots()');
+
+-- ============================================
+-- 5. BACKFILL EXISTING WALLETS
+-- ============================================
+-- Existing balances become opening entries; history before this point is not replayed
+INSERT INTO public.ledger_entries (user_id, direction, amount, entry_type)
+SELECT w.user_id, 'credit', w.balance, 'opening'
+FROM public.wallets w
+WHERE w.balance > 0
+  AND NOT EXISTS (SELECT 1 FROM public.ledger_entries e WHERE e.user_id = w.user_id);
+
+SELECT public.take_wallet_snapshots();
+
+-- Make the new tables and functions visible to the REST API
+NOTIFY pgrst, 'reload schema';
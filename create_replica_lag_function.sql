@@ -0,0 +1,18 @@
+-- Replication lag check for read-replica routing
+-- Run this in your Supabase SQL Editor on the primary (it replicates to the read replicas).
+-- The API samples it on the replica and reads from the primary while the lag is too high
+-- (REPLICA_MAX_LAG_SECONDS).
+
+CREATE OR REPLACE FUNCTION public.replica_lag_seconds()
+RETURNS DOUBLE PRECISION AS $$
+    SELECT CASE
+        -- On the primary there is no lag
+        WHEN NOT pg_is_in_recovery() THEN 0
+        -- Nothing left to replay: the replica is caught up, however old the last commit is
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::DOUBLE PRECISION;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- Make the function visible to the REST API
+NOTIFY pgrst, 'reload schema';
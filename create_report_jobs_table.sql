@@ -0,0 +1,35 @@
+-- Background job status (account statements and other reports)
+-- Run this in your Supabase SQL Editor
+-- Result files live in REPORTS_DIR, which must be storage shared by every API host/container
+
+CREATE TABLE IF NOT EXISTS public.report_jobs (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL,
+    job_type TEXT NOT NULL,
+    params JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status TEXT NOT NULL DEFAULT 'queued',
+    error TEXT,
+    result_path TEXT,
+    media_type TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+-- 'expired': the result file was deleted after REPORT_RETENTION_HOURS
+ALTER TABLE public.report_jobs DROP CONSTRAINT IF EXISTS report_jobs_status_check;
+ALTER TABLE public.report_jobs ADD CONSTRAINT report_jobs_status_check
+    CHECK (status IN ('queued', 'running', 'completed', 'failed', 'expired'));
+
+CREATE INDEX IF NOT EXISTS idx_report_jobs_user_created_at ON public.report_jobs(user_id, created_at DESC);
+
+ALTER TABLE public.report_jobs ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role full access" ON public.report_jobs;
+DROP POLICY IF EXISTS "Users can view own jobs" ON public.report_jobs;
+
+CREATE POLICY "Service role full access" ON public.report_jobs FOR ALL USING (true);
+CREATE POLICY "Users can view own jobs" ON public.report_jobs
+    FOR SELECT USING (auth.uid() = user_id);
+
+NOTIFY pgrst, 'reload schema';
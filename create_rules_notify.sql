@@ -0,0 +1,96 @@
+-- Rules versioning and change notification
+-- Run this in your Supabase SQL Editor so every API worker reports the same rules version
+-- and picks up rule changes within RULES_VERSION_CHECK_SECONDS (the Action Blocker can LISTEN
+-- rules_changed instead of polling; the API itself does not listen)
+--
+-- rules_version is bumped by a trigger on every write to transaction_rules, whoever makes it
+-- (the admin API, the SQL editor, a migration). Workers compare their cached copy against it
+-- with one tiny query, at most every few seconds, and only re-read transaction_rules when it moved.
+-- update_transaction_rule() merges config changes in the database, so concurrent admin edits to
+-- different keys of the same rule don't overwrite each other.
+
+CREATE TABLE IF NOT EXISTS public.rules_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+INSERT INTO public.rules_version (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+ALTER TABLE public.rules_version ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role full access" ON public.rules_version;
+CREATE POLICY "Service role full access" ON public.rules_version FOR ALL USING (true);
+
+CREATE OR REPLACE FUNCTION public.current_rules_version()
+RETURNS BIGINT AS $$
+    SELECT version FROM public.rules_version WHERE id;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION public.bump_rules_version()
+RETURNS TRIGGER AS $$
+DECLARE
+    new_version BIGINT;
+BEGIN
+    UPDATE public.rules_version SET version = version + 1, updated_at = NOW()
+    WHERE id
+    RETURNING version INTO new_version;
+
+    PERFORM pg_notify('rules_changed', json_build_object('version', new_version)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS transaction_rules_version ON public.transaction_rules;
+CREATE TRIGGER transaction_rules_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.transaction_rules
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.bump_rules_version();
+
+-- Update one rule in a single round-trip: the config patch is merged into the stored config
+-- (not replaced), and the result carries the rules version after the write.
+-- Returns NULL if the rule doesn't exist; 'previous' holds the enabled flag and config before the write.
+CREATE OR REPLACE FUNCTION public.update_transaction_rule(
+    p_rule_id TEXT,
+    p_enabled BOOLEAN DEFAULT NULL,
+    p_config JSONB DEFAULT NULL
+)
+RETURNS JSON AS $$
+DECLARE
+    previous RECORD;
+    updated RECORD;
+BEGIN
+    -- rule_id is compared as text so this works whatever type the Action Blocker gave it
+    SELECT enabled, rule_config INTO previous
+    FROM public.transaction_rules
+    WHERE rule_id::text = p_rule_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE public.transaction_rules
+    SET enabled = COALESCE(p_enabled, enabled),
+        rule_config = CASE
+            WHEN p_config IS NULL THEN rule_config
+            ELSE COALESCE(rule_config::text, '{}')::jsonb || p_config
+        END,
+        updated_at = NOW()
+    WHERE rule_id::text = p_rule_id
+    RETURNING * INTO updated;
+
+    -- The statement trigger has already bumped rules_version
+    RETURN json_build_object(
+        'rule', row_to_json(updated),
+        'previous', row_to_json(previous),
+        'version', public.current_rules_version()
+    );
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Superseded by the trigger above
+DROP FUNCTION IF EXISTS public.notify_rules_changed(INTEGER, TEXT);
+
+-- Make the table and functions visible to the REST API
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,12 @@
+-- Case-insensitive recipient lookup for transfers
+-- Run this in your Supabase SQL Editor
+
+-- Normalised copy of the email, kept in sync by Postgres
+ALTER TABLE public.users
+    ADD COLUMN IF NOT EXISTS email_normalized TEXT GENERATED ALWAYS AS (lower(btrim(email))) STORED;
+
+-- Functional unique index: one account per address regardless of casing
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_normalized ON public.users(email_normalized);
+
+-- Make the new column visible to the REST API
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,138 @@
+-- Structured, indexed violations on pending_transactions
+-- Run this in your Supabase SQL Editor (after partition_transactions.sql, if you use it)
+--
+-- violations becomes JSONB (an array of messages or {"code", "message"} objects) and every row
+-- gets violation_codes, a TEXT[] of normalised codes kept up to date by a trigger, so admin
+-- filters like "all transfers blocked by an Action Blocker timeout" run in the database:
+--   /pending_transactions?violation_codes=cs.{action_blocker_timeout}&amount=gte.500
+-- Writers that still send a JSON-encoded string are normalised by the same trigger.
+
+-- ============================================
+-- 1. CODE NORMALISATION
+-- ============================================
+CREATE OR REPLACE FUNCTION public.violation_code(p_violation JSONB)
+RETURNS TEXT AS $$
+DECLARE
+    message TEXT;
+BEGIN
+    IF jsonb_typeof(p_violation) = 'object' THEN
+        IF COALESCE(p_violation->>'code', p_violation->>'rule_id') IS NOT NULL THEN
+            RETURN lower(COALESCE(p_violation->>'code', p_violation->>'rule_id'));
+        END IF;
+        message := p_violation->>'message';
+    ELSE
+        message := p_violation #>> '{}';
+    END IF;
+
+    IF message IS NULL OR btrim(message) = '' THEN
+        RETURN NULL;
+    END IF;
+    -- Fallback-path messages written by the backend when the Action Blocker can't be used
+    IF message ILIKE 'Action Blocker Service timeout%' THEN
+        RETURN 'action_blocker_timeout';
+    ELSIF message ILIKE 'Action Blocker Service not reachable%' THEN
+        RETURN 'action_blocker_unreachable';
+    ELSIF message ILIKE 'Action Blocker Service error%' THEN
+        RETURN 'action_blocker_error';
+    END IF;
+    -- Anything else: slug of the text before the first ':' ("Daily limit exceeded: 5000" -> daily_limit_exceeded)
+    RETURN left(btrim(lower(regexp_replace(split_part(message, ':', 1), '[^A-Za-z0-9]+', '_', 'g')), '_'), 64);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION public.violation_codes(p_violations JSONB)
+RETURNS TEXT[] AS $$
+    SELECT COALESCE(array_agg(DISTINCT code ORDER BY code), '{}')
+    FROM (
+        SELECT public.violation_code(v) AS code
+        FROM jsonb_array_elements(
+            CASE WHEN jsonb_typeof(p_violations) = 'array' THEN p_violations ELSE '[]'::jsonb END
+        ) AS v
+    ) codes
+    WHERE code IS NOT NULL;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Legacy TEXT values: JSON where possible, otherwise a one-message array
+CREATE OR REPLACE FUNCTION public.violations_to_jsonb(p_violations TEXT)
+RETURNS JSONB AS $$
+BEGIN
+    IF p_violations IS NULL OR btrim(p_violations) = '' THEN
+        RETURN '[]'::jsonb;
+    END IF;
+    RETURN p_violations::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN jsonb_build_array(p_violations);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- ============================================
+-- 2. COLUMNS (live table and, if present, the archive tier)
+-- ============================================
+DO $$
+DECLARE
+    target RECORD;
+BEGIN
+    FOR target IN
+        SELECT table_schema, table_name, data_type
+        FROM information_schema.columns
+        WHERE table_name = 'pending_transactions'
+          AND column_name = 'violations'
+          AND table_schema IN ('public', 'archive')
+    LOOP
+        IF target.data_type <> 'jsonb' THEN
+            EXECUTE format(
+                'ALTER TABLE %I.%I ALTER COLUMN violations TYPE JSONB USING public.violations_to_jsonb(violations::text)',
+                target.table_schema, target.table_name
+            );
+        END IF;
+        EXECUTE format(
+            'ALTER TABLE %I.%I ADD COLUMN IF NOT EXISTS violation_codes TEXT[] NOT NULL DEFAULT ''{}''',
+            target.table_schema, target.table_name
+        );
+    END LOOP;
+END $$;
+
+-- ============================================
+-- 3. KEEP violation_codes IN SYNC
+-- ============================================
+CREATE OR REPLACE FUNCTION public.pending_transactions_violation_codes()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- A JSON-encoded string (json.dumps on the client) becomes the array it encodes
+    IF jsonb_typeof(NEW.violations) = 'string' THEN
+        NEW.violations := public.violations_to_jsonb(NEW.violations #>> '{}');
+    END IF;
+    NEW.violation_codes := public.violation_codes(NEW.violations);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS pending_transactions_violation_codes ON public.pending_transactions;
+CREATE TRIGGER pending_transactions_violation_codes
+    BEFORE INSERT OR UPDATE OF violations ON public.pending_transactions
+    FOR EACH ROW
+    EXECUTE FUNCTION public.pending_transactions_violation_codes();
+
+-- Backfill existing rows
+UPDATE public.pending_transactions
+SET violations = CASE WHEN jsonb_typeof(violations) = 'string'
+                      THEN public.violations_to_jsonb(violations #>> '{}')
+                      ELSE violations END
+WHERE violations IS NOT NULL;
+
+UPDATE public.pending_transactions
+SET violation_codes = public.violation_codes(violations)
+WHERE violation_codes IS DISTINCT FROM public.violation_codes(violations);
+
+-- ============================================
+-- 4. INDEXES (cascade to every partition)
+-- ============================================
+-- Containment filters: violation_codes @> '{action_blocker_timeout}'
+CREATE INDEX IF NOT EXISTS idx_pending_transactions_violation_codes
+    ON public.pending_transactions USING GIN (violation_codes);
+
+-- Review queue and amount-range filters
+CREATE INDEX IF NOT EXISTS idx_pending_transactions_status_amount
+    ON public.pending_transactions(status, amount);
+
+NOTIFY pgrst, 'reload schema';
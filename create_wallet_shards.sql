@@ -0,0 +1,203 @@
+-- Sharded sub-balances for hot wallets (merchant / payout accounts)
+-- Run this in your Supabase SQL Editor
+--
+-- A designated hot wallet keeps part of its balance in N rows of wallet_shards. Credits land on
+-- whichever shard isn't locked, so thousands of concurrent credits no longer queue on the single
+-- wallets row. Debits draw from a shard with enough funds, then from the wallets row, and as a
+-- last resort consolidate every shard into the wallets row first.
+--
+--   balance(user) = wallets.balance + SUM(wallet_shards.balance)
+--
+-- Regular wallets are untouched: the functions below fall through to a plain wallets update.
+-- Whatever executes transfers (the Action Blocker) should call wallet_transfer() instead of
+-- updating wallets directly, so hot wallets are credited through their shards.
+
+-- ============================================
+-- 1. TABLES
+-- ============================================
+CREATE TABLE IF NOT EXISTS public.hot_wallets (
+    user_id UUID PRIMARY KEY,
+    shard_count INTEGER NOT NULL CHECK (shard_count BETWEEN 2 AND 64),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS public.wallet_shards (
+    user_id UUID NOT NULL,
+    shard INTEGER NOT NULL,
+    balance DECIMAL(15, 2) NOT NULL DEFAULT 0 CHECK (balance >= 0),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, shard)
+);
+
+ALTER TABLE public.hot_wallets ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.wallet_shards ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role full access" ON public.hot_wallets;
+DROP POLICY IF EXISTS "Service role full access" ON public.wallet_shards;
+DROP POLICY IF EXISTS "Users can view own shards" ON public.wallet_shards;
+
+CREATE POLICY "Service role full access" ON public.hot_wallets FOR ALL USING (true);
+CREATE POLICY "Service role full access" ON public.wallet_shards FOR ALL USING (true);
+CREATE POLICY "Users can view own shards" ON public.wallet_shards
+    FOR SELECT USING (auth.uid() = user_id);
+
+-- ============================================
+-- 2. BALANCE MOVEMENTS
+-- ============================================
+CREATE OR REPLACE FUNCTION public.wallet_total_balance(p_user_id UUID)
+RETURNS DECIMAL AS $$
+    SELECT (SELECT balance FROM public.wallets WHERE user_id = p_user_id)
+         + COALESCE((SELECT SUM(balance) FROM public.wallet_shards WHERE user_id = p_user_id), 0);
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION public.wallet_credit(p_user_id UUID, p_amount DECIMAL)
+RETURNS VOID AS $$
+DECLARE
+    target INTEGER;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM public.hot_wallets WHERE user_id = p_user_id) THEN
+        UPDATE public.wallets SET balance = balance + p_amount, updated_at = NOW() WHERE user_id = p_user_id;
+        RETURN;
+    END IF;
+
+    -- Any shard nobody else is writing right now
+    SELECT shard INTO target
+    FROM public.wallet_shards
+    WHERE user_id = p_user_id
+    ORDER BY random()
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED;
+
+    IF target IS NULL THEN
+        -- Every shard is busy: queue on a random one
+        SELECT shard INTO target FROM public.wallet_shards WHERE user_id = p_user_id ORDER BY random() LIMIT 1;
+    END IF;
+
+    UPDATE public.wallet_shards SET balance = balance + p_amount, updated_at = NOW()
+    WHERE user_id = p_user_id AND shard = target;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Move every shard's balance into the wallets row (locks all shards, in order)
+CREATE OR REPLACE FUNCTION public.consolidate_wallet_shards(p_user_id UUID)
+RETURNS DECIMAL AS $$
+DECLARE
+    moved DECIMAL(15, 2);
+BEGIN
+    PERFORM 1 FROM public.wallets WHERE user_id = p_user_id FOR UPDATE;
+    PERFORM 1 FROM public.wallet_shards WHERE user_id = p_user_id ORDER BY shard FOR UPDATE;
+
+    SELECT COALESCE(SUM(balance), 0) INTO moved FROM public.wallet_shards WHERE user_id = p_user_id;
+    IF moved > 0 THEN
+        UPDATE public.wallet_shards SET balance = 0, updated_at = NOW() WHERE user_id = p_user_id AND balance <> 0;
+        UPDATE public.wallets SET balance = balance + moved, updated_at = NOW() WHERE user_id = p_user_id;
+    END IF;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Returns FALSE (and changes nothing) when the wallet doesn't hold p_amount
+CREATE OR REPLACE FUNCTION public.wallet_debit(p_user_id UUID, p_amount DECIMAL)
+RETURNS BOOLEAN AS $$
+DECLARE
+    source INTEGER;
+BEGIN
+    IF EXISTS (SELECT 1 FROM public.hot_wallets WHERE user_id = p_user_id) THEN
+        -- 1. A free shard that covers the whole amount
+        SELECT shard INTO source
+        FROM public.wallet_shards
+        WHERE user_id = p_user_id AND balance >= p_amount
+        ORDER BY balance DESC
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED;
+
+        IF source IS NOT NULL THEN
+            UPDATE public.wallet_shards SET balance = balance - p_amount, updated_at = NOW()
+            WHERE user_id = p_user_id AND shard = source;
+            RETURN TRUE;
+        END IF;
+    END IF;
+
+    -- 2. The wallets row (the only option for regular wallets)
+    UPDATE public.wallets SET balance = balance - p_amount, updated_at = NOW()
+    WHERE user_id = p_user_id AND balance >= p_amount;
+    IF FOUND THEN
+        RETURN TRUE;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM public.hot_wallets WHERE user_id = p_user_id) THEN
+        RETURN FALSE;
+    END IF;
+
+    -- 3. Funds are spread over several shards: consolidate, then try the wallets row again
+    PERFORM public.consolidate_wallet_shards(p_user_id);
+    UPDATE public.wallets SET balance = balance - p_amount, updated_at = NOW()
+    WHERE user_id = p_user_id AND balance >= p_amount;
+    RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Debit, credit and record the transfer atomically; NULL when funds are insufficient.
+-- The transactions insert fires the ledger trigger (create_ledger_tables.sql) as usual.
+CREATE OR REPLACE FUNCTION public.wallet_transfer(p_from_user_id UUID, p_to_user_id UUID, p_amount DECIMAL)
+RETURNS UUID AS $$
+DECLARE
+    tx_id UUID;
+BEGIN
+    IF p_amount <= 0 THEN
+        RAISE EXCEPTION 'amount must be positive';
+    END IF;
+    IF NOT public.wallet_debit(p_from_user_id, p_amount) THEN
+        RETURN NULL;
+    END IF;
+    PERFORM public.wallet_credit(p_to_user_id, p_amount);
+
+    INSERT INTO public.transactions (from_user_id, to_user_id, amount)
+    VALUES (p_from_user_id, p_to_user_id, p_amount)
+    RETURNING id INTO tx_id;
+    RETURN tx_id;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- ============================================
+-- 3. DESIGNATING HOT WALLETS
+-- ============================================
+CREATE OR REPLACE FUNCTION public.enable_wallet_sharding(p_user_id UUID, p_shards INTEGER DEFAULT 16)
+RETURNS INTEGER AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM public.wallets WHERE user_id = p_user_id) THEN
+        RAISE EXCEPTION 'wallet % does not exist', p_user_id;
+    END IF;
+
+    -- Shrinking: fold the shards that go away back into the wallets row first
+    IF EXISTS (SELECT 1 FROM public.wallet_shards WHERE user_id = p_user_id AND shard >= p_shards) THEN
+        PERFORM public.consolidate_wallet_shards(p_user_id);
+        DELETE FROM public.wallet_shards WHERE user_id = p_user_id AND shard >= p_shards;
+    END IF;
+
+    INSERT INTO public.hot_wallets (user_id, shard_count)
+    VALUES (p_user_id, p_shards)
+    ON CONFLICT (user_id) DO UPDATE SET shard_count = EXCLUDED.shard_count;
+
+    INSERT INTO public.wallet_shards (user_id, shard)
+    SELECT p_user_id, s FROM generate_series(0, p_shards - 1) AS s
+    ON CONFLICT DO NOTHING;
+
+    RETURN p_shards;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION public.disable_wallet_sharding(p_user_id UUID)
+RETURNS DECIMAL AS $$
+DECLARE
+    moved DECIMAL(15, 2);
+BEGIN
+    moved := public.consolidate_wallet_shards(p_user_id);
+    DELETE FROM public.hot_wallets WHERE user_id = p_user_id;
+    DELETE FROM public.wallet_shards WHERE user_id = p_user_id;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Make the new tables and functions visible to the REST API
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,143 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app_logging import get_logger
+
+logger = get_logger("db_routing")
+
+# Consistency hints for reads
+PRIMARY = "primary"                     # always the primary (e.g. balance checks before a transfer)
+READ_YOUR_WRITES = "read_your_writes"   # primary for a while after this user wrote, replica otherwise
+EVENTUAL = "eventual"                   # replica whenever it is healthy and not lagging
+
+
+def _is_missing_function(e: Exception) -> bool:
+    return "Could not find the function" in str(e) or "PGRST202" in str(e)
+
+
+class DatabaseRouter:
+    """Route reads between the primary and a read replica; writes always go to the primary
+
+    The replica is skipped while its replication lag (replica_lag_seconds(), see
+    create_replica_lag_function.sql, sampled at most every `lag_check_interval` seconds)
+    exceeds `max_lag_seconds`, and for `error_cooldown` seconds after a failed read, which
+    is retried on the primary. Recent writes are tracked per user in this process only, so
+    `read_your_writes_window` should comfortably exceed the replica's normal lag.
+    """
+
+    def __init__(
+        self,
+        primary: Callable[[], Any],
+        replica: Optional[Callable[[], Any]] = None,
+        max_lag_seconds: float = 5.0,
+        read_your_writes_window: float = 10.0,
+        lag_check_interval: float = 5.0,
+        error_cooldown: float = 30.0,
+    ):
+        # Callables so the clients can be swapped after import
+        self._primary = primary
+        self._replica = replica
+        self.max_lag_seconds = max_lag_seconds
+        self.read_your_writes_window = read_your_writes_window
+        self.lag_check_interval = lag_check_interval
+        self.error_cooldown = error_cooldown
+        self._recent_writes: Dict[str, float] = {}
+        self._lag: Optional[float] = None
+        self._lag_checked_at = 0.0
+        self._lag_supported = True
+        self._lag_lock = threading.Lock()
+        self._replica_down_until = 0.0
+        self.primary_reads = 0
+        self.replica_reads = 0
+        self.fallbacks = 0
+
+    @property
+    def has_replica(self) -> bool:
+        return self._replica is not None
+
+    def writer(self) -> Any:
+        return self._primary()
+
+    def note_write(self, *user_ids: Optional[str]) -> None:
+        """Record that these users' data just changed (their reads go to the primary for a while)"""
+        now = time.monotonic()
+        for user_id in user_ids:
+            if user_id:
+                self._recent_writes[user_id] = now
+        if len(self._recent_writes) > 10000:
+            cutoff = now - self.read_your_writes_window
+            self._recent_writes = {u: t for u, t in self._recent_writes.items() if t > cutoff}
+
+    def _replica_usable(self, consistency: str, user_id: Optional[str]) -> bool:
+        if self._replica is None or consistency == PRIMARY:
+            return False
+        now = time.monotonic()
+        if now < self._replica_down_until:
+            return False
+        if consistency == READ_YOUR_WRITES and user_id:
+            wrote_at = self._recent_writes.get(user_id)
+            if wrote_at is not None and now - wrote_at < self.read_your_writes_window:
+                return False
+        lag = self._replica_lag()
+        return lag is None or lag <= self.max_lag_seconds
+
+    def _replica_lag(self) -> Optional[float]:
+        """Last sampled lag in seconds (None if unknown); one thread refreshes it when stale"""
+        if not self._lag_supported:
+            return None
+        if time.monotonic() - self._lag_checked_at < self.lag_check_interval or not self._lag_lock.acquire(blocking=False):
+            return self._lag
+        try:
+            result = self._replica().rpc("replica_lag_seconds", {}).execute()
+            self._lag = float(result.data or 0.0)
+        except Exception as e:
+            if _is_missing_function(e):
+                logger.warning("replica_lag_seconds() is not installed on the replica, lag is not checked. Run create_replica_lag_function.sql.")
+                self._lag_supported = False
+                self._lag = None
+            else:
+                logger.warning("Replica lag check failed, reading from the primary: %s", e)
+                self._replica_down_until = time.monotonic() + self.error_cooldown
+                # Unknown lag is treated as too much: this read goes to the primary as well
+                self._lag = float("inf")
+        finally:
+            self._lag_checked_at = time.monotonic()
+            self._lag_lock.release()
+        return self._lag
+
+    def reader(self, consistency: str = EVENTUAL, user_id: Optional[str] = None) -> Any:
+        """Client to read from for this consistency hint"""
+        if self._replica_usable(consistency, user_id):
+            self.replica_reads += 1
+            return self._replica()
+        self.primary_reads += 1
+        return self._primary()
+
+    def run_read(self, fn: Callable[[Any], Any], consistency: str = EVENTUAL, user_id: Optional[str] = None) -> Any:
+        """Run fn(client) on the chosen client; a failed replica read is retried on the primary"""
+        if not self._replica_usable(consistency, user_id):
+            self.primary_reads += 1
+            return fn(self._primary())
+        self.replica_reads += 1
+        try:
+            return fn(self._replica())
+        except Exception as e:
+            logger.warning("Replica read failed, retrying on the primary: %s", e)
+            self.fallbacks += 1
+            self._replica_down_until = time.monotonic() + self.error_cooldown
+            self.primary_reads += 1
+            return fn(self._primary())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "replica_configured": self._replica is not None,
+            "replica_lag_seconds": self._lag,
+            "replica_available": self._replica is not None and time.monotonic() >= self._replica_down_until,
+            "primary_reads": self.primary_reads,
+            "replica_reads": self.replica_reads,
+            "fallbacks": self.fallbacks,
+            "users_pinned_to_primary": sum(
+                1 for t in self._recent_writes.values() if time.monotonic() - t < self.read_your_writes_window
+            ),
+        }
@@ -0,0 +1,29 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+# Look-back of the first query; anything older is fetched by at most one more
+HISTORY_RECENT_DAYS = int(os.getenv("HISTORY_RECENT_DAYS", "31"))
+
+
+def fetch_recent(
+    build_query: Callable[[], Any],
+    limit: int,
+    recent_days: Optional[int] = None,
+    column: str = "created_at",
+    now: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """Fetch the newest `limit` rows: the recent window first, then everything older in one query
+
+    The first query adds a created_at range, so on the monthly-partitioned tables
+    (partition_transactions.sql) Postgres only scans the last month or so and active users
+    are served from it. Only when it comes back short is a second, unbounded query made;
+    each partition's (user, created_at) index keeps that cheap for low-activity users.
+    """
+    now = now or datetime.now(timezone.utc)
+    lower = (now - timedelta(days=recent_days if recent_days is not None else HISTORY_RECENT_DAYS)).isoformat()
+    rows = build_query().gte(column, lower).order(column, desc=True).limit(limit).execute().data or []
+    if len(rows) >= limit:
+        return rows
+    older = build_query().lt(column, lower).order(column, desc=True).limit(limit - len(rows)).execute().data or []
+    return rows + older
@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app_logging import get_logger
+
+logger = get_logger("hot_wallets")
+
+
+def _is_missing_sharding(e: Exception) -> bool:
+    # Tables/functions come from create_wallet_shards.sql; without them every wallet is regular
+    message = str(e)
+    return (
+        "Could not find the function" in message
+        or "Could not find the table" in message
+        or "PGRST202" in message
+        or "PGRST205" in message
+    )
+
+
+class ShardedWallets:
+    """Hot wallets whose balance is split between the wallets row and N wallet_shards rows
+
+    The set of hot wallets is small and rarely changes, so it is cached for `ttl_seconds`;
+    reads for regular wallets never touch wallet_shards.
+    """
+
+    def __init__(self, client: Callable[[], Any], ttl_seconds: float = 30.0):
+        # Callable so the client can be swapped/routed after import
+        self._client = client
+        self.ttl_seconds = ttl_seconds
+        self.available = True
+        self._hot: Dict[str, int] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        try:
+            rows = self._client().table("hot_wallets").select("user_id, shard_count").execute().data or []
+        except Exception as e:
+            if _is_missing_sharding(e):
+                logger.info("Wallet sharding is not installed (create_wallet_shards.sql), all wallets are regular")
+                self.available = False
+                self._hot = {}
+                return
+            # Keep serving the last known set; retry after the next TTL
+            logger.error("Error loading hot wallets: %s", e)
+            self._loaded_at = time.monotonic()
+            return
+        self._hot = {row["user_id"]: row["shard_count"] for row in rows}
+        self._loaded_at = time.monotonic()
+
+    def hot_wallets(self) -> Dict[str, int]:
+        """user_id -> shard count for every designated hot wallet"""
+        if self.available and time.monotonic() - self._loaded_at > self.ttl_seconds:
+            with self._lock:
+                if self.available and time.monotonic() - self._loaded_at > self.ttl_seconds:
+                    self._refresh()
+        return self._hot
+
+    def is_hot(self, user_id: str) -> bool:
+        return user_id in self.hot_wallets()
+
+    def shard_totals(self, user_ids: Iterable[str], client: Optional[Any] = None) -> Dict[str, float]:
+        """Sum of shard balances for those of `user_ids` that are hot wallets
+
+        Pass `client` to read the shards from the same database as the rest of the caller's
+        reads (e.g. the replica chosen by the read router).
+        """
+        hot = self.hot_wallets()
+        wanted: List[str] = [user_id for user_id in set(user_ids) if user_id in hot]
+        if not wanted:
+            return {}
+        rows = (client or self._client()).table("wallet_shards").select("user_id, balance").in_("user_id", wanted).execute().data or []
+        totals: Dict[str, float] = {user_id: 0.0 for user_id in wanted}
+        for row in rows:
+            totals[row["user_id"]] += float(row["balance"])
+        return totals
+
+    def shard_total(self, user_id: str) -> float:
+        return self.shard_totals([user_id]).get(user_id, 0.0)
+
+    def shards(self, user_id: str) -> List[Dict[str, Any]]:
+        result = self._client().table("wallet_shards").select("shard, balance, updated_at").eq(
+            "user_id", user_id
+        ).order("shard").execute()
+        return result.data or []
+
+    def enable(self, user_id: str, shards: int) -> int:
+        result = self._client().rpc("enable_wallet_sharding", {"p_user_id": user_id, "p_shards": shards}).execute()
+        self._loaded_at = 0.0
+        return int(result.data)
+
+    def disable(self, user_id: str) -> float:
+        """Fold the shards back into the wallets row; returns the amount moved"""
+        result = self._client().rpc("disable_wallet_sharding", {"p_user_id": user_id}).execute()
+        self._loaded_at = 0.0
+        return float(result.data or 0)
+
+    def consolidate(self, user_id: str) -> float:
+        result = self._client().rpc("consolidate_wallet_shards", {"p_user_id": user_id}).execute()
+        return float(result.data or 0)
@@ -0,0 +1,237 @@
+import asyncio
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app_logging import get_logger
+
+logger = get_logger("jobs")
+
+# A job handler returns (content, file extension, media type)
+JobHandler = Callable[[Dict[str, Any], "JobRunner"], Awaitable[Tuple[bytes, str, str]]]
+
+
+class JobsUnavailable(Exception):
+    """Raised by submit() where work can't outlive the request (serverless deployments)"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobStore:
+    """Job status in the report_jobs table (create_report_jobs_table.sql), mirrored in memory
+
+    If the table doesn't exist jobs still run; their status just isn't visible to other workers.
+    """
+
+    def __init__(self, client: Callable[[], Any]):
+        self._client = client
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self.persistent = True
+
+    def _write(self, fn):
+        if not self.persistent:
+            return
+        try:
+            fn(self._client().table("report_jobs")).execute()
+        except Exception as e:
+            if "Could not find the table" in str(e) or "PGRST205" in str(e):
+                logger.warning("report_jobs table does not exist, job status is kept in memory only")
+                self.persistent = False
+            else:
+                logger.error("Error persisting job status: %s", e)
+
+    def create(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["id"]] = job
+        self._write(lambda t: t.insert(job))
+
+    def update(self, job_id: str, **fields) -> None:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+        self._write(lambda t: t.update(fields).eq("id", job_id))
+
+    def expire(self, before: datetime) -> None:
+        """Mark jobs completed before `before` as expired (their files are deleted) and forget old jobs"""
+        cutoff = before.isoformat()
+        for job_id, job in list(self._jobs.items()):
+            if job["status"] == "completed" and (job.get("finished_at") or "") < cutoff:
+                job.update(status="expired", result_path=None)
+            if job["status"] in ("failed", "expired") and (job.get("finished_at") or "") < cutoff:
+                del self._jobs[job_id]
+        self._write(
+            lambda t: t.update({"status": "expired", "result_path": None}).eq("status", "completed").lt("finished_at", cutoff)
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is not None or not self.persistent:
+            return job
+        try:
+            result = self._client().table("report_jobs").select("*").eq("id", job_id).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error("Error reading job status: %s", e)
+            return None
+
+
+class JobRunner:
+    """In-process job queue drained by a pool of worker tasks
+
+    I/O-bound steps run on the event loop / thread pool; CPU-bound rendering goes to a
+    process pool (run_cpu) so heavy reports never compete with interactive requests.
+    Jobs need a long-running server (`python main.py`): with `background=False` (e.g. on
+    Vercel, where tasks don't survive the response) submit() raises JobsUnavailable.
+    Results are files in `results_dir`, deleted (and their jobs marked expired) after
+    `retention_seconds`; with several hosts or containers it must be shared storage.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        results_dir: str,
+        workers: int = 2,
+        process_workers: int = 2,
+        max_queue: int = 100,
+        background: bool = True,
+        retention_seconds: float = 24 * 3600,
+    ):
+        self.background = background
+        self.retention_seconds = retention_seconds
+        self.store = store
+        self.results_dir = results_dir
+        self.workers = workers
+        self.process_workers = process_workers
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._max_queue = max_queue
+        self._tasks = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def register(self, job_type: str, handler: JobHandler) -> None:
+        self._handlers[job_type] = handler
+
+    async def start(self) -> None:
+        if self._tasks or not self.background:
+            return
+        os.makedirs(self.results_dir, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self._max_queue)
+        if self.process_workers > 0:
+            try:
+                # spawn: don't fork a process that is running the logging/tracing threads
+                self._pool = ProcessPoolExecutor(self.process_workers, mp_context=multiprocessing.get_context("spawn"))
+            except (OSError, NotImplementedError, ImportError) as e:
+                # No multiprocessing semaphores (some sandboxes/serverless runtimes): render in a thread
+                logger.warning("Process pool unavailable, CPU-bound job steps run in a thread: %s", e)
+                self._pool = None
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def submit(self, user_id: str, job_type: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a job; raises asyncio.QueueFull when the runner is saturated"""
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        if not self.background:
+            raise JobsUnavailable("Background jobs need the long-running server (python main.py)")
+        await self.start()
+        job = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "job_type": job_type,
+            "params": params,
+            "status": "queued",
+            "error": None,
+            "result_path": None,
+            "media_type": None,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        if self._queue.full():
+            raise asyncio.QueueFull()
+        await asyncio.to_thread(self.store.create, job)
+        self._queue.put_nowait(job)
+        return job
+
+    async def run_cpu(self, fn: Callable[..., Any], *args) -> Any:
+        """Run a CPU-bound, picklable function in the process pool (or a thread if disabled)"""
+        if self._pool is None:
+            return await asyncio.to_thread(fn, *args)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        except BrokenProcessPool as e:
+            # Workers couldn't start or died: carry on in threads rather than failing every job
+            logger.warning("Process pool broke, CPU-bound job steps now run in a thread: %s", e)
+            self._pool = None
+            return await asyncio.to_thread(fn, *args)
+
+    async def _sweeper(self) -> None:
+        # Every worker process sweeps; deleting a file another one already removed is harmless
+        interval = min(3600.0, self.retention_seconds)
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error("Error removing expired job results: %s", e)
+            await asyncio.sleep(interval)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Delete result files older than the retention period; returns how many were removed"""
+        now = time.time() if now is None else now
+        cutoff = now - self.retention_seconds
+        removed = 0
+        with os.scandir(self.results_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        self.store.expire(datetime.fromtimestamp(cutoff, timezone.utc))
+        return removed
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.store.update, job["id"], status="running", started_at=_now())
+        try:
+            content, extension, media_type = await self._handlers[job["job_type"]](job, self)
+            path = os.path.join(self.results_dir, f"{job['id']}.{extension}")
+            await asyncio.to_thread(_write_file, path, content)
+            await asyncio.to_thread(
+                self.store.update, job["id"],
+                status="completed", result_path=path, media_type=media_type, finished_at=_now()
+            )
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.store.update, job["id"], status="failed", error="Server shut down", finished_at=_now())
+            raise
+        except Exception as e:
+            logger.exception("Job failed", extra={"job_id": job["id"], "job_type": job["job_type"]})
+            await asyncio.to_thread(self.store.update, job["id"], status="failed", error=str(e), finished_at=_now())
+
+
+def _write_file(path: str, content: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(content)
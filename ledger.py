@@ -0,0 +1,60 @@
+from typing import Any, Callable, Dict, List, Optional
+
+from app_logging import get_logger
+
+logger = get_logger("ledger")
+
+
+def _is_missing_ledger(e: Exception) -> bool:
+    # Ledger functions/tables come from create_ledger_tables.sql; fall back if not installed
+    message = str(e)
+    return (
+        "Could not find the function" in message
+        or "Could not find the table" in message
+        or "PGRST202" in message
+        or "PGRST205" in message
+    )
+
+
+class Ledger:
+    """Read/write access to the append-only ledger (see create_ledger_tables.sql)
+
+    Balances are computed in the database as latest snapshot + delta, so a read touches
+    one snapshot row and the handful of entries written after it.
+    """
+
+    def __init__(self, client: Callable[[], Any]):
+        # Callable so the client can be swapped/routed after import
+        self._client = client
+        self.available = True
+
+    def balance(self, user_id: str, as_of: Optional[str] = None) -> Optional[float]:
+        """Balance from the ledger, or None if the ledger isn't installed or has no history for the user"""
+        if not self.available:
+            return None
+        params: Dict[str, Any] = {"p_user_id": user_id}
+        if as_of:
+            params["p_as_of"] = as_of
+        try:
+            result = self._client().rpc("ledger_balance", params).execute()
+        except Exception as e:
+            if _is_missing_ledger(e):
+                logger.warning("Ledger is not installed, reading wallets.balance. Run create_ledger_tables.sql.")
+                self.available = False
+                return None
+            raise
+        if result.data is None:
+            return None
+        return float(result.data)
+
+    def entries(self, user_id: str, after_seq: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Entries for a user in ledger order"""
+        result = self._client().table("ledger_entries").select(
+            "seq, transaction_id, direction, amount, entry_type, created_at"
+        ).eq("user_id", user_id).gt("seq", after_seq).order("seq").limit(limit).execute()
+        return result.data or []
+
+    def take_snapshots(self) -> int:
+        """Snapshot every wallet with entries newer than its last snapshot; returns rows written"""
+        result = self._client().rpc("take_wallet_snapshots", {}).execute()
+        return int(result.data or 0)
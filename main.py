@@ -1,35 +1,94 @@
 from fastapi import FastAPI, HTTPException, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, FileResponse
 from pydantic import BaseModel, EmailStr, field_validator
 from typing import Optional, List, Dict, Any
+from contextlib import asynccontextmanager
 from supabase import create_client, Client
 import os
 import sys
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import httpx
 import json
+import asyncio
+import secrets
+import tempfile
+from coalescing import single_flight, coalescing_stats
+from rules_cache import RulesCache
+from recipients import RecipientResolver, LookupBudget, normalize_email
+from ledger import Ledger
+from history import fetch_recent
+from app_logging import configure_logging, shutdown_logging, get_logger, logging_stats
+from jobs import JobRunner, JobStore, JobsUnavailable
+from batching import MicroBatcher
+from statements import fetch_statement_data, build_statement_rows, render_statement, statement_header, month_range
+from tracing import configure_tracing, shutdown_tracing, span, inject_headers, current_traceparent, TracingMiddleware
+from conditional import VersionTracker, ConditionalResponder, ADMIN_SCOPE
+from db_routing import DatabaseRouter, READ_YOUR_WRITES
+from risk import fetch_risk_context, score_transactions
+from reconciliation import reconcile
+from audit import AuditLog
+from hot_wallets import ShardedWallets
+from balance_history import BalanceHistory
 
 load_dotenv()
 
-app = FastAPI(title="Digital Wallet API")
+# Structured JSON logs, written by a background thread so log I/O stays off the request path
+configure_logging()
+logger = get_logger("api")
+
+# Distributed tracing (enabled by TRACE_EXPORT_FILE / TRACE_EXPORT_URL)
+configure_tracing()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup/shutdown hooks: own the shared HTTP pool and job runner
+
+    uvicorn only runs the shutdown half after it has stopped accepting connections and waited
+    (up to GRACEFUL_SHUTDOWN_TIMEOUT) for open requests, in-flight transfers included.
+    """
+    await open_http_client()
+    await job_runner.start()
+    audit_log.start()
+    maintenance = asyncio.create_task(_partition_maintenance())
+    try:
+        yield
+    finally:
+        maintenance.cancel()
+        await asyncio.gather(maintenance, return_exceptions=True)
+        await job_runner.stop()
+        await asyncio.to_thread(audit_log.shutdown)
+        await close_http_client()
+        shutdown_tracing()
+        shutdown_logging()
+
+
+app = FastAPI(title="Digital Wallet API", lifespan=lifespan)
 
 # Add validation error handler
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
-    print(f"Validation error: {exc.errors()}")
-    try:
-        body = await request.body()
-        print(f"Request body: {body.decode()}")
-    except:
-        pass
+    # Only field locations and error types: input values and the body may hold passwords
+    logger.info(
+        "Validation error",
+        extra={
+            "event": "validation_error",
+            "path": request.url.path,
+            "errors": [{"loc": err.get("loc"), "type": err.get("type")} for err in exc.errors()]
+        }
+    )
     return JSONResponse(
         status_code=422,
-        content={"detail": exc.errors()}
+        content={"detail": jsonable_encoder(exc.errors())}
     )
 
+# Server span per request; continues the caller's trace when a traceparent header is sent
+app.add_middleware(TracingMiddleware)
+
 # CORS middleware
 # Get allowed origins from environment or use defaults
 # Include localhost for development and Vercel domains for production
@@ -61,6 +120,33 @@ if not supabase_service_key:
 
 supabase: Client = create_client(supabase_url, supabase_service_key)
 
+# Optional read replica (its own Supabase API URL) for admin scans, history and reports;
+# writes and balance checks stay on the primary
+supabase_replica_url = os.getenv("SUPABASE_READ_REPLICA_URL", "").rstrip('/')
+supabase_replica: Optional[Client] = create_client(supabase_replica_url, supabase_service_key) if supabase_replica_url else None
+db_router = DatabaseRouter(
+    lambda: supabase,
+    (lambda: supabase_replica) if supabase_replica is not None else None,
+    max_lag_seconds=float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5")),
+    read_your_writes_window=float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+)
+
+# Append-only ledger: balances are read as latest snapshot + delta
+ledger = Ledger(lambda: supabase)
+
+# Hot (merchant/payout) wallets keep part of their balance in sharded sub-balance rows
+sharded_wallets = ShardedWallets(lambda: supabase, ttl_seconds=float(os.getenv("HOT_WALLET_CACHE_TTL", "30")))
+
+# Audit trail of admin actions, written in batches off the request path
+# Balance-over-time charts: daily rollups (create_balance_rollups.sql) + today's ledger entries
+balance_history = BalanceHistory(lambda: supabase, ledger)
+
+audit_log = AuditLog(
+    lambda: supabase,
+    max_batch=int(os.getenv("AUDIT_BATCH_SIZE", "100")),
+    interval=float(os.getenv("AUDIT_FLUSH_SECONDS", "1"))
+)
+
 # Backend URL configuration - read from environment variable
 # Priority: 1. back_url env var, 2. Vercel auto-detection, 3. localhost for dev
 BACK_URL = os.getenv("back_url", "").rstrip('/')
@@ -74,20 +160,85 @@ if not BACK_URL:
         # Fallback to localhost for local development
         BACK_URL = "http://localhost:8000"
 
+# Shared HTTP connection pool for Supabase auth and Action Blocker calls
+# (opened/closed by the lifespan hooks, created lazily if those don't run, e.g. on Vercel)
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+async def open_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=30.0,
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+            )
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+@asynccontextmanager
+async def http_client():
+    """Borrow the shared pooled client (it is not closed on exit)"""
+    yield await open_http_client()
+
+
+def _is_missing_email_normalized(e: Exception) -> bool:
+    # email_normalized comes from create_users_email_index.sql; older databases may not have it yet
+    return "email_normalized" in str(e) and ("does not exist" in str(e) or "42703" in str(e))
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
 # Helper function to get user by email from users table
 def get_user_by_email(email: str):
-    """Get user by email from users table"""
+    """Get user by email from users table (case-insensitive)"""
+    email = normalize_email(email)
     try:
-        result = supabase.table("users").select("id, email, full_name, created_at").eq("email", email).execute()
+        try:
+            result = supabase.table("users").select("id, email, full_name, created_at").eq("email_normalized", email).execute()
+        except Exception as e:
+            if not _is_missing_email_normalized(e):
+                raise
+            result = supabase.table("users").select("id, email, full_name, created_at").ilike("email", _escape_like(email)).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         return None
     except Exception as e:
-        print(f"Error getting user by email: {e}")
-        # If table doesn't exist, return None gracefully
+        # If table doesn't exist, return None gracefully; anything else is not a "not found"
+        # (the recipient cache would otherwise remember a transient error as a miss)
         if "Could not find the table" in str(e) or "PGRST205" in str(e):
-            print("WARNING: users table does not exist. Please run the SQL script to create it.")
-        return None
+            logger.warning("users table does not exist. Please run the SQL script to create it.")
+            return None
+        logger.error("Error getting user by email: %s", e)
+        raise
+
+
+def get_users_by_emails(emails: List[str]):
+    """Get users for several (normalised) emails in one query"""
+    try:
+        result = supabase.table("users").select("id, email, full_name, created_at").in_("email_normalized", emails).execute()
+        return result.data or []
+    except Exception as e:
+        if _is_missing_email_normalized(e):
+            # No functional index yet: fall back to one case-insensitive lookup per email
+            return [user for user in (get_user_by_email(email) for email in emails) if user]
+        if "Could not find the table" in str(e) or "PGRST205" in str(e):
+            return []
+        logger.error("Error getting users by email: %s", e)
+        raise
+
 
 # Helper function to get user by ID from users table
 def get_user_by_id(user_id: str):
@@ -98,13 +249,54 @@ def get_user_by_id(user_id: str):
             return result.data[0]
         return None
     except Exception as e:
-        print(f"Error getting user by ID: {e}")
+        logger.error("Error getting user by ID: %s", e)
         # If table doesn't exist, return None gracefully
         if "Could not find the table" in str(e) or "PGRST205" in str(e):
-            print("WARNING: users table does not exist. Please run the SQL script to create it.")
+            logger.warning("users table does not exist. Please run the SQL script to create it.")
         return None
 
 
+# Single-flight groups: identical concurrent reads (e.g. several open tabs) share one upstream call
+_token_flight = single_flight("verify_token")
+_user_flight = single_flight("get_user_by_id")
+_balance_flight = single_flight("get_balance")
+_balance_history_flight = single_flight("get_balance_history")
+_transactions_flight = single_flight("get_transactions")
+_rules_flight = single_flight("get_rules")
+
+# Rules cache revalidated against the database's rules version (create_rules_notify.sql)
+_rules_cache = RulesCache(
+    fallback_ttl_seconds=float(os.getenv("RULES_CACHE_TTL", "60")),
+    check_interval_seconds=float(os.getenv("RULES_VERSION_CHECK_SECONDS", "2"))
+)
+_rules_update_rpc = True
+
+
+# ETags / 304s / compression for balance and history reads; versions are bumped by transfers and approvals
+data_versions = VersionTracker()
+conditional_responder = ConditionalResponder(
+    data_versions,
+    revalidate_after=float(os.getenv("ETAG_REVALIDATE_SECONDS", "5")),
+    min_compress_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+)
+
+
+# Recipient lookups for transfers: cached hits, short-lived negative cache for unknown emails
+recipient_resolver = RecipientResolver(
+    get_user_by_email,
+    get_users_by_emails,
+    ttl_seconds=float(os.getenv("RECIPIENT_CACHE_TTL", "300")),
+    negative_ttl_seconds=float(os.getenv("RECIPIENT_NEGATIVE_CACHE_TTL", "30"))
+)
+# Emails a user may check through /api/recipients/resolve per minute
+_recipient_lookup_budget = LookupBudget(limit=int(os.getenv("RECIPIENT_LOOKUPS_PER_MINUTE", "100")))
+
+
+async def get_user_by_id_shared(user_id: str):
+    """Non-blocking get_user_by_id; concurrent lookups of the same user share one query"""
+    return await _user_flight.do_sync(user_id, get_user_by_id, user_id)
+
+
 # Pydantic models
 class SignUpRequest(BaseModel):
     email: str
@@ -172,6 +364,10 @@ class TransactionsResponse(BaseModel):
     transactions: List[TransactionResponse]
 
 
+class ResolveRecipientsRequest(BaseModel):
+    emails: List[str]
+
+
 class PendingTransactionResponse(BaseModel):
     id: str
     from_user_id: str
@@ -186,20 +382,57 @@ class PendingTransactionResponse(BaseModel):
     reviewed_by: Optional[str] = None
 
 
+class StatementRequest(BaseModel):
+    month: str  # YYYY-MM
+    format: str = "csv"
+    
+    @field_validator('month')
+    @classmethod
+    def validate_month(cls, v: str) -> str:
+        try:
+            datetime.strptime(v, "%Y-%m")
+        except ValueError:
+            raise ValueError('Month must be in YYYY-MM format')
+        return v
+    
+    @field_validator('format')
+    @classmethod
+    def validate_format(cls, v: str) -> str:
+        if v not in ("csv", "pdf"):
+            raise ValueError('Format must be csv or pdf')
+        return v
+
+
+class HotWalletRequest(BaseModel):
+    user_id: str
+    shards: int = 16
+    
+    @field_validator('shards')
+    @classmethod
+    def validate_shards(cls, v: int) -> int:
+        if not 2 <= v <= 64:
+            raise ValueError('Shards must be between 2 and 64')
+        return v
+
+
 class ApproveTransactionRequest(BaseModel):
     transaction_id: str
     approve: bool
 
 
-# Dependency to verify JWT token and get user from users table
-async def verify_token(authorization: str = Header(None)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
-    try:
-        token = authorization.replace("Bearer ", "")
-        # Verify token with Supabase using REST API
-        async with httpx.AsyncClient() as client:
+# Simple user object returned by verify_token
+class User:
+    def __init__(self, user_data):
+        self.id = user_data.get("id")
+        self.email = user_data.get("email")
+        self.full_name = user_data.get("full_name")
+
+
+async def _load_token_user(token: str):
+    """Verify token with Supabase and load the matching user"""
+    # Verify token with Supabase using REST API
+    with span("auth.verify_token", kind=3):
+        async with http_client() as client:
             response = await client.get(
                 f"{supabase_url}/auth/v1/user",
                 headers={
@@ -207,31 +440,36 @@ async def verify_token(authorization: str = Header(None)):
                     "Authorization": f"Bearer {token}"
                 }
             )
-            if response.status_code != 200:
-                raise HTTPException(status_code=401, detail="Invalid token")
-            auth_user_data = response.json()
-            user_id = auth_user_data.get("id")
-            auth_email = auth_user_data.get("email")
-            
-            # Try to get user from users table, but fallback to auth data if table doesn't exist
-            user_data = get_user_by_id(user_id)
-            if not user_data:
-                # If users table doesn't exist or user not found, use auth data
-                # This allows the system to work even if users table isn't set up yet
-                print(f"Warning: User {user_id} not found in users table, using auth data")
-                user_data = {
-                    "id": user_id,
-                    "email": auth_email,
-                    "full_name": None
-                }
-            
-            # Create a simple user object
-            class User:
-                def __init__(self, user_data):
-                    self.id = user_data.get("id")
-                    self.email = user_data.get("email")
-                    self.full_name = user_data.get("full_name")
-            return User(user_data)
+    if response.status_code != 200:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    auth_user_data = response.json()
+    user_id = auth_user_data.get("id")
+    auth_email = auth_user_data.get("email")
+
+    # Try to get user from users table, but fallback to auth data if table doesn't exist
+    with span("db.get_user_by_id"):
+        user_data = await get_user_by_id_shared(user_id)
+    if not user_data:
+        # If users table doesn't exist or user not found, use auth data
+        # This allows the system to work even if users table isn't set up yet
+        logger.info("User not found in users table, using auth data", extra={"event": "user_fallback", "user_id": user_id})
+        user_data = {
+            "id": user_id,
+            "email": auth_email,
+            "full_name": None
+        }
+    return User(user_data)
+
+
+# Dependency to verify JWT token and get user from users table
+async def verify_token(authorization: str = Header(None)):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header missing")
+    
+    try:
+        token = authorization.replace("Bearer ", "")
+        # Identical concurrent requests carry the same token, so verify it once for all of them
+        return await _token_flight.do(token, _load_token_user, token)
     except HTTPException:
         raise
     except Exception as e:
@@ -246,45 +484,87 @@ def read_root():
     }
 
 
+# Login/signup talk to the Supabase Auth REST API over the shared async pool instead of the
+# blocking supabase-py client, so login storms don't freeze the event loop. A bounded number
+# run at once; beyond AUTH_MAX_WAITING queued callers we shed load with a 503.
+_auth_slots = asyncio.Semaphore(int(os.getenv("AUTH_MAX_CONCURRENCY", "32")))
+_auth_max_waiting = int(os.getenv("AUTH_MAX_WAITING", "256"))
+_auth_waiting = 0
+
+
+async def _auth_request(path: str, payload: Dict[str, Any], admin: bool = False) -> Dict[str, Any]:
+    """POST to Supabase Auth and return the JSON body; raises Exception with Supabase's message on error"""
+    global _auth_waiting
+    if _auth_waiting >= _auth_max_waiting:
+        raise HTTPException(status_code=503, detail="Too many authentication requests, please retry")
+    headers = {"apikey": supabase_service_key}
+    if admin:
+        headers["Authorization"] = f"Bearer {supabase_service_key}"
+    _auth_waiting += 1
+    try:
+        await _auth_slots.acquire()
+    finally:
+        _auth_waiting -= 1
+    try:
+        async with http_client() as client:
+            with span(f"auth.{path.split('?')[0].strip('/').replace('/', '.')}", kind=3):
+                response = await client.post(f"{supabase_url}/auth/v1{path}", json=payload, headers=headers, timeout=15.0)
+    finally:
+        _auth_slots.release()
+    if response.status_code >= 400:
+        try:
+            body = response.json()
+            message = body.get("msg") or body.get("error_description") or body.get("message") or response.text
+            if body.get("error_code") == "email_exists":
+                message = f"{message} (already registered)"
+        except ValueError:
+            message = response.text
+        raise Exception(message)
+    return response.json()
+
+
 @app.post("/api/auth/signup", response_model=AuthResponse)
 async def signup(request: SignUpRequest):
     """Sign up a new user"""
     try:
         # Create user in Supabase Auth
-        auth_response = supabase.auth.admin.create_user({
+        created_user = await _auth_request("/admin/users", {
             "email": request.email,
             "password": request.password,
             "email_confirm": True,  # Auto-confirm email
             "user_metadata": {
                 "full_name": request.full_name or ""
             }
-        })
+        }, admin=True)
         
-        if not auth_response.user:
+        if not created_user.get("id"):
             raise HTTPException(status_code=400, detail="Failed to create user")
         
         # Get the session token
-        sign_in_response = supabase.auth.sign_in_with_password({
+        session = await _auth_request("/token?grant_type=password", {
             "email": request.email,
             "password": request.password
         })
         
-        if not sign_in_response.session:
+        if not session.get("access_token"):
             raise HTTPException(status_code=400, detail="Failed to create session")
         
-        # Get user profile to include created_at
-        user_profile = get_user_by_id(auth_response.user.id)
+        # Senders may have cached this address as unknown
+        recipient_resolver.invalidate(request.email)
         
+        # The created auth user already carries created_at, no profile lookup needed
         return {
-            "access_token": sign_in_response.session.access_token,
+            "access_token": session["access_token"],
             "user": {
-                "id": auth_response.user.id,
-                "email": auth_response.user.email,
+                "id": created_user["id"],
+                "email": created_user.get("email"),
                 "full_name": request.full_name,
-                "created_at": user_profile.get("created_at") if user_profile else None
+                "created_at": created_user.get("created_at")
             },
-            "expires_in": sign_in_response.session.expires_in
+            "expires_in": session.get("expires_in", 3600)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = str(e)
         if "already registered" in error_msg.lower() or "already exists" in error_msg.lower():
@@ -296,29 +576,33 @@ async def signup(request: SignUpRequest):
 async def login(request: LoginRequest):
     """Login user"""
     try:
-        print(f"Login attempt for email: {request.email}")
+        logger.info("Login attempt", extra={"event": "login_attempt", "email": request.email})
         # Sign in with Supabase
-        sign_in_response = supabase.auth.sign_in_with_password({
+        session = await _auth_request("/token?grant_type=password", {
             "email": str(request.email),
             "password": str(request.password)
         })
         
-        if not sign_in_response.session:
+        if not session.get("access_token"):
             raise HTTPException(status_code=401, detail="Invalid email or password")
         
-        user_data = sign_in_response.user
-        user_profile = get_user_by_id(user_data.id)
+        # full_name lives in user_metadata (it is what the users table trigger copies),
+        # so the token response has everything and we skip the profile query
+        user_data = session.get("user") or {}
+        user_metadata = user_data.get("user_metadata") or {}
         
         return {
-            "access_token": sign_in_response.session.access_token,
+            "access_token": session["access_token"],
             "user": {
-                "id": user_data.id,
-                "email": user_data.email,
-                "full_name": user_profile.get("full_name") if user_profile else None,
-                "created_at": user_profile.get("created_at") if user_profile else None
+                "id": user_data.get("id"),
+                "email": user_data.get("email"),
+                "full_name": user_metadata.get("full_name") or None,
+                "created_at": user_data.get("created_at")
             },
-            "expires_in": sign_in_response.session.expires_in
+            "expires_in": session.get("expires_in", 3600)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = str(e)
         if "invalid" in error_msg.lower() or "wrong" in error_msg.lower():
@@ -329,7 +613,7 @@ async def login(request: LoginRequest):
 @app.get("/api/auth/session")
 async def get_session(user=Depends(verify_token)):
     """Get current session/user info"""
-    user_profile = get_user_by_id(user.id)
+    user_profile = await get_user_by_id_shared(user.id)
     return {
         "user": {
             "id": user.id,
@@ -340,129 +624,289 @@ async def get_session(user=Depends(verify_token)):
     }
 
 
+def _load_balance(user_id: str) -> BalanceResponse:
+    """Read the user's balance (ledger snapshot + delta), creating the wallet on first use"""
+    balance = ledger.balance(user_id)
+    if balance is not None:
+        return BalanceResponse(balance=balance)
+    
+    # No ledger history (or ledger not installed): fall back to the wallets table
+    wallet = supabase.table("wallets").select("balance").eq("user_id", user_id).execute()
+    
+    if not wallet.data:
+        # Create wallet if it doesn't exist (the ledger records the opening credit)
+        supabase.table("wallets").insert({
+            "user_id": user_id,
+            "balance": 1000.0  # Starting balance
+        }).execute()
+        return BalanceResponse(balance=1000.0)
+    
+    # Hot wallets: the wallets row plus their sub-balance shards
+    balance = float(wallet.data[0]["balance"]) + sharded_wallets.shard_total(user_id)
+    return BalanceResponse(balance=balance)
+
+
+def _load_balance_as_of(user_id: str, as_of: str) -> BalanceResponse:
+    """Historical balance at a point in time, from the ledger"""
+    balance = ledger.balance(user_id, as_of=as_of)
+    if balance is None and not ledger.available:
+        raise HTTPException(status_code=501, detail="Historical balances require the ledger (create_ledger_tables.sql)")
+    return BalanceResponse(balance=balance or 0.0)
+
+
 @app.get("/api/balance", response_model=BalanceResponse)
-async def get_balance(user=Depends(verify_token)):
+async def get_balance(request: Request, user=Depends(verify_token), as_of: Optional[datetime] = None):
     try:
-        # Get user's wallet balance
-        wallet = supabase.table("wallets").select("balance").eq("user_id", user.id).execute()
-        
-        if not wallet.data:
-            # Create wallet if it doesn't exist
-            supabase.table("wallets").insert({
-                "user_id": user.id,
-                "balance": 1000.0  # Starting balance
-            }).execute()
-            return BalanceResponse(balance=1000.0)
-        
-        balance = wallet.data[0]["balance"]
-        return BalanceResponse(balance=balance)
+        if as_of is not None:
+            as_of_key = as_of.isoformat()
+            return await conditional_responder.respond(
+                request, ("balance", user.id, as_of_key), user.id,
+                lambda: _balance_flight.do_sync(
+                    (user.id, data_versions.get(user.id), as_of_key), _load_balance_as_of, user.id, as_of_key
+                )
+            )
+        # The data version is part of the single-flight key: a read that started before a
+        # transfer must not be shared with (and cached for) requests made after it
+        return await conditional_responder.respond(
+            request, ("balance", user.id), user.id,
+            lambda: _balance_flight.do_sync((user.id, data_versions.get(user.id)), _load_balance, user.id)
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error in get_balance: {str(e)}")
-        print(f"Traceback: {error_details}")
+        logger.exception("Error in get_balance")
         raise HTTPException(status_code=500, detail=f"Error fetching balance: {str(e)}")
 
 
-@app.get("/api/transactions", response_model=TransactionsResponse)
-async def get_transactions(user=Depends(verify_token)):
+def _load_balance_history(user_id: str, start: datetime, end: datetime, points: int, open_ended: bool = False) -> Dict[str, Any]:
+    series = balance_history.series(user_id, start, end, points)
+    if series is None:
+        raise HTTPException(
+            status_code=501,
+            detail="Balance history requires the ledger and daily rollups (create_ledger_tables.sql, create_balance_rollups.sql)"
+        )
+    # Report the bucket grid, not the wall clock: an open-ended range ends with the current bucket,
+    # so the body (and its ETag) only changes when a bucket does and chart polls get 304s
+    points = series["points"]
+    first = datetime.fromisoformat(points[0]["t"]) if points else start
+    step = timedelta(seconds=series["interval_seconds"])
+    now = datetime.now(timezone.utc)
+    if open_ended or end > now:
+        bucket_end = first + step * -(-(min(end, now) - first) // step)
+        end = bucket_end if open_ended else min(end, bucket_end)
+    return {"start": first.isoformat(), "end": end.isoformat(), **series}
+
+
+@app.get("/api/balance/history")
+async def get_balance_history(
+    request: Request,
+    user=Depends(verify_token),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = 200
+):
+    """Balance over [start, end) in at most `points` fixed-size buckets (default: the last 30 days)"""
+    if not 2 <= points <= 1000:
+        raise HTTPException(status_code=400, detail="points must be between 2 and 1000")
+    # Naive timestamps are UTC
+    range_end = (end if end.tzinfo else end.replace(tzinfo=timezone.utc)) if end else datetime.now(timezone.utc)
+    range_start = (start if start.tzinfo else start.replace(tzinfo=timezone.utc)) if start else range_end - timedelta(days=30)
+    if range_start >= range_end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if range_start > datetime.now(timezone.utc):
+        raise HTTPException(status_code=400, detail="start must not be in the future")
+    
+    key = (
+        "balance_history", user.id,
+        start.isoformat() if start else None, end.isoformat() if end else None, points
+    )
     try:
-        # Get all transactions where user is sender or receiver
-        transactions = supabase.table("transactions").select(
+        return await conditional_responder.respond(
+            request, key, user.id,
+            lambda: _balance_history_flight.do_sync(
+                (key, data_versions.get(user.id)), _load_balance_history, user.id, range_start, range_end, points, end is None
+            )
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in get_balance_history")
+        raise HTTPException(status_code=500, detail=f"Error fetching balance history: {str(e)}")
+
+
+def _load_transactions(db: Client, user_id: str, user_email: str) -> TransactionsResponse:
+    """Build the user's transaction history, including their pending transfers"""
+    # Get all transactions where user is sender or receiver (newest partitions first)
+    transactions = fetch_recent(
+        lambda: db.table("transactions").select(
             "id, from_user_id, to_user_id, amount, created_at"
         ).or_(
-            f"from_user_id.eq.{user.id},to_user_id.eq.{user.id}"
-        ).order("created_at", desc=True).limit(50).execute()
+            f"from_user_id.eq.{user_id},to_user_id.eq.{user_id}"
+        ),
+        limit=50
+    )
+    
+    # Get pending transactions for this user
+    pending_transactions = []
+    try:
+        pending_result = db.table("pending_transactions").select("*").eq(
+            "from_user_id", user_id
+        ).eq("status", "pending").order("created_at", desc=True).execute()
         
-        # Get pending transactions for this user
-        pending_transactions = []
+        if pending_result.data:
+            pending_transactions = pending_result.data
+    except:
+        pass  # If table doesn't exist, continue without pending
+    
+    # Get all unique user IDs from transactions (batch query instead of N queries)
+    all_user_ids = set()
+    if transactions:
+        for tx in transactions:
+            all_user_ids.add(tx["from_user_id"])
+            all_user_ids.add(tx["to_user_id"])
+    
+    # Batch fetch all user emails in one query
+    user_email_map = {}
+    if all_user_ids:
         try:
-            pending_result = supabase.table("pending_transactions").select("*").eq(
-                "from_user_id", user.id
-            ).eq("status", "pending").order("created_at", desc=True).execute()
-            
-            if pending_result.data:
-                pending_transactions = pending_result.data
+            users_batch = db.table("users").select("id, email").in_("id", list(all_user_ids)).execute()
+            user_email_map = {user["id"]: user["email"] for user in users_batch.data}
         except:
-            pass  # If table doesn't exist, continue without pending
-        
-        # Get all unique user IDs from transactions (batch query instead of N queries)
-        all_user_ids = set()
-        if transactions.data:
-            for tx in transactions.data:
-                all_user_ids.add(tx["from_user_id"])
-                all_user_ids.add(tx["to_user_id"])
-        
-        # Batch fetch all user emails in one query
-        user_email_map = {}
-        if all_user_ids:
-            try:
-                users_batch = supabase.table("users").select("id, email").in_("id", list(all_user_ids)).execute()
-                user_email_map = {user["id"]: user["email"] for user in users_batch.data}
-            except:
-                pass  # If table doesn't exist, continue without emails
-        
-        # Build transaction list with emails from map
-        transaction_list = []
-        if transactions.data:
-            for tx in transactions.data:
-                from_email = user_email_map.get(tx["from_user_id"])
-                to_email = user_email_map.get(tx["to_user_id"])
-                
-                transaction_list.append(TransactionResponse(
-                    id=tx["id"],
-                    from_user_id=tx["from_user_id"],
-                    to_user_id=tx["to_user_id"],
-                    amount=tx["amount"],
-                    created_at=tx["created_at"],
-                    from_user_email=from_email,
-                    to_user_email=to_email
-                ))
-        
-        # Add pending transactions (use same email map)
-        for pending_tx in pending_transactions:
-            # Add to_user_id to map if not already there
-            if pending_tx["to_user_id"] not in user_email_map:
-                try:
-                    to_user_data = get_user_by_id(pending_tx["to_user_id"])
-                    if to_user_data:
-                        user_email_map[pending_tx["to_user_id"]] = to_user_data.get("email")
-                except:
-                    pass
-            
-            to_email = user_email_map.get(pending_tx["to_user_id"])
+            pass  # If table doesn't exist, continue without emails
+    
+    # Build transaction list with emails from map
+    transaction_list = []
+    if transactions:
+        for tx in transactions:
+            from_email = user_email_map.get(tx["from_user_id"])
+            to_email = user_email_map.get(tx["to_user_id"])
             
-            # Create a transaction response with pending status indicator
             transaction_list.append(TransactionResponse(
-                id=f"pending_{pending_tx['id']}",  # Prefix to identify as pending
-                from_user_id=pending_tx["from_user_id"],
-                to_user_id=pending_tx["to_user_id"],
-                amount=float(pending_tx["amount"]),
-                created_at=pending_tx["created_at"],
-                from_user_email=user.email,  # Current user
+                id=tx["id"],
+                from_user_id=tx["from_user_id"],
+                to_user_id=tx["to_user_id"],
+                amount=tx["amount"],
+                created_at=tx["created_at"],
+                from_user_email=from_email,
                 to_user_email=to_email
             ))
+    
+    # Add pending transactions (use same email map)
+    for pending_tx in pending_transactions:
+        # Add to_user_id to map if not already there
+        if pending_tx["to_user_id"] not in user_email_map:
+            try:
+                to_user_data = get_user_by_id(pending_tx["to_user_id"])
+                if to_user_data:
+                    user_email_map[pending_tx["to_user_id"]] = to_user_data.get("email")
+            except:
+                pass
         
-        # Sort by created_at descending
-        transaction_list.sort(key=lambda x: x.created_at, reverse=True)
+        to_email = user_email_map.get(pending_tx["to_user_id"])
         
-        return TransactionsResponse(transactions=transaction_list)
+        # Create a transaction response with pending status indicator
+        transaction_list.append(TransactionResponse(
+            id=f"pending_{pending_tx['id']}",  # Prefix to identify as pending
+            from_user_id=pending_tx["from_user_id"],
+            to_user_id=pending_tx["to_user_id"],
+            amount=float(pending_tx["amount"]),
+            created_at=pending_tx["created_at"],
+            from_user_email=user_email,  # Current user
+            to_user_email=to_email
+        ))
+    
+    # Sort by created_at descending
+    transaction_list.sort(key=lambda x: x.created_at, reverse=True)
+    
+    return TransactionsResponse(transactions=transaction_list)
+
+
+@app.get("/api/transactions", response_model=TransactionsResponse)
+async def get_transactions(request: Request, user=Depends(verify_token)):
+    try:
+        return await conditional_responder.respond(
+            request, ("transactions", user.id), user.id,
+            lambda: _transactions_flight.do_sync(
+                (user.id, data_versions.get(user.id)), db_router.run_read, lambda db: _load_transactions(db, user.id, user.email), READ_YOUR_WRITES, user.id
+            )
+        )
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error in get_transactions: {str(e)}")
-        print(f"Traceback: {error_details}")
+        logger.exception("Error in get_transactions")
         raise HTTPException(status_code=500, detail=f"Error fetching transactions: {str(e)}")
 
 
+def _action_blocker_url() -> str:
+    return os.getenv("ACTION_BLOCKER_URL", "http://127.0.0.1:8001").rstrip('/')
+
+
+# Flipped off the first time the Action Blocker answers 404/405 on the batch endpoint
+_action_blocker_batch_supported = os.getenv("ACTION_BLOCKER_BATCHING", "true").lower() != "false"
+
+
+async def _process_transaction_single(payload: Dict[str, Any]) -> httpx.Response:
+    # Runs in whichever request flushed the batch: take the trace context from the transfer itself
+    payload = dict(payload)
+    traceparent = payload.pop("traceparent", None)
+    async with http_client() as client:
+        return await client.post(
+            f"{_action_blocker_url()}/api/process-transaction",
+            json=payload,
+            headers={"traceparent": traceparent} if traceparent else {},
+            timeout=30.0
+        )
+
+
+async def _process_transaction_batch(payloads: List[Dict[str, Any]]) -> List[Any]:
+    """Send transfers to the Action Blocker, one response (or exception) per transfer
+
+    Batch contract: POST /api/process-transactions-batch {"transactions": [...]} returns
+    {"results": [{"status_code": 200, "result": {...}} | {"status_code": 4xx, "error": "..."}]}
+    in the same order. A batch of one, or an Action Blocker without the batch endpoint,
+    uses /api/process-transaction per transfer.
+    Each transfer carries its own `traceparent`, and the batch span links to all of them.
+    """
+    global _action_blocker_batch_supported
+    if len(payloads) > 1 and _action_blocker_batch_supported:
+        with span("action_blocker.process_transactions_batch", kind=3, links=[p.get("traceparent") for p in payloads],
+                  batch_size=len(payloads)):
+            async with http_client() as client:
+                response = await client.post(
+                    f"{_action_blocker_url()}/api/process-transactions-batch",
+                    json={"transactions": payloads},
+                    headers=inject_headers(),
+                    timeout=30.0
+                )
+        if response.status_code in (404, 405):
+            logger.warning("Action Blocker has no batch endpoint, sending transfers individually")
+            _action_blocker_batch_supported = False
+        elif response.status_code != 200:
+            return [response] * len(payloads)
+        else:
+            return [
+                httpx.Response(item.get("status_code", 200), json=item["result"])
+                if item.get("status_code", 200) == 200
+                else httpx.Response(item["status_code"], text=str(item.get("error", "")))
+                for item in response.json()["results"]
+            ]
+    return await asyncio.gather(*(_process_transaction_single(p) for p in payloads), return_exceptions=True)
+
+
+action_blocker_batcher = MicroBatcher(
+    _process_transaction_batch,
+    max_batch_size=int(os.getenv("ACTION_BLOCKER_BATCH_SIZE", "50")),
+    max_wait=float(os.getenv("ACTION_BLOCKER_BATCH_WAIT_MS", "5")) / 1000
+)
+
+
 @app.post("/api/transfer")
 async def transfer_money(request: TransferRequest, user=Depends(verify_token)):
     try:
         if request.amount <= 0:
             raise HTTPException(status_code=400, detail="Amount must be greater than 0")
         
-        # Get recipient user by email from users table
-        recipient_user = get_user_by_email(request.recipient_email)
+        # Resolve recipient by (case-normalised) email, usually from cache
+        with span("recipient.resolve"):
+            recipient_user = await recipient_resolver.resolve_async(request.recipient_email)
         
         if not recipient_user:
             raise HTTPException(status_code=404, detail="Recipient not found")
@@ -471,21 +915,16 @@ async def transfer_money(request: TransferRequest, user=Depends(verify_token)):
         if recipient_user_id == user.id:
             raise HTTPException(status_code=400, detail="Cannot transfer to yourself")
         
-        # Get sender's wallet
-        sender_wallet = supabase.table("wallets").select("balance").eq("user_id", user.id).execute()
-        if not sender_wallet.data:
-            # Create wallet if it doesn't exist
-            supabase.table("wallets").insert({
-                "user_id": user.id,
-                "balance": 1000.0
-            }).execute()
-            sender_balance = 1000.0
-        else:
-            sender_balance = sender_wallet.data[0]["balance"]
+        # Get sender's balance through the ledger (creates the wallet if it doesn't exist)
+        with span("wallet.read_balance"):
+            sender_balance = (await asyncio.to_thread(_load_balance, user.id)).balance
         
         if sender_balance < request.amount:
             raise HTTPException(status_code=400, detail="Insufficient balance")
         
+        # Version of the rules this transfer is checked against (no database call while recently checked)
+        await get_cached_rules()
+        
         # Action Blocker acts as adapter - decides auto-approve or flag for review
         # All transaction processing goes through Action Blocker
         action_blocker_url = os.getenv("ACTION_BLOCKER_URL", "http://127.0.0.1:8001")
@@ -497,33 +936,34 @@ async def transfer_money(request: TransferRequest, user=Depends(verify_token)):
             # - Check rules
             # - If no violations → Auto-approve and execute immediately
             # - If violations → Flag for admin review
-            async with httpx.AsyncClient(follow_redirects=True, timeout=30.0) as client:
-                process_response = await client.post(
-                    f"{action_blocker_url_clean}/api/process-transaction",
-                    json={
-                        "from_user_id": user.id,
-                        "to_user_id": recipient_user_id,
-                        "amount": request.amount,
-                        "sender_balance": sender_balance
-                    },
-                    timeout=30.0
+            # Concurrent transfers are micro-batched into one Action Blocker call
+            with span("action_blocker.process_transaction", kind=3, **{"http.url": f"{action_blocker_url_clean}/api/process-transaction"}):
+                process_response = await action_blocker_batcher.submit({
+                    "from_user_id": user.id,
+                    "to_user_id": recipient_user_id,
+                    "amount": request.amount,
+                    "sender_balance": sender_balance,
+                    # Lets the Action Blocker detect stale rules without polling
+                    "rules_version": _rules_cache.version,
+                    # Batches are sent from another request's context; keep this transfer's trace
+                    "traceparent": current_traceparent()
+                })
+            
+            if process_response.status_code == 200:
+                result = process_response.json()
+                logger.info("Action Blocker processed transaction", extra={"event": "transfer_processed", "status": result.get("status")})
+                return result
+            else:
+                error_msg = process_response.text
+                logger.error("Action Blocker error", extra={"status_code": process_response.status_code, "error": error_msg})
+                raise HTTPException(
+                    status_code=process_response.status_code,
+                    detail=f"Action Blocker Service error: {error_msg}"
                 )
-                
-                if process_response.status_code == 200:
-                    result = process_response.json()
-                    print(f"✅ Action Blocker processed transaction: {result.get('status')}")
-                    return result
-                else:
-                    error_msg = process_response.text
-                    print(f"❌ Action Blocker error: {process_response.status_code} - {error_msg}")
-                    raise HTTPException(
-                        status_code=process_response.status_code,
-                        detail=f"Action Blocker Service error: {error_msg}"
-                    )
                     
         except httpx.TimeoutException:
             error_msg = "Action Blocker Service timeout - transaction blocked for safety"
-            print(f"❌ {error_msg}")
+            logger.error(error_msg)
             # Block transaction for safety when service is down
             try:
                 pending_tx = supabase.table("pending_transactions").insert({
@@ -531,7 +971,7 @@ async def transfer_money(request: TransferRequest, user=Depends(verify_token)):
                     "to_user_id": recipient_user_id,
                     "amount": request.amount,
                     "status": "pending",
-                    "violations": json.dumps(["Action Blocker Service timeout - blocked for safety"])
+                    "violations": ["Action Blocker Service timeout - blocked for safety"]
                 }).execute()
                 return {
                     "message": "Transaction blocked - Action Blocker Service timeout",
@@ -544,7 +984,7 @@ async def transfer_money(request: TransferRequest, user=Depends(verify_token)):
                 raise HTTPException(status_code=503, detail=error_msg)
         except httpx.ConnectError:
             error_msg = "Action Blocker Service is not reachable - transaction blocked for safety"
-            print(f"❌ {error_msg}")
+            logger.error(error_msg)
             # Block transaction for safety when service is down
             try:
                 pending_tx = supabase.table("pending_transactions").insert({
@@ -552,7 +992,7 @@ async def transfer_money(request: TransferRequest, user=Depends(verify_token)):
                     "to_user_id": recipient_user_id,
                     "amount": request.amount,
                     "status": "pending",
-                    "violations": json.dumps(["Action Blocker Service not reachable - blocked for safety"])
+                    "violations": ["Action Blocker Service not reachable - blocked for safety"]
                 }).execute()
                 return {
                     "message": "Transaction blocked - Action Blocker Service not reachable",
@@ -567,7 +1007,7 @@ async def transfer_money(request: TransferRequest, user=Depends(verify_token)):
             raise
         except Exception as e:
             error_msg = f"Error calling Action Blocker Service: {str(e)}"
-            print(f"❌ {error_msg}")
+            logger.error(error_msg)
             # Block transaction for safety on any error
             try:
                 pending_tx = supabase.table("pending_transactions").insert({
@@ -575,7 +1015,7 @@ async def transfer_money(request: TransferRequest, user=Depends(verify_token)):
                     "to_user_id": recipient_user_id,
                     "amount": request.amount,
                     "status": "pending",
-                    "violations": json.dumps([f"Action Blocker Service error: {str(e)}"])
+                    "violations": [f"Action Blocker Service error: {str(e)}"]
                 }).execute()
                 return {
                     "message": "Transaction blocked - Action Blocker Service error",
@@ -586,219 +1026,458 @@ async def transfer_money(request: TransferRequest, user=Depends(verify_token)):
                 }
             except:
                 raise HTTPException(status_code=500, detail=error_msg)
+        finally:
+            # Whatever the outcome, both parties' cached balance/history views are now stale
+            data_versions.bump(user.id, recipient_user_id)
+            db_router.note_write(user.id, recipient_user_id)
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error in transfer_money: {str(e)}")
-        print(f"Traceback: {error_details}")
+        logger.exception("Error in transfer_money")
         raise HTTPException(status_code=500, detail=f"Transfer failed: {str(e)}")
 
 
+@app.post("/api/recipients/resolve")
+async def resolve_recipients(request: ResolveRecipientsRequest, user=Depends(verify_token)):
+    """Check which of a list of recipient emails can receive transfers (e.g. to validate a payee list)"""
+    if len(request.emails) > 50:
+        raise HTTPException(status_code=400, detail="At most 50 emails per request")
+    emails = {normalize_email(email) for email in request.emails}
+    if not _recipient_lookup_budget.take(user.id, len(emails)):
+        raise HTTPException(status_code=429, detail="Too many recipient lookups, please retry later")
+    
+    resolved = await asyncio.to_thread(recipient_resolver.resolve_many, emails)
+    # Existence only: ids and names are never handed out for arbitrary emails
+    return {"recipients": {email: found is not None for email, found in resolved.items()}}
+
+
+# Background jobs: heavy reports run outside the request, rendering on a process pool
+job_runner = JobRunner(
+    JobStore(lambda: supabase),
+    results_dir=os.getenv("REPORTS_DIR", os.path.join(tempfile.gettempdir(), "wallet-reports")),
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    process_workers=int(os.getenv("JOB_PROCESS_WORKERS", "2")),
+    # Vercel functions end with the response, taking queued jobs with them
+    background=not os.getenv("VERCEL"),
+    retention_seconds=float(os.getenv("REPORT_RETENTION_HOURS", "24")) * 3600
+)
+
+
+async def _statement_job(job: Dict[str, Any], runner: JobRunner):
+    """Monthly statement for one user from transactions and pending_transactions"""
+    user_id = job["user_id"]
+    month = job["params"]["month"]
+    fmt = job["params"]["format"]
+    
+    data = await asyncio.to_thread(
+        db_router.run_read, lambda db: fetch_statement_data(db, user_id, month), READ_YOUR_WRITES, user_id
+    )
+    start, end = month_range(month)
+    opening = await asyncio.to_thread(ledger.balance, user_id, (start - timedelta(microseconds=1)).isoformat())
+    closing = await asyncio.to_thread(ledger.balance, user_id, (end - timedelta(microseconds=1)).isoformat())
+    
+    rows = build_statement_rows(user_id, data)
+    header = statement_header(data["emails"].get(user_id, user_id), month, opening, closing)
+    content = await runner.run_cpu(render_statement, fmt, header, rows)
+    return content, fmt, "application/pdf" if fmt == "pdf" else "text/csv"
+
+
+job_runner.register("statement", _statement_job)
+
+
+async def _reconciliation_job(job: Dict[str, Any], runner: JobRunner):
+    """Wallets vs. transaction history; scans the replica when configured, confirms on the primary"""
+    report = await asyncio.to_thread(
+        reconcile, db_router.reader(), supabase, int(os.getenv("RECONCILE_WORKERS", "4"))
+    )
+    logger.info(
+        "Reconciliation finished",
+        extra={
+            "event": "reconciliation",
+            "transactions_scanned": report["transactions_scanned"],
+            "discrepancies": len(report["discrepancies"]),
+        }
+    )
+    return json.dumps(report, indent=2).encode(), "json", "application/json"
+
+
+job_runner.register("reconciliation", _reconciliation_job)
+
+
+async def _partition_maintenance():
+    """Keep monthly partitions of transactions/pending_transactions ahead of time (partition_transactions.sql)
+
+    Runs at startup and then every PARTITION_MAINTENANCE_HOURS, so inserts keep landing in
+    their month even where pg_cron isn't enabled. Stops if the tables aren't partitioned.
+    """
+    interval = float(os.getenv("PARTITION_MAINTENANCE_HOURS", "24")) * 3600
+    while True:
+        try:
+            await asyncio.to_thread(lambda: supabase.rpc("ensure_transaction_partitions", {}).execute())
+        except Exception as e:
+            if "Could not find the function" in str(e) or "PGRST202" in str(e):
+                logger.info("Transactions are not partitioned (partition_transactions.sql), skipping partition maintenance")
+                return
+            logger.error("Partition maintenance failed: %s", e)
+        await asyncio.sleep(interval)
+
+
+def _public_job(job: Dict[str, Any]):
+    return {key: value for key, value in job.items() if key != "result_path"}
+
+
+async def _get_own_job(job_id: str, user):
+    job = await asyncio.to_thread(job_runner.store.get, job_id)
+    # Other users' jobs look the same as missing ones
+    if not job or (job["user_id"] != user.id and user.email != "admin@admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/api/statements", status_code=202)
+async def request_statement(request: StatementRequest, user=Depends(verify_token)):
+    """Queue generation of a monthly account statement"""
+    try:
+        job = await job_runner.submit(user.id, "statement", {"month": request.month, "format": request.format})
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Too many reports queued, please retry later")
+    except JobsUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, user=Depends(verify_token)):
+    """Poll a background job's status"""
+    return _public_job(await _get_own_job(job_id, user))
+
+
+@app.get("/api/jobs/{job_id}/download")
+async def download_job_result(job_id: str, user=Depends(verify_token)):
+    """Download a completed job's result"""
+    job = await _get_own_job(job_id, user)
+    if job["status"] == "expired":
+        raise HTTPException(status_code=410, detail="Result has expired, please request it again")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    path = job.get("result_path")
+    if not path or not os.path.exists(path):
+        # Deleted, or written on another host: REPORTS_DIR has to be shared between them
+        raise HTTPException(status_code=410, detail="Result is no longer available, please request it again")
+    extension = os.path.splitext(path)[1]
+    filename = f"{job['job_type']}-{job['params'].get('month', job_id)}{extension}"
+    return FileResponse(path, media_type=job.get("media_type"), filename=filename)
+
+
 # Admin endpoints - only accessible by admin user
+def _load_all_users(db: Client):
+    """All users with their wallet balances"""
+    # Get all users from users table
+    users_result = db.table("users").select("id, email, full_name, created_at").execute()
+    
+    # Get all wallets in one query (much faster than N queries)
+    user_ids = [user["id"] for user in users_result.data]
+    wallets_result = db.table("wallets").select("user_id, balance").in_("user_id", user_ids).execute() if user_ids else {"data": []}
+    
+    # Create a map of user_id -> balance for fast lookup
+    balance_map = {wallet["user_id"]: float(wallet["balance"]) for wallet in wallets_result.data}
+    for user_id, shard_total in sharded_wallets.shard_totals(user_ids, db).items():
+        balance_map[user_id] = balance_map.get(user_id, 0.0) + shard_total
+    
+    # Combine users with balances
+    users_with_balances = []
+    for user_data in users_result.data:
+        balance = balance_map.get(user_data["id"], 0.0)
+        users_with_balances.append({
+            **user_data,
+            "balance": balance
+        })
+    
+    return {"users": users_with_balances}
+
+
 @app.get("/api/admin/users")
-async def get_all_users(user=Depends(verify_token)):
+async def get_all_users(request: Request, user=Depends(verify_token)):
     # Check if user is admin
     if user.email != "admin@admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     try:
-        # Get all users from users table
-        users_result = supabase.table("users").select("id, email, full_name, created_at").execute()
-        
-        # Get all wallets in one query (much faster than N queries)
-        user_ids = [user["id"] for user in users_result.data]
-        wallets_result = supabase.table("wallets").select("user_id, balance").in_("user_id", user_ids).execute() if user_ids else {"data": []}
-        
-        # Create a map of user_id -> balance for fast lookup
-        balance_map = {wallet["user_id"]: float(wallet["balance"]) for wallet in wallets_result.data}
-        
-        # Combine users with balances
-        users_with_balances = []
-        for user_data in users_result.data:
-            balance = balance_map.get(user_data["id"], 0.0)
-            users_with_balances.append({
-                **user_data,
-                "balance": balance
-            })
-        
-        return {"users": users_with_balances}
+        return await conditional_responder.respond(
+            request, ("admin_users",), ADMIN_SCOPE, lambda: asyncio.to_thread(db_router.run_read, _load_all_users, READ_YOUR_WRITES, ADMIN_SCOPE)
+        )
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error in get_all_users: {str(e)}")
-        print(f"Traceback: {error_details}")
+        logger.exception("Error in get_all_users")
         raise HTTPException(status_code=500, detail=f"Error fetching users: {str(e)}")
 
 
-@app.get("/api/admin/transactions")
-async def get_all_transactions(user=Depends(verify_token)):
-    # Check if user is admin
-    if user.email != "admin@admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
+def _violation_list(value: Any) -> List[Any]:
+    """violations as stored: a JSONB array, or a JSON-encoded string before create_violation_codes.sql"""
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str) and value:
+        try:
+            decoded = json.loads(value)
+        except ValueError:
+            return [value]
+        return decoded if isinstance(decoded, list) else [decoded]
+    return []
+
+
+def _is_missing_violation_codes(e: Exception) -> bool:
+    # violation_codes comes from create_violation_codes.sql
+    return "violation_codes" in str(e) and ("does not exist" in str(e) or "42703" in str(e))
+
+
+def _filter_pending(query, violation_code: Optional[str] = None, min_amount: Optional[float] = None, max_amount: Optional[float] = None):
+    """Violation-code (GIN containment) and amount-range filters, evaluated by Postgres"""
+    if violation_code:
+        query = query.contains("violation_codes", [violation_code.strip().lower()])
+    if min_amount is not None:
+        query = query.gte("amount", min_amount)
+    if max_amount is not None:
+        query = query.lte("amount", max_amount)
+    return query
+
+
+def _load_all_transactions(
+    db: Client,
+    violation_code: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+):
+    """Latest completed and rejected transactions across all users"""
+    # Get all completed transactions (newest partitions first); they never carry violations
+    transactions_result = []
+    if not violation_code:
+        transactions_result = fetch_recent(
+            lambda: _filter_pending(
+                db.table("transactions").select("id, from_user_id, to_user_id, amount, created_at"),
+                None, min_amount, max_amount
+            ),
+            limit=100
+        )
     
+    # Get rejected transactions from pending_transactions
+    rejected_result = []
     try:
-        # Get all completed transactions
-        transactions_result = supabase.table("transactions").select(
-            "id, from_user_id, to_user_id, amount, created_at"
-        ).order("created_at", desc=True).limit(100).execute()
-        
-        # Get rejected transactions from pending_transactions
-        rejected_result = []
-        try:
-            rejected_result = supabase.table("pending_transactions").select("*").eq(
-                "status", "rejected"
-            ).order("created_at", desc=True).limit(100).execute()
-        except:
-            pass  # If table doesn't exist, continue without rejected
-        
-        # Get all unique user IDs from transactions (batch query instead of N queries)
-        all_user_ids = set()
-        if transactions_result.data:
-            for tx in transactions_result.data:
+        rejected_result = fetch_recent(
+            lambda: _filter_pending(
+                db.table("pending_transactions").select("*").eq("status", "rejected"),
+                violation_code, min_amount, max_amount
+            ),
+            limit=100
+        )
+    except Exception as e:
+        if violation_code and _is_missing_violation_codes(e):
+            raise
+        # If table doesn't exist, continue without rejected
+    
+    # Get all unique user IDs from transactions (batch query instead of N queries)
+    all_user_ids = set()
+    if transactions_result:
+        for tx in transactions_result:
+            all_user_ids.add(tx["from_user_id"])
+            all_user_ids.add(tx["to_user_id"])
+    
+    # Batch fetch all user emails in one query
+    user_email_map = {}
+    if all_user_ids:
+        users_batch = db.table("users").select("id, email").in_("id", list(all_user_ids)).execute()
+        user_email_map = {user["id"]: user["email"] for user in users_batch.data}
+    
+    # Build transaction list with emails from map
+    transaction_list = []
+    if transactions_result:
+        for tx in transactions_result:
+            from_email = user_email_map.get(tx["from_user_id"])
+            to_email = user_email_map.get(tx["to_user_id"])
+            
+            transaction_list.append({
+                "id": tx["id"],
+                "from_user_id": tx["from_user_id"],
+                "to_user_id": tx["to_user_id"],
+                "amount": tx["amount"],
+                "created_at": tx["created_at"],
+                "from_user_email": from_email,
+                "to_user_email": to_email,
+                "status": "completed"
+            })
+    
+    # Add rejected transactions (use same email map)
+    if rejected_result:
+        # Add any missing user IDs to the map
+        for tx in rejected_result:
+            if tx["from_user_id"] not in user_email_map:
                 all_user_ids.add(tx["from_user_id"])
+            if tx["to_user_id"] not in user_email_map:
                 all_user_ids.add(tx["to_user_id"])
         
-        # Batch fetch all user emails in one query
-        user_email_map = {}
-        if all_user_ids:
-            users_batch = supabase.table("users").select("id, email").in_("id", list(all_user_ids)).execute()
-            user_email_map = {user["id"]: user["email"] for user in users_batch.data}
-        
-        # Build transaction list with emails from map
-        transaction_list = []
-        if transactions_result.data:
-            for tx in transactions_result.data:
-                from_email = user_email_map.get(tx["from_user_id"])
-                to_email = user_email_map.get(tx["to_user_id"])
-                
-                transaction_list.append({
-                    "id": tx["id"],
-                    "from_user_id": tx["from_user_id"],
-                    "to_user_id": tx["to_user_id"],
-                    "amount": tx["amount"],
-                    "created_at": tx["created_at"],
-                    "from_user_email": from_email,
-                    "to_user_email": to_email,
-                    "status": "completed"
-                })
+        # Fetch any missing users
+        missing_ids = [uid for uid in all_user_ids if uid not in user_email_map]
+        if missing_ids:
+            missing_users = db.table("users").select("id, email").in_("id", missing_ids).execute()
+            for user in missing_users.data:
+                user_email_map[user["id"]] = user["email"]
         
-        # Add rejected transactions (use same email map)
-        if rejected_result and rejected_result.data:
-            # Add any missing user IDs to the map
-            for tx in rejected_result.data:
-                if tx["from_user_id"] not in user_email_map:
-                    all_user_ids.add(tx["from_user_id"])
-                if tx["to_user_id"] not in user_email_map:
-                    all_user_ids.add(tx["to_user_id"])
-            
-            # Fetch any missing users
-            missing_ids = [uid for uid in all_user_ids if uid not in user_email_map]
-            if missing_ids:
-                missing_users = supabase.table("users").select("id, email").in_("id", missing_ids).execute()
-                for user in missing_users.data:
-                    user_email_map[user["id"]] = user["email"]
+        for tx in rejected_result:
+            from_email = user_email_map.get(tx["from_user_id"])
+            to_email = user_email_map.get(tx["to_user_id"])
             
-            for tx in rejected_result.data:
-                from_email = user_email_map.get(tx["from_user_id"])
-                to_email = user_email_map.get(tx["to_user_id"])
-                
-                # Parse violations JSON
-                violations = []
-                if tx.get("violations"):
-                    try:
-                        violations = json.loads(tx["violations"]) if isinstance(tx["violations"], str) else tx["violations"]
-                    except:
-                        violations = []
-                
-                transaction_list.append({
-                    "id": f"rejected_{tx['id']}",  # Prefix to identify as rejected
-                    "from_user_id": tx["from_user_id"],
-                    "to_user_id": tx["to_user_id"],
-                    "amount": float(tx["amount"]),
-                    "created_at": tx["created_at"],
-                    "from_user_email": from_email,
-                    "to_user_email": to_email,
-                    "status": "rejected",
-                    "violations": violations,
-                    "reviewed_at": tx.get("reviewed_at"),
-                    "reviewed_by": tx.get("reviewed_by")
-                })
-        
-        # Sort by created_at descending
-        transaction_list.sort(key=lambda x: x["created_at"], reverse=True)
-        
-        return {"transactions": transaction_list}
+            transaction_list.append({
+                "id": f"rejected_{tx['id']}",  # Prefix to identify as rejected
+                "from_user_id": tx["from_user_id"],
+                "to_user_id": tx["to_user_id"],
+                "amount": float(tx["amount"]),
+                "created_at": tx["created_at"],
+                "from_user_email": from_email,
+                "to_user_email": to_email,
+                "status": "rejected",
+                "violations": _violation_list(tx.get("violations")),
+                "violation_codes": tx.get("violation_codes") or [],
+                "reviewed_at": tx.get("reviewed_at"),
+                "reviewed_by": tx.get("reviewed_by")
+            })
+    
+    # Sort by created_at descending
+    transaction_list.sort(key=lambda x: x["created_at"], reverse=True)
+    
+    return {"transactions": transaction_list}
+
+
+@app.get("/api/admin/transactions")
+async def get_all_transactions(
+    request: Request,
+    user=Depends(verify_token),
+    violation_code: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+):
+    # Check if user is admin
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        return await conditional_responder.respond(
+            request, ("admin_transactions", violation_code, min_amount, max_amount), ADMIN_SCOPE,
+            lambda: asyncio.to_thread(
+                db_router.run_read, lambda db: _load_all_transactions(db, violation_code, min_amount, max_amount),
+                READ_YOUR_WRITES, ADMIN_SCOPE
+            )
+        )
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error in get_all_transactions: {str(e)}")
-        print(f"Traceback: {error_details}")
+        if _is_missing_violation_codes(e):
+            raise HTTPException(status_code=501, detail="Violation filters require create_violation_codes.sql")
+        logger.exception("Error in get_all_transactions")
         raise HTTPException(status_code=500, detail=f"Error fetching transactions: {str(e)}")
 
 
+@app.post("/api/admin/reconciliation", status_code=202)
+async def request_reconciliation(user=Depends(verify_token)):
+    """Queue a wallet reconciliation; poll /api/jobs/{job_id} and download the JSON report"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        job = await job_runner.submit(user.id, "reconciliation", {})
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Too many reports queued, please retry later")
+    except JobsUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return {"job_id": job["id"], "status": job["status"]}
+
+
 # Pending transactions endpoints for admin
+def _load_pending_transactions(
+    db: Client,
+    rank_by_risk: bool = True,
+    violation_code: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+):
+    """Pending transfers awaiting review, with sender/recipient emails, riskiest first"""
+    pending_result = _filter_pending(
+        db.table("pending_transactions").select("*").eq("status", "pending"),
+        violation_code, min_amount, max_amount
+    ).order("created_at", desc=True).execute()
+    
+    # Batch fetch user emails (much faster than N queries)
+    all_user_ids = set()
+    if pending_result.data:
+        for tx in pending_result.data:
+            all_user_ids.add(tx["from_user_id"])
+            all_user_ids.add(tx["to_user_id"])
+    
+    user_email_map = {}
+    if all_user_ids:
+        try:
+            users_batch = db.table("users").select("id, email").in_("id", list(all_user_ids)).execute()
+            user_email_map = {user["id"]: user["email"] for user in users_batch.data}
+        except:
+            pass
+    
+    pending_list = []
+    if pending_result.data:
+        for tx in pending_result.data:
+            from_email = user_email_map.get(tx["from_user_id"])
+            to_email = user_email_map.get(tx["to_user_id"])
+            
+            pending_list.append({
+                "id": tx["id"],
+                "from_user_id": tx["from_user_id"],
+                "to_user_id": tx["to_user_id"],
+                "amount": float(tx["amount"]),
+                "status": tx["status"],
+                "violations": _violation_list(tx.get("violations")),
+                "violation_codes": tx.get("violation_codes") or [],
+                "created_at": tx["created_at"],
+                "from_user_email": from_email,
+                "to_user_email": to_email,
+                "reviewed_at": tx.get("reviewed_at"),
+                "reviewed_by": tx.get("reviewed_by")
+            })
+    
+    if rank_by_risk and pending_list:
+        try:
+            context = fetch_risk_context(db, list({tx["from_user_id"] for tx in pending_list}))
+            for tx, scored in zip(pending_list, score_transactions(pending_list, context)):
+                tx.update(scored)
+            # Stable sort keeps newest-first among equal scores
+            pending_list.sort(key=lambda tx: tx["risk_score"], reverse=True)
+        except Exception as e:
+            # Scoring only orders the queue; never hide it because scoring failed
+            logger.warning("Risk scoring failed, returning pending transactions by date: %s", e)
+    
+    return {"pending_transactions": pending_list}
+
+
 @app.get("/api/admin/pending-transactions")
-async def get_pending_transactions(user=Depends(verify_token)):
-    """Get all pending transactions awaiting approval"""
+async def get_pending_transactions(
+    user=Depends(verify_token),
+    sort: str = "risk",
+    violation_code: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+):
+    """Get pending transactions awaiting approval (sort=risk, the default, or sort=created_at),
+    optionally only those with a violation code and/or an amount in [min_amount, max_amount]"""
     if user.email != "admin@admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     try:
-        pending_result = supabase.table("pending_transactions").select("*").eq(
-            "status", "pending"
-        ).order("created_at", desc=True).execute()
-        
-        # Batch fetch user emails (much faster than N queries)
-        all_user_ids = set()
-        if pending_result.data:
-            for tx in pending_result.data:
-                all_user_ids.add(tx["from_user_id"])
-                all_user_ids.add(tx["to_user_id"])
-        
-        user_email_map = {}
-        if all_user_ids:
-            try:
-                users_batch = supabase.table("users").select("id, email").in_("id", list(all_user_ids)).execute()
-                user_email_map = {user["id"]: user["email"] for user in users_batch.data}
-            except:
-                pass
-        
-        pending_list = []
-        if pending_result.data:
-            for tx in pending_result.data:
-                from_email = user_email_map.get(tx["from_user_id"])
-                to_email = user_email_map.get(tx["to_user_id"])
-                
-                # Parse violations JSON
-                violations = []
-                if tx.get("violations"):
-                    try:
-                        violations = json.loads(tx["violations"]) if isinstance(tx["violations"], str) else tx["violations"]
-                    except:
-                        violations = []
-                
-                pending_list.append({
-                    "id": tx["id"],
-                    "from_user_id": tx["from_user_id"],
-                    "to_user_id": tx["to_user_id"],
-                    "amount": float(tx["amount"]),
-                    "status": tx["status"],
-                    "violations": violations,
-                    "created_at": tx["created_at"],
-                    "from_user_email": from_email,
-                    "to_user_email": to_email,
-                    "reviewed_at": tx.get("reviewed_at"),
-                    "reviewed_by": tx.get("reviewed_by")
-                })
-        
-        return {"pending_transactions": pending_list}
+        if sort not in ("risk", "created_at"):
+            raise HTTPException(status_code=400, detail="sort must be 'risk' or 'created_at'")
+        return await asyncio.to_thread(
+            db_router.run_read,
+            lambda db: _load_pending_transactions(db, sort == "risk", violation_code, min_amount, max_amount),
+            READ_YOUR_WRITES, ADMIN_SCOPE
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error in get_pending_transactions: {str(e)}")
-        print(f"Traceback: {error_details}")
+        logger.exception("Error in get_pending_transactions")
+        if _is_missing_violation_codes(e):
+            raise HTTPException(status_code=501, detail="Violation filters require create_violation_codes.sql")
         # If table doesn't exist, return empty list
         if "Could not find the table" in str(e) or "PGRST205" in str(e):
             return {"pending_transactions": []}
@@ -840,7 +1519,10 @@ async def approve_transaction(request: ApproveTransactionRequest, user=Depends(v
         if current_status != "pending":
             raise HTTPException(status_code=400, detail=f"Transaction is already {current_status}, cannot change status")
         
-        print(f"🔄 Processing {'approval' if request.approve else 'rejection'} for transaction {request.transaction_id}")
+        logger.info(
+            "Processing %s", "approval" if request.approve else "rejection",
+            extra={"transaction_id": request.transaction_id}
+        )
         
         # All approval/rejection decisions go through Action Blocker Service
         # Action Blocker is the central authority for all approval decisions
@@ -849,25 +1531,43 @@ async def approve_transaction(request: ApproveTransactionRequest, user=Depends(v
         
         try:
             # Call Action Blocker Service to handle approval/rejection
-            async with httpx.AsyncClient(follow_redirects=True, timeout=30.0) as client:
-                approve_response = await client.post(
-                    f"{action_blocker_url_clean}/api/approve-transaction",
-                    json={
-                        "transaction_id": request.transaction_id,
-                        "approve": request.approve,
-                        "reviewed_by": user.id,
-                        "review_notes": None
-                    },
-                    timeout=30.0
-                )
+            async with http_client() as client:
+                with span("action_blocker.approve_transaction", kind=3, **{"http.url": f"{action_blocker_url_clean}/api/approve-transaction"}):
+                    approve_response = await client.post(
+                        f"{action_blocker_url_clean}/api/approve-transaction",
+                        json={
+                            "transaction_id": request.transaction_id,
+                            "approve": request.approve,
+                            "reviewed_by": user.id,
+                            "review_notes": None
+                        },
+                        headers=inject_headers(),
+                        timeout=30.0
+                    )
                 
                 if approve_response.status_code == 200:
                     result = approve_response.json()
-                    print(f"✅ Action Blocker processed approval: {result.get('status')}")
+                    data_versions.bump(pending_tx.get("from_user_id"), pending_tx.get("to_user_id"))
+                    # ADMIN_SCOPE too: the review queue must not show this transfer as pending again
+                    db_router.note_write(ADMIN_SCOPE, pending_tx.get("from_user_id"), pending_tx.get("to_user_id"))
+                    logger.info("Action Blocker processed approval", extra={"status": result.get("status")})
+                    audit_log.record(
+                        user,
+                        "transaction.approve" if request.approve else "transaction.reject",
+                        "pending_transaction",
+                        request.transaction_id,
+                        before={
+                            "status": current_status,
+                            "from_user_id": pending_tx.get("from_user_id"),
+                            "to_user_id": pending_tx.get("to_user_id"),
+                            "amount": pending_tx.get("amount")
+                        },
+                        after={"status": result.get("status"), "approve": request.approve}
+                    )
                     return result
                 else:
                     error_msg = approve_response.text
-                    print(f"❌ Action Blocker error: {approve_response.status_code} - {error_msg}")
+                    logger.error("Action Blocker error", extra={"status_code": approve_response.status_code, "error": error_msg})
                     raise HTTPException(
                         status_code=approve_response.status_code,
                         detail=f"Action Blocker Service error: {error_msg}"
@@ -875,43 +1575,131 @@ async def approve_transaction(request: ApproveTransactionRequest, user=Depends(v
                     
         except httpx.TimeoutException:
             error_msg = "Action Blocker Service timeout - cannot process approval"
-            print(f"❌ {error_msg}")
+            logger.error(error_msg)
             raise HTTPException(status_code=503, detail=error_msg)
         except httpx.ConnectError:
             error_msg = "Action Blocker Service is not reachable - cannot process approval"
-            print(f"❌ {error_msg}")
+            logger.error(error_msg)
             raise HTTPException(status_code=503, detail=error_msg)
         except HTTPException:
             raise
         except Exception as e:
             error_msg = f"Error calling Action Blocker Service: {str(e)}"
-            print(f"❌ {error_msg}")
+            logger.error(error_msg)
             raise HTTPException(status_code=500, detail=error_msg)
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error in approve_transaction: {str(e)}")
-        print(f"Traceback: {error_details}")
+        logger.exception("Error in approve_transaction")
         raise HTTPException(status_code=500, detail=f"Error processing approval: {str(e)}")
 
 
+def _load_rules_version() -> Optional[int]:
+    """The database's rules version, or None if create_rules_notify.sql hasn't been run"""
+    if not _rules_cache.db_versioned:
+        return None
+    try:
+        result = supabase.rpc("current_rules_version", {}).execute()
+    except Exception as e:
+        message = str(e)
+        if "Could not find the function" in message or "PGRST202" in message:
+            logger.warning("rules_version is not installed, rules are re-read every RULES_CACHE_TTL seconds. Run create_rules_notify.sql.")
+            _rules_cache.db_versioned = False
+            return None
+        raise
+    return int(result.data or 0)
+
+
+def _load_rules():
+    """Read all transaction rules, with the rules version they were read at"""
+    # Version first: a change landing between the two reads only costs one extra reload
+    version = _load_rules_version()
+    rules_result = supabase.table("transaction_rules").select("*").execute()
+    return (rules_result.data if rules_result.data else []), version
+
+
+async def get_cached_rules():
+    """Get rules from the in-process cache, reloading (once for all waiters) when the version moved"""
+    rules = _rules_cache.fresh()
+    if rules is not None:
+        return rules
+    version = await _rules_flight.do_sync("version", _load_rules_version)
+    rules = _rules_cache.get(version)
+    if rules is None:
+        rules, version = await _rules_flight.do_sync("all", _load_rules)
+        _rules_cache.set(rules, version)
+    return rules
+
+
 @app.get("/api/admin/rules")
-async def get_rules(user=Depends(verify_token)):
+async def get_rules(user=Depends(verify_token), if_none_match: Optional[str] = Header(None)):
     """Get all transaction rules"""
     if user.email != "admin@admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     try:
-        # Query rules directly from database
-        rules_result = supabase.table("transaction_rules").select("*").execute()
-        rules = rules_result.data if rules_result.data else []
-        return {"rules": rules}
+        rules = await get_cached_rules()
+        headers = {"ETag": _rules_cache.etag, "X-Rules-Version": str(_rules_cache.version)}
+        if if_none_match and if_none_match == _rules_cache.etag:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(content={"rules": rules, "version": _rules_cache.version}, headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching rules: {str(e)}")
 
 
+@app.get("/api/rules/version")
+async def get_rules_version(
+    authorization: Optional[str] = Header(None),
+    x_service_token: Optional[str] = Header(None)
+):
+    """Cheap poll target for rules changes (used by the Action Blocker with X-Service-Token)"""
+    service_token = os.getenv("ACTION_BLOCKER_TOKEN")
+    if not (service_token and x_service_token and secrets.compare_digest(x_service_token, service_token)):
+        user = await verify_token(authorization)
+        if user.email != "admin@admin":
+            raise HTTPException(status_code=403, detail="Admin access required")
+    await get_cached_rules()
+    return JSONResponse(content=_rules_cache.snapshot(), headers={"ETag": _rules_cache.etag})
+
+
+def _update_rule(rule_id: str, enabled: Optional[bool], config: Optional[Dict[str, Any]]):
+    """Apply a rule update; returns (updated rule, previous rule, rules version) or None if not found"""
+    global _rules_update_rpc
+    if _rules_update_rpc:
+        try:
+            result = supabase.rpc("update_transaction_rule", {
+                "p_rule_id": rule_id, "p_enabled": enabled, "p_config": config
+            }).execute()
+        except Exception as e:
+            message = str(e)
+            if "Could not find the function" not in message and "PGRST202" not in message:
+                raise
+            logger.warning("update_transaction_rule() is not installed, rule configs are merged in the API. Run create_rules_notify.sql.")
+            _rules_update_rpc = False
+        else:
+            if not result.data:
+                return None
+            return result.data["rule"], result.data["previous"], result.data["version"]
+    
+    # Without the function: merge against the row as stored now, not the cached copy, which
+    # can be up to RULES_CACHE_TTL old and would drop another worker's change
+    current = supabase.table("transaction_rules").select("*").eq("rule_id", rule_id).execute()
+    if not current.data:
+        return None
+    rule_data = current.data[0]
+    update_data: Dict[str, Any] = {"updated_at": datetime.utcnow().isoformat()}
+    if enabled is not None:
+        update_data["enabled"] = enabled
+    if config is not None:
+        existing_config = rule_data.get("rule_config") or {}
+        if isinstance(existing_config, str):
+            existing_config = json.loads(existing_config)
+        update_data["rule_config"] = {**existing_config, **config}
+    update_result = supabase.table("transaction_rules").update(update_data).eq("rule_id", rule_id).execute()
+    updated_rule = update_result.data[0] if update_result.data else {**rule_data, **update_data}
+    return updated_rule, rule_data, _load_rules_version()
+
+
 class UpdateRuleRequest(BaseModel):
     rule_id: str
     enabled: Optional[bool] = None
@@ -925,49 +1713,205 @@ async def update_rule(request: UpdateRuleRequest, user=Depends(verify_token)):
         raise HTTPException(status_code=403, detail="Admin access required")
     
     try:
-        # Get rule from database
-        rule_result = supabase.table("transaction_rules").select("*").eq(
-            "rule_id", request.rule_id
-        ).execute()
-        
-        if not rule_result.data or len(rule_result.data) == 0:
+        updated = await asyncio.to_thread(_update_rule, request.rule_id, request.enabled, request.config)
+        if updated is None:
             raise HTTPException(status_code=404, detail="Rule not found")
         
-        rule_data = rule_result.data[0]
-        update_data = {"updated_at": datetime.utcnow().isoformat()}
-        
-        # Update enabled status if provided
-        if request.enabled is not None:
-            update_data["enabled"] = request.enabled
-        
-        # Update config if provided
-        if request.config is not None:
-            # Merge with existing config
-            existing_config = rule_data.get("rule_config", {})
-            if isinstance(existing_config, str):
-                existing_config = json.loads(existing_config)
-            existing_config.update(request.config)
-            update_data["rule_config"] = existing_config
+        # The write bumped rules_version (and notified LISTENers), so other workers reload on their
+        # next version check; this worker swaps in the row the write returned. Only if another
+        # change landed in between (or nothing is cached yet) are all rules re-read.
+        updated_rule, rule_data, version = updated
+        if not _rules_cache.replace(updated_rule, version):
+            rules, version = await asyncio.to_thread(_load_rules)
+            _rules_cache.set(rules, version)
+        audit_log.record(
+            user, "rule.update", "transaction_rule", request.rule_id,
+            before={"enabled": rule_data.get("enabled"), "rule_config": rule_data.get("rule_config")},
+            after={"enabled": updated_rule.get("enabled"), "rule_config": updated_rule.get("rule_config")}
+        )
         
-        # Update in database
-        supabase.table("transaction_rules").update(update_data).eq(
-            "rule_id", request.rule_id
-        ).execute()
-        
-        # Note: Action Blocker Service will reload rules on its own when needed
-        # No need to reload here since we delegate all rule checking to action-blocker
-        
-        return {"message": "Rule updated successfully", "rule_id": request.rule_id}
+        return {
+            "message": "Rule updated successfully",
+            "rule_id": request.rule_id,
+            "version": _rules_cache.version,
+            "etag": _rules_cache.etag
+        }
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error updating rule: {str(e)}")
-        print(f"Traceback: {error_details}")
+        logger.exception("Error updating rule")
         raise HTTPException(status_code=500, detail=f"Error updating rule: {str(e)}")
 
 
+@app.get("/api/admin/audit-log")
+async def get_audit_log(
+    user=Depends(verify_token),
+    limit: int = 50,
+    before_id: Optional[int] = None,
+    action: Optional[str] = None,
+    actor_id: Optional[str] = None,
+    target_id: Optional[str] = None
+):
+    """Audit events, newest first; pass next_cursor back as before_id for the next page"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if not 1 <= limit <= 200:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 200")
+    
+    try:
+        # Write anything still buffered so the admin sees their own latest actions
+        await asyncio.to_thread(audit_log.flush)
+        return await asyncio.to_thread(audit_log.query, limit, before_id, action, actor_id, target_id)
+    except Exception as e:
+        if "Could not find the table" in str(e) or "PGRST205" in str(e):
+            raise HTTPException(status_code=503, detail="Audit log table does not exist. Run create_audit_log_table.sql.")
+        logger.exception("Error in get_audit_log")
+        raise HTTPException(status_code=500, detail=f"Error fetching audit log: {str(e)}")
+
+
+@app.post("/api/admin/ledger/snapshot")
+async def take_ledger_snapshots(user=Depends(verify_token)):
+    """Snapshot all wallet balances that changed since their last snapshot"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        written = await asyncio.to_thread(ledger.take_snapshots)
+        return {"message": "Snapshots taken", "snapshots_written": written}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error taking snapshots: {str(e)}")
+
+
+@app.get("/api/admin/hot-wallets")
+async def get_hot_wallets(user=Depends(verify_token)):
+    """List sharded (hot) wallets with their sub-balances"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        hot = await asyncio.to_thread(sharded_wallets.hot_wallets)
+        wallets = []
+        for user_id, shard_count in hot.items():
+            shards = await asyncio.to_thread(sharded_wallets.shards, user_id)
+            wallets.append({
+                "user_id": user_id,
+                "shard_count": shard_count,
+                "shard_balance": sum(float(s["balance"]) for s in shards),
+                "shards": shards
+            })
+        return {"hot_wallets": wallets, "sharding_installed": sharded_wallets.available}
+    except Exception as e:
+        logger.exception("Error in get_hot_wallets")
+        raise HTTPException(status_code=500, detail=f"Error fetching hot wallets: {str(e)}")
+
+
+@app.post("/api/admin/hot-wallets")
+async def enable_hot_wallet(request: HotWalletRequest, user=Depends(verify_token)):
+    """Designate a wallet as hot: credits are spread over `shards` sub-balance rows"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        before = (await asyncio.to_thread(sharded_wallets.hot_wallets)).get(request.user_id)
+        shards = await asyncio.to_thread(sharded_wallets.enable, request.user_id, request.shards)
+        audit_log.record(
+            user, "wallet.enable_sharding", "wallet", request.user_id,
+            before={"shard_count": before}, after={"shard_count": shards}
+        )
+        return {"message": "Wallet sharding enabled", "user_id": request.user_id, "shard_count": shards}
+    except Exception as e:
+        if "does not exist" in str(e) and "wallet" in str(e):
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        logger.exception("Error in enable_hot_wallet")
+        raise HTTPException(status_code=500, detail=f"Error enabling wallet sharding: {str(e)}")
+
+
+@app.delete("/api/admin/hot-wallets/{user_id}")
+async def disable_hot_wallet(user_id: str, user=Depends(verify_token)):
+    """Fold a hot wallet's shards back into its wallets row and make it a regular wallet"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        before = (await asyncio.to_thread(sharded_wallets.hot_wallets)).get(user_id)
+        if before is None:
+            raise HTTPException(status_code=404, detail="Wallet is not sharded")
+        moved = await asyncio.to_thread(sharded_wallets.disable, user_id)
+        audit_log.record(
+            user, "wallet.disable_sharding", "wallet", user_id,
+            before={"shard_count": before}, after={"shard_count": None, "consolidated": moved}
+        )
+        return {"message": "Wallet sharding disabled", "user_id": user_id, "consolidated": moved}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in disable_hot_wallet")
+        raise HTTPException(status_code=500, detail=f"Error disabling wallet sharding: {str(e)}")
+
+
+@app.get("/api/admin/metrics/coalescing")
+async def get_coalescing_metrics(user=Depends(verify_token)):
+    """Get request coalescing (single-flight) statistics"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return coalescing_stats()
+
+
+@app.get("/api/admin/metrics/action-blocker-batching")
+async def get_batching_metrics(user=Depends(verify_token)):
+    """Get Action Blocker micro-batching statistics"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {**action_blocker_batcher.stats(), "batch_endpoint_supported": _action_blocker_batch_supported}
+
+
+@app.get("/api/admin/metrics/conditional")
+async def get_conditional_metrics(user=Depends(verify_token)):
+    """Get ETag / 304 / compressed-body cache statistics"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return conditional_responder.stats()
+
+
+@app.get("/api/admin/metrics/audit")
+async def get_audit_metrics(user=Depends(verify_token)):
+    """Get audit log buffer/writer statistics"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return audit_log.stats()
+
+
+@app.get("/api/admin/metrics/db-routing")
+async def get_db_routing_metrics(user=Depends(verify_token)):
+    """Get primary/replica read routing statistics"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return db_router.stats()
+
+
+@app.get("/api/admin/metrics/logging")
+async def get_logging_metrics(user=Depends(verify_token)):
+    """Get log queue depth and dropped record count"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return logging_stats()
+
+
+@app.get("/api/admin/metrics/recipients")
+async def get_recipient_cache_metrics(user=Depends(verify_token)):
+    """Get recipient lookup cache statistics"""
+    if user.email != "admin@admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {**recipient_resolver.stats(), "batch_lookups_rejected": _recipient_lookup_budget.rejected}
+
+
 # Action Blocker Service management
 _action_blocker_service = None
 
@@ -985,8 +1929,8 @@ async def start_action_blocker(user=Depends(verify_token)):
         
         try:
             action_blocker_url_clean = action_blocker_url.rstrip('/')
-            async with httpx.AsyncClient(follow_redirects=True) as client:
-                response = await client.get(f"{action_blocker_url_clean}/api/status", timeout=2.0)
+            async with http_client() as client:
+                response = await client.get(f"{action_blocker_url_clean}/api/status", headers=inject_headers(), timeout=2.0)
                 if response.status_code == 200:
                     data = response.json()
                     if data.get("running"):
@@ -1015,6 +1959,10 @@ async def start_action_blocker(user=Depends(verify_token)):
             return {"message": "Service is already running", "status": "running"}
         
         if _action_blocker_service.start():
+            audit_log.record(
+                user, "action_blocker.start", "action_blocker", f"{_action_blocker_service.host}:{_action_blocker_service.port}",
+                before={"running": False}, after={"running": True}
+            )
             return {
                 "message": "Action Blocker Service started successfully",
                 "status": "running",
@@ -1023,10 +1971,7 @@ async def start_action_blocker(user=Depends(verify_token)):
         else:
             raise HTTPException(status_code=500, detail="Failed to start service")
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error starting action blocker: {str(e)}")
-        print(f"Traceback: {error_details}")
+        logger.exception("Error starting action blocker")
         raise HTTPException(status_code=500, detail=f"Error starting service: {str(e)}")
 
 
@@ -1043,6 +1988,10 @@ async def stop_action_blocker(user=Depends(verify_token)):
     
     try:
         _action_blocker_service.stop()
+        audit_log.record(
+            user, "action_blocker.stop", "action_blocker", f"{_action_blocker_service.host}:{_action_blocker_service.port}",
+            before={"running": True}, after={"running": False}
+        )
         return {"message": "Action Blocker Service stopped successfully", "status": "stopped"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error stopping service: {str(e)}")
@@ -1061,8 +2010,8 @@ async def get_action_blocker_status(user=Depends(verify_token)):
     
     try:
         action_blocker_url_clean = action_blocker_url.rstrip('/')
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            response = await client.get(f"{action_blocker_url_clean}/api/status", timeout=2.0)
+        async with http_client() as client:
+            response = await client.get(f"{action_blocker_url_clean}/api/status", headers=inject_headers(), timeout=2.0)
             if response.status_code == 200:
                 data = response.json()
                 return {
@@ -1104,5 +2053,20 @@ async def get_action_blocker_status(user=Depends(verify_token)):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
-
+    import importlib.util
+
+    # Production server: one worker per core, uvloop/httptools when installed
+    # (uvicorn[standard]), graceful drain of in-flight requests on SIGTERM
+    workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=workers,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "auto",
+        http="httptools" if importlib.util.find_spec("httptools") else "auto",
+        backlog=int(os.getenv("BACKLOG", "2048")),
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", "5")),
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30")),
+        proxy_headers=True,
+    )
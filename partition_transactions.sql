@@ -0,0 +1,316 @@
+-- Monthly range partitioning for transactions and pending_transactions, plus an archive tier
+-- Run this in your Supabase SQL Editor (once; it migrates existing rows)
+--
+-- History and admin queries from the backend always carry a created_at range
+-- (see history.py), so Postgres prunes them down to the newest partitions.
+-- Partitions older than the retention window are moved to archive.* tables.
+
+-- ============================================
+-- 1. PARTITION MANAGEMENT HELPERS
+-- ============================================
+-- Create one monthly partition of p_table covering the month that contains p_month.
+-- Rows that landed in the DEFAULT partition for that month are moved into it first
+-- (Postgres refuses to add a partition whose range the default partition already holds).
+CREATE OR REPLACE FUNCTION public.create_monthly_partition(p_table TEXT, p_month DATE)
+RETURNS VOID AS $$
+DECLARE
+    start_date DATE := date_trunc('month', p_month)::DATE;
+    end_date DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::DATE;
+    partition_name TEXT := format('%s_%s', p_table, to_char(start_date, 'YYYY_MM'));
+    default_name TEXT := p_table || '_default';
+    has_stray_rows BOOLEAN := FALSE;
+BEGIN
+    IF to_regclass(format('public.%I', partition_name)) IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    IF to_regclass(format('public.%I', default_name)) IS NOT NULL THEN
+        EXECUTE format(
+            'SELECT EXISTS (SELECT 1 FROM public.%I WHERE created_at >= %L AND created_at < %L)',
+            default_name, start_date, end_date
+        ) INTO has_stray_rows;
+    END IF;
+
+    IF NOT has_stray_rows THEN
+        EXECUTE format(
+            'CREATE TABLE public.%I PARTITION OF public.%I FOR VALUES FROM (%L) TO (%L)',
+            partition_name, p_table, start_date, end_date
+        );
+        RETURN;
+    END IF;
+
+    -- Build the partition standalone (no row triggers fire), then attach it
+    EXECUTE format('CREATE TABLE public.%I (LIKE public.%I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, p_table);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM public.%I WHERE created_at >= %L AND created_at < %L RETURNING *) '
+        'INSERT INTO public.%I SELECT * FROM moved',
+        default_name, start_date, end_date, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE public.%I ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+        p_table, partition_name, start_date, end_date
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Make sure partitions exist from p_from up to p_months_ahead months from now
+CREATE OR REPLACE FUNCTION public.ensure_monthly_partitions(p_table TEXT, p_from DATE DEFAULT NULL, p_months_ahead INTEGER DEFAULT 3)
+RETURNS VOID AS $$
+DECLARE
+    month DATE := date_trunc('month', COALESCE(p_from, NOW()::DATE))::DATE;
+    last_month DATE := date_trunc('month', NOW() + make_interval(months => p_months_ahead))::DATE;
+BEGIN
+    WHILE month <= last_month LOOP
+        PERFORM public.create_monthly_partition(p_table, month);
+        month := (month + INTERVAL '1 month')::DATE;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- 2. MIGRATE TRANSACTIONS
+-- ============================================
+DO $$
+DECLARE
+    first_month DATE;
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = 'transactions' AND c.relnamespace = 'public'::regnamespace
+    ) THEN
+        RAISE NOTICE 'public.transactions is already partitioned';
+        RETURN;
+    END IF;
+
+    ALTER TABLE public.transactions RENAME TO transactions_unpartitioned;
+
+    -- The partition key must be part of the primary key
+    CREATE TABLE public.transactions (
+        id UUID DEFAULT gen_random_uuid(),
+        from_user_id UUID NOT NULL,
+        to_user_id UUID NOT NULL,
+        amount DECIMAL(15, 2) NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+
+    SELECT date_trunc('month', COALESCE(MIN(created_at), NOW()))::DATE INTO first_month
+    FROM public.transactions_unpartitioned;
+    PERFORM public.ensure_monthly_partitions('transactions', first_month, 3);
+
+    -- The ledger trigger is attached after the copy, so existing rows are not recorded twice
+    INSERT INTO public.transactions (id, from_user_id, to_user_id, amount, created_at)
+    SELECT id, from_user_id, to_user_id, amount, COALESCE(created_at, NOW())
+    FROM public.transactions_unpartitioned;
+
+    DROP TABLE public.transactions_unpartitioned;
+END $$;
+
+-- Participant + time composite indexes (cascade to every partition)
+CREATE INDEX IF NOT EXISTS idx_transactions_from_user_created_at ON public.transactions(from_user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_to_user_created_at ON public.transactions(to_user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON public.transactions(created_at DESC);
+
+ALTER TABLE public.transactions ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role full access" ON public.transactions;
+DROP POLICY IF EXISTS "Users can view own transactions" ON public.transactions;
+
+CREATE POLICY "Service role full access" ON public.transactions FOR ALL USING (true);
+CREATE POLICY "Users can view own transactions" ON public.transactions
+    FOR SELECT USING (auth.uid() = from_user_id OR auth.uid() = to_user_id);
+
+-- Re-attach the ledger trigger (create_ledger_tables.sql) if the ledger is installed
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_proc WHERE proname = 'ledger_record_transfer') THEN
+        DROP TRIGGER IF EXISTS ledger_on_transaction ON public.transactions;
+        CREATE TRIGGER ledger_on_transaction
+            AFTER INSERT ON public.transactions
+            FOR EACH ROW
+            EXECUTE FUNCTION public.ledger_record_transfer();
+    END IF;
+END $$;
+
+-- ============================================
+-- 3. MIGRATE PENDING_TRANSACTIONS
+-- ============================================
+DO $$
+DECLARE
+    first_month DATE;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_class WHERE relname = 'pending_transactions' AND relnamespace = 'public'::regnamespace) THEN
+        RAISE NOTICE 'public.pending_transactions does not exist, skipping';
+        RETURN;
+    END IF;
+    IF EXISTS (
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = 'pending_transactions' AND c.relnamespace = 'public'::regnamespace
+    ) THEN
+        RAISE NOTICE 'public.pending_transactions is already partitioned';
+        RETURN;
+    END IF;
+
+    ALTER TABLE public.pending_transactions RENAME TO pending_transactions_unpartitioned;
+
+    -- Same columns as the table the Action Blocker created, keyed by (id, created_at)
+    CREATE TABLE public.pending_transactions (
+        LIKE public.pending_transactions_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED
+    ) PARTITION BY RANGE (created_at);
+    ALTER TABLE public.pending_transactions ALTER COLUMN created_at SET NOT NULL;
+    ALTER TABLE public.pending_transactions ADD PRIMARY KEY (id, created_at);
+
+    SELECT date_trunc('month', COALESCE(MIN(created_at), NOW()))::DATE INTO first_month
+    FROM public.pending_transactions_unpartitioned;
+    PERFORM public.ensure_monthly_partitions('pending_transactions', first_month, 3);
+
+    UPDATE public.pending_transactions_unpartitioned SET created_at = NOW() WHERE created_at IS NULL;
+    INSERT INTO public.pending_transactions SELECT * FROM public.pending_transactions_unpartitioned;
+
+    DROP TABLE public.pending_transactions_unpartitioned;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_pending_transactions_from_user_created_at
+    ON public.pending_transactions(from_user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_pending_transactions_status_created_at
+    ON public.pending_transactions(status, created_at DESC);
+
+ALTER TABLE public.pending_transactions ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role full access" ON public.pending_transactions;
+CREATE POLICY "Service role full access" ON public.pending_transactions FOR ALL USING (true);
+
+-- ============================================
+-- 4. DEFAULT PARTITIONS AND UPCOMING MONTHS
+-- ============================================
+-- Catch-all so an insert never fails with "no partition found" if maintenance falls behind;
+-- create_monthly_partition moves such rows into their month once it is created.
+DO $$
+DECLARE
+    target TEXT;
+BEGIN
+    FOREACH target IN ARRAY ARRAY['transactions', 'pending_transactions'] LOOP
+        IF EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = target AND c.relnamespace = 'public'::regnamespace
+        ) THEN
+            EXECUTE format('CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.%I DEFAULT', target || '_default', target);
+        END IF;
+    END LOOP;
+END $$;
+
+-- Keep p_months_ahead months of partitions ahead of NOW() for both tables. Safe to call from
+-- several API workers at once; the backend calls it at startup and daily (see main.py).
+CREATE OR REPLACE FUNCTION public.ensure_transaction_partitions(p_months_ahead INTEGER DEFAULT 3)
+RETURNS VOID AS $$
+DECLARE
+    target TEXT;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_transaction_partitions'));
+    FOREACH target IN ARRAY ARRAY['transactions', 'pending_transactions'] LOOP
+        IF EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = target AND c.relnamespace = 'public'::regnamespace
+        ) THEN
+            PERFORM public.ensure_monthly_partitions(target, NULL, p_months_ahead);
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- ============================================
+-- 5. ARCHIVE TIER
+-- ============================================
+CREATE SCHEMA IF NOT EXISTS archive;
+
+-- Densely packed cold copies: no free space reserved for updates, no secondary indexes
+CREATE TABLE IF NOT EXISTS archive.transactions (
+    id UUID NOT NULL,
+    from_user_id UUID NOT NULL,
+    to_user_id UUID NOT NULL,
+    amount DECIMAL(15, 2) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+) WITH (fillfactor = 100);
+
+CREATE INDEX IF NOT EXISTS idx_archive_transactions_created_at
+    ON archive.transactions USING BRIN (created_at);
+
+-- Move every monthly partition of p_table that ended before NOW() - p_keep into archive.<p_table>
+-- and drop it. Pending transactions are only archived once they are no longer 'pending'.
+CREATE OR REPLACE FUNCTION public.archive_old_partitions(p_table TEXT DEFAULT 'transactions', p_keep INTERVAL DEFAULT INTERVAL '24 months')
+RETURNS INTEGER AS $$
+DECLARE
+    part RECORD;
+    archived INTEGER := 0;
+    has_pending BOOLEAN;
+    cutoff TIMESTAMP WITH TIME ZONE := date_trunc('month', NOW() - p_keep);
+BEGIN
+    IF p_table = 'pending_transactions' THEN
+        EXECUTE 'CREATE TABLE IF NOT EXISTS archive.pending_transactions (LIKE public.pending_transactions) WITH (fillfactor = 100)';
+    END IF;
+
+    FOR part IN
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = p_table AND p.relnamespace = 'public'::regnamespace
+          AND pg_get_expr(c.relpartbound, c.oid) <> 'DEFAULT'
+        ORDER BY c.relname
+    LOOP
+        -- Partition names end in _YYYY_MM; archive only months that ended before the cutoff
+        IF to_date(right(part.relname, 7), 'YYYY_MM') + INTERVAL '1 month' > cutoff THEN
+            CONTINUE;
+        END IF;
+
+        IF p_table = 'pending_transactions' THEN
+            EXECUTE format('SELECT EXISTS (SELECT 1 FROM public.%I WHERE status = %L)', part.relname, 'pending')
+                INTO has_pending;
+            IF has_pending THEN
+                CONTINUE;
+            END IF;
+        END IF;
+
+        EXECUTE format('ALTER TABLE public.%I DETACH PARTITION public.%I', p_table, part.relname);
+        IF p_table = 'transactions' THEN
+            EXECUTE format(
+                'INSERT INTO archive.transactions (id, from_user_id, to_user_id, amount, created_at) '
+                'SELECT id, from_user_id, to_user_id, amount, created_at FROM public.%I ORDER BY created_at',
+                part.relname
+            );
+        ELSE
+            EXECUTE format('INSERT INTO archive.%I SELECT * FROM public.%I ORDER BY created_at', p_table, part.relname);
+        END IF;
+        EXECUTE format('DROP TABLE public.%I', part.relname);
+        archived := archived + 1;
+    END LOOP;
+
+    RETURN archived;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- ============================================
+-- 6. SCHEDULED MAINTENANCE
+-- ============================================
+-- Daily with pg_cron when it is enabled (Database -> Extensions in Supabase): create upcoming
+-- partitions and archive old ones. Without pg_cron the API still creates upcoming partitions;
+-- archiving then has to be run by hand.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule('transactions-partitions', '0 3 * * *', $job$
+            SELECT public.ensure_transaction_partitions();
+            SELECT public.archive_old_partitions('transactions');
+            SELECT public.archive_old_partitions('pending_transactions');
+        $job$);
+    ELSE
+        RAISE NOTICE 'pg_cron is not enabled: old partitions are not archived automatically';
+    END IF;
+END $$;
+
+NOTIFY pgrst, 'reload schema';
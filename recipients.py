@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from coalescing import single_flight
+
+
+def normalize_email(email: str) -> str:
+    """Canonical form used for lookups (matches the lower(email) index in the users table)"""
+    return (email or "").strip().lower()
+
+
+class RecipientResolver:
+    """Resolve recipient emails to users with a TTL cache for hits and a short one for misses
+
+    Repeated transfers to the same payees are served from memory, and repeated lookups of
+    unknown addresses (typos, enumeration) stop reaching the database.
+    """
+
+    def __init__(
+        self,
+        fetch_one: Callable[[str], Optional[Dict[str, Any]]],
+        fetch_many: Callable[[List[str]], List[Dict[str, Any]]],
+        ttl_seconds: float = 300.0,
+        negative_ttl_seconds: float = 30.0,
+        max_entries: int = 10000,
+    ):
+        self._fetch_one = fetch_one
+        self._fetch_many = fetch_many
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        # email -> (expires_at, user or None)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = single_flight("resolve_recipient")
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def _get_cached(self, email: str):
+        """Return (found_in_cache, user_or_None)"""
+        with self._lock:
+            entry = self._cache.get(email)
+            if entry is None:
+                return False, None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self._cache[email]
+                return False, None
+            self._cache.move_to_end(email)
+            if user is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return True, user
+
+    def _store(self, email: str, user: Optional[Dict[str, Any]]):
+        ttl = self.ttl_seconds if user is not None else self.negative_ttl_seconds
+        with self._lock:
+            self._cache[email] = (time.monotonic() + ttl, user)
+            self._cache.move_to_end(email)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _load(self, email: str) -> Optional[Dict[str, Any]]:
+        # fetch_one raises on database errors, so only a real "no such user" is negative-cached
+        user = self._fetch_one(email)
+        self._store(email, user)
+        return user
+
+    async def resolve_async(self, email: str) -> Optional[Dict[str, Any]]:
+        """Non-blocking resolve; concurrent misses for the same email share one query"""
+        email = normalize_email(email)
+        found, user = self._get_cached(email)
+        if found:
+            return user
+        self.misses += 1
+        return await self._flight.do_sync(email, self._load, email)
+
+    def resolve_many(self, emails: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Resolve several emails with at most one query; keys are the normalised emails"""
+        results: Dict[str, Optional[Dict[str, Any]]] = {}
+        missing = []
+        for email in {normalize_email(e) for e in emails}:
+            found, user = self._get_cached(email)
+            if found:
+                results[email] = user
+            else:
+                missing.append(email)
+        if missing:
+            self.misses += len(missing)
+            fetched = {normalize_email(u["email"]): u for u in self._fetch_many(missing)}
+            for email in missing:
+                user = fetched.get(email)
+                self._store(email, user)
+                results[email] = user
+        return results
+
+    def invalidate(self, email: str):
+        """Forget a cached result, e.g. after signup so a fresh negative entry doesn't block transfers"""
+        with self._lock:
+            self._cache.pop(normalize_email(email), None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+class LookupBudget:
+    """Per-user limit on recipient lookups in a fixed window, to keep batch checks from enumerating accounts
+
+    Counted per worker process, so the effective limit is `limit` times the number of workers.
+    """
+
+    def __init__(self, limit: int = 100, window_seconds: float = 60.0, max_users: int = 10000):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_users = max_users
+        # user_id -> (window_started_at, lookups used)
+        self._windows: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def take(self, user_id: str, count: int) -> bool:
+        """Spend `count` lookups from the user's budget; False (nothing spent) if it would exceed the limit"""
+        now = time.monotonic()
+        with self._lock:
+            started, used = self._windows.get(user_id, (now, 0))
+            if now - started >= self.window_seconds:
+                started, used = now, 0
+            if used + count > self.limit:
+                self.rejected += 1
+                return False
+            if user_id not in self._windows and len(self._windows) >= self.max_users:
+                self._windows = {
+                    uid: window for uid, window in self._windows.items() if now - window[0] < self.window_seconds
+                }
+            self._windows[user_id] = (started, used + count)
+            return True
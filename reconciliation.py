@@ -0,0 +1,249 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app_logging import get_logger
+
+logger = get_logger("reconciliation")
+
+# Wallet reconciliation: every wallet (its wallets row plus any hot-wallet shards) should hold
+# INITIAL_BALANCE plus the net of its completed transfers. Transactions are streamed in keyset-paged chunks, one time slice per worker, and
+# folded into per-user totals (integer cents), so memory grows with the number of users, not
+# rows. Suspected mismatches are recomputed from the primary before they are reported, so
+# transfers that commit while the scan runs (or replica lag) don't show up as drift.
+#
+#   python reconciliation.py > report.json      (uses SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY)
+
+INITIAL_BALANCE_CENTS = 100000  # 1000.00, the starting balance of every wallet
+PAGE_SIZE = 1000
+SLICE_DAYS = 7
+MAX_CONFIRMATIONS = 5000
+
+# user_id -> [net cents, transaction count]
+Totals = Dict[str, List[int]]
+
+
+def _cents(amount: Any) -> int:
+    return int(round(float(amount) * 100))
+
+
+def _keyset_pages(build_query: Callable[[], Any], page_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Pages ordered by id, each starting after the previous page's last id (no OFFSET scans)"""
+    last_id: Optional[str] = None
+    while True:
+        query = build_query()
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        page = query.order("id").limit(page_size).execute().data or []
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        last_id = page[-1]["id"]
+
+
+def _slices(first: datetime, cutoff: datetime, days: int) -> List[Tuple[Optional[datetime], Optional[datetime]]]:
+    slices: List[Tuple[Optional[datetime], Optional[datetime]]] = []
+    start = first
+    while start < cutoff:
+        end = min(start + timedelta(days=days), cutoff)
+        slices.append((start, end))
+        start = end
+    # Rows from before created_at was NOT NULL
+    slices.append((None, None))
+    return slices
+
+
+class Reconciler:
+    def __init__(self, scan_client: Any, confirm_client: Optional[Any] = None, workers: int = 4, page_size: int = PAGE_SIZE):
+        # Scanning can use a read replica; confirmations always read the primary
+        self.scan_client = scan_client
+        self.confirm_client = confirm_client or scan_client
+        self.workers = workers
+        self.page_size = page_size
+        self.rows_scanned = 0
+        # Archived months never change, so confirmations reuse their scanned net instead of re-reading them
+        self._archived_net: Optional[Dict[str, int]] = None
+        self._shards: Dict[str, int] = {}
+
+    def _sources(self) -> List[Callable[[], Any]]:
+        """Live transactions plus the archive tier (partition_transactions.sql), if exposed via the API"""
+        sources = [lambda: self.scan_client.table("transactions")]
+        try:
+            self.scan_client.schema("archive").table("transactions").select("id").limit(1).execute()
+            sources.append(lambda: self.scan_client.schema("archive").table("transactions"))
+        except Exception:
+            logger.info("archive.transactions is not reachable, reconciling live transactions only")
+        return sources
+
+    def _first_created_at(self, sources: List[Callable[[], Any]], cutoff: datetime) -> datetime:
+        first = cutoff
+        for source in sources:
+            rows = source().select("created_at").not_.is_("created_at", "null").order("created_at").limit(1).execute().data
+            if rows:
+                first = min(first, datetime.fromisoformat(rows[0]["created_at"].replace("Z", "+00:00")))
+        return first
+
+    def _scan_slice(self, source: Callable[[], Any], start: Optional[datetime], end: Optional[datetime]) -> Tuple[Totals, int]:
+        def build_query():
+            query = source().select("id, from_user_id, to_user_id, amount")
+            if start is None:
+                return query.is_("created_at", "null")
+            return query.gte("created_at", start.isoformat()).lt("created_at", end.isoformat())
+
+        totals: Totals = {}
+        rows = 0
+        for page in _keyset_pages(build_query, self.page_size):
+            rows += len(page)
+            for tx in page:
+                cents = _cents(tx["amount"])
+                sender = totals.setdefault(tx["from_user_id"], [0, 0])
+                sender[0] -= cents
+                sender[1] += 1
+                recipient = totals.setdefault(tx["to_user_id"], [0, 0])
+                recipient[0] += cents
+                recipient[1] += 1
+        return totals, rows
+
+    def _scan_transactions(self, cutoff: datetime) -> Tuple[Totals, bool]:
+        sources = self._sources()
+        first = self._first_created_at(sources, cutoff)
+        totals: Totals = {}
+        if len(sources) > 1:
+            self._archived_net = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="reconcile") as pool:
+            futures = {
+                pool.submit(self._scan_slice, source, start, end): index
+                for index, source in enumerate(sources)
+                for start, end in _slices(first, cutoff, SLICE_DAYS)
+            }
+            for future in as_completed(futures):
+                partial, rows = future.result()
+                self.rows_scanned += rows
+                archived = futures[future] > 0
+                for user_id, (net, count) in partial.items():
+                    entry = totals.setdefault(user_id, [0, 0])
+                    entry[0] += net
+                    entry[1] += count
+                    if archived:
+                        self._archived_net[user_id] = self._archived_net.get(user_id, 0) + net
+        return totals, len(sources) > 1
+
+    def _wallets(self) -> Iterator[Dict[str, Any]]:
+        last_user: Optional[str] = None
+        while True:
+            query = self.scan_client.table("wallets").select("user_id, balance")
+            if last_user is not None:
+                query = query.gt("user_id", last_user)
+            page = query.order("user_id").limit(self.page_size).execute().data or []
+            yield from page
+            if len(page) < self.page_size:
+                return
+            last_user = page[-1]["user_id"]
+
+    def _shard_totals(self) -> Dict[str, int]:
+        """Sub-balance cents of hot wallets (create_wallet_shards.sql), keyed by user"""
+        totals: Dict[str, int] = {}
+        offset = 0
+        while True:
+            try:
+                page = self.scan_client.table("wallet_shards").select("user_id, shard, balance").order("user_id").order(
+                    "shard"
+                ).range(offset, offset + self.page_size - 1).execute().data or []
+            except Exception as e:
+                if "Could not find the table" in str(e) or "PGRST205" in str(e):
+                    return {}
+                raise
+            for row in page:
+                totals[row["user_id"]] = totals.get(row["user_id"], 0) + _cents(row["balance"])
+            if len(page) < self.page_size:
+                return totals
+            offset += self.page_size
+
+    def _confirm(self, user_id: str) -> Tuple[Optional[int], int, int]:
+        """Recompute one user from the primary: (wallet cents, expected cents, transaction count)"""
+        wallet = self.confirm_client.table("wallets").select("balance").eq("user_id", user_id).execute().data
+        net = 0
+        count = 0
+        for page in _keyset_pages(
+            lambda: self.confirm_client.table("transactions").select("id, from_user_id, to_user_id, amount").or_(
+                f"from_user_id.eq.{user_id},to_user_id.eq.{user_id}"
+            ),
+            self.page_size,
+        ):
+            count += len(page)
+            for tx in page:
+                net += _cents(tx["amount"]) if tx["to_user_id"] == user_id else -_cents(tx["amount"])
+        if self._archived_net is not None:
+            net += self._archived_net.get(user_id, 0)
+        balance = _cents(wallet[0]["balance"]) if wallet else None
+        if balance is not None and user_id in self._shards:
+            shards = self.confirm_client.table("wallet_shards").select("balance").eq("user_id", user_id).execute().data or []
+            balance += sum(_cents(row["balance"]) for row in shards)
+        return balance, INITIAL_BALANCE_CENTS + net, count
+
+    def run(self) -> Dict[str, Any]:
+        started = time.monotonic()
+        cutoff = datetime.now(timezone.utc)
+        totals, archive_included = self._scan_transactions(cutoff)
+        self._shards = self._shard_totals()
+
+        suspects: List[str] = []
+        wallets_checked = 0
+        seen = set()
+        for wallet in self._wallets():
+            wallets_checked += 1
+            user_id = wallet["user_id"]
+            seen.add(user_id)
+            net = totals.get(user_id, (0, 0))[0]
+            # Hot wallets hold the rest of their balance in wallet_shards
+            if _cents(wallet["balance"]) + self._shards.get(user_id, 0) != INITIAL_BALANCE_CENTS + net:
+                suspects.append(user_id)
+        # Users with transfers but no wallet row
+        suspects.extend(user_id for user_id in totals if user_id not in seen)
+
+        discrepancies = []
+        for user_id in suspects[:MAX_CONFIRMATIONS]:
+            balance, expected, count = self._confirm(user_id)
+            if balance == expected:
+                continue  # moved by a transfer that committed during the scan (or replica lag)
+            discrepancies.append({
+                "user_id": user_id,
+                "kind": "missing_wallet" if balance is None else "balance_mismatch",
+                "wallet_balance": None if balance is None else balance / 100,
+                "expected_balance": expected / 100,
+                "difference": None if balance is None else (balance - expected) / 100,
+                "transaction_count": count,
+            })
+        discrepancies.sort(key=lambda d: abs(d["difference"] or 0), reverse=True)
+
+        return {
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "cutoff": cutoff.isoformat(),
+            "archive_included": archive_included,
+            "transactions_scanned": self.rows_scanned,
+            "users_with_transactions": len(totals),
+            "wallets_checked": wallets_checked,
+            "suspects": len(suspects),
+            "unconfirmed_suspects": max(0, len(suspects) - MAX_CONFIRMATIONS),
+            "discrepancies": discrepancies,
+            "total_drift": round(sum(d["difference"] or 0 for d in discrepancies), 2),
+            "duration_seconds": round(time.monotonic() - started, 2),
+        }
+
+
+def reconcile(scan_client: Any, confirm_client: Optional[Any] = None, workers: int = 4) -> Dict[str, Any]:
+    return Reconciler(scan_client, confirm_client, workers=workers).run()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    client = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_ROLE_KEY"])
+    report = reconcile(client, workers=int(os.getenv("RECONCILE_WORKERS", "4")))
+    print(json.dumps(report, indent=2))
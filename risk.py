@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Risk scoring for the admin review queue: features are computed for the whole pending set
+# at once with NumPy (no per-row Python loops beyond parsing), so thousands of rows score in
+# a few milliseconds. Scores are 0-100 and only order the queue; they never approve anything.
+
+HISTORY_DAYS = 30
+HISTORY_LIMIT = 20000
+PAGE_SIZE = 1000
+# Sender ids per query: in_() puts every id in the GET URL, which gateways cap at a few KB
+ID_CHUNK_SIZE = 100
+BURST_WINDOW_SECONDS = 3600
+
+# Logistic model over the features below; weights are hand-tuned, intercept centres a
+# "typical transfer to a known recipient" around a score of ~10
+WEIGHTS = {
+    "amount_deviation": 0.9,   # z-score of log(amount) against the sender's history
+    "new_recipient": 1.2,      # never sent to this recipient in the history window
+    "burst": 0.6,              # sender's transfers in the hour up to this one (log2)
+    "balance_ratio": 1.5,      # amount / sender's current balance
+    "violations": 0.8,         # number of rule violations reported by the Action Blocker
+}
+INTERCEPT = -3.5
+
+
+def _timestamps(values: List[Optional[str]]) -> np.ndarray:
+    out = np.empty(len(values), dtype=np.float64)
+    for i, value in enumerate(values):
+        try:
+            out[i] = datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except (AttributeError, ValueError):
+            out[i] = np.nan
+    return out
+
+
+def fetch_risk_context(client: Any, sender_ids: List[str], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Recent completed transfers and current balances for the given senders"""
+    if not sender_ids:
+        return {"history": [], "balances": {}}
+    since = ((now or datetime.now(timezone.utc)) - timedelta(days=HISTORY_DAYS)).isoformat()
+    chunks = [sender_ids[i:i + ID_CHUNK_SIZE] for i in range(0, len(sender_ids), ID_CHUNK_SIZE)]
+    # Share the history budget between chunks so a large backlog doesn't starve the last senders
+    chunk_limit = max(PAGE_SIZE, HISTORY_LIMIT // len(chunks))
+    history: List[Dict[str, Any]] = []
+    balances: Dict[str, float] = {}
+    for chunk in chunks:
+        fetched = 0
+        while fetched < chunk_limit:
+            page = client.table("transactions").select(
+                "from_user_id, to_user_id, amount, created_at"
+            ).in_("from_user_id", chunk).gte("created_at", since).order(
+                "created_at", desc=True
+            ).range(fetched, fetched + PAGE_SIZE - 1).execute().data or []
+            history.extend(page)
+            fetched += len(page)
+            if len(page) < PAGE_SIZE:
+                break
+        wallets = client.table("wallets").select("user_id, balance").in_("user_id", chunk).execute()
+        balances.update({w["user_id"]: float(w["balance"]) for w in wallets.data or []})
+    return {"history": history, "balances": balances}
+
+
+def score_transactions(pending: List[Dict[str, Any]], context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Risk score (0-100) and per-feature values for each pending transfer, in input order"""
+    n = len(pending)
+    if n == 0:
+        return []
+    history = context["history"]
+    balances = context["balances"]
+
+    # Dense integer ids for every user involved, so groupings are bincount/isin over ints
+    user_index: Dict[str, int] = {}
+
+    def encode(ids: List[str]) -> np.ndarray:
+        return np.fromiter((user_index.setdefault(u, len(user_index)) for u in ids), dtype=np.int64, count=len(ids))
+
+    p_from = encode([tx["from_user_id"] for tx in pending])
+    p_to = encode([tx["to_user_id"] for tx in pending])
+    p_amount = np.array([float(tx["amount"]) for tx in pending], dtype=np.float64)
+    p_time = _timestamps([tx.get("created_at") for tx in pending])
+    p_violations = np.array([len(tx.get("violations") or []) for tx in pending], dtype=np.float64)
+
+    h_from = encode([tx["from_user_id"] for tx in history])
+    h_to = encode([tx["to_user_id"] for tx in history])
+    h_amount = np.array([float(tx["amount"]) for tx in history], dtype=np.float64)
+    h_time = _timestamps([tx.get("created_at") for tx in history])
+    users = len(user_index)
+
+    # Amount vs the sender's typical amounts: z-score in log space (robust to scale)
+    h_log = np.log1p(np.maximum(h_amount, 0.0))
+    count = np.bincount(h_from, minlength=users).astype(np.float64)
+    total = np.bincount(h_from, weights=h_log, minlength=users)
+    total_sq = np.bincount(h_from, weights=h_log * h_log, minlength=users)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        std = np.sqrt(np.maximum(total_sq / count - mean * mean, 0.0))
+    sender_count = count[p_from]
+    z = (np.log1p(np.maximum(p_amount, 0.0)) - mean[p_from]) / np.maximum(std[p_from], 0.5)
+    # No history: treat as moderately unusual rather than typical
+    amount_deviation = np.where(sender_count > 0, np.clip(z, 0.0, 6.0), 1.0)
+
+    # Recipient novelty: (sender, recipient) pair never seen in the history window
+    new_recipient = (~np.isin(p_from * users + p_to, h_from * users + h_to)).astype(np.float64)
+
+    # Burst: sender's completed and pending transfers in the window ending at this one
+    e_from = np.concatenate([h_from, p_from])
+    e_time = np.concatenate([h_time, p_time])
+    valid = ~np.isnan(e_time)
+    e_from, e_time = e_from[valid], e_time[valid]
+    burst = np.zeros(n)
+    if e_time.size:
+        origin = e_time.min()
+        stride = (e_time.max() - origin) + BURST_WINDOW_SECONDS + 1.0
+        keys = np.sort(e_from * stride + (e_time - origin))
+        p_key = p_from * stride + (np.nan_to_num(p_time, nan=origin) - origin)
+        in_window = np.searchsorted(keys, p_key, side="right") - np.searchsorted(keys, p_key - BURST_WINDOW_SECONDS, side="left")
+        burst = np.log2(np.maximum(in_window, 1).astype(np.float64))
+
+    # Share of the sender's current balance this transfer would move
+    p_balance = np.array([balances.get(tx["from_user_id"], 0.0) for tx in pending], dtype=np.float64)
+    balance_ratio = np.clip(p_amount / np.maximum(p_balance, 1.0), 0.0, 2.0)
+
+    features = {
+        "amount_deviation": amount_deviation,
+        "new_recipient": new_recipient,
+        "burst": burst,
+        "balance_ratio": balance_ratio,
+        "violations": np.minimum(p_violations, 5.0),
+    }
+    logit = INTERCEPT + sum(WEIGHTS[name] * values for name, values in features.items())
+    scores = 100.0 / (1.0 + np.exp(-logit))
+
+    return [
+        {
+            "risk_score": round(float(scores[i]), 1),
+            "risk_factors": {name: round(float(values[i]), 3) for name, values in features.items()},
+        }
+        for i in range(n)
+    ]
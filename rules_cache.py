@@ -0,0 +1,96 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class RulesCache:
+    """Versioned in-process copy of the transaction_rules table
+
+    The version lives in the database (rules_version, bumped by a trigger on every write to
+    transaction_rules, see create_rules_notify.sql), so every worker reports the same version
+    for the same rules. Workers don't LISTEN for rules_changed: they compare against the database
+    version at most every `check_interval_seconds`, so another worker's change is seen within that
+    interval and this worker's own writes immediately. `etag` is a hash of the rules themselves.
+    Without the trigger installed the version is derived from the ETag and the copy is re-read
+    after `fallback_ttl_seconds`.
+    """
+
+    def __init__(self, fallback_ttl_seconds: float = 60.0, check_interval_seconds: float = 2.0):
+        self.fallback_ttl_seconds = fallback_ttl_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self.db_versioned = True
+        self.version = 0
+        self.etag: Optional[str] = None
+        self._rules: Optional[List[Dict[str, Any]]] = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def fresh(self) -> Optional[List[Dict[str, Any]]]:
+        """Cached rules if they were checked against the database recently enough, else None"""
+        with self._lock:
+            if self._rules is None:
+                return None
+            age = time.monotonic() - (self._checked_at if self.db_versioned else self._loaded_at)
+            limit = self.check_interval_seconds if self.db_versioned else self.fallback_ttl_seconds
+            return self._rules if age < limit else None
+
+    def get(self, db_version: Optional[int]) -> Optional[List[Dict[str, Any]]]:
+        """Return cached rules if they are still current for `db_version`, else None"""
+        with self._lock:
+            if self._rules is None:
+                return None
+            if db_version is not None:
+                if db_version != self.version:
+                    return None
+                self._checked_at = time.monotonic()
+                return self._rules
+            if time.monotonic() - self._loaded_at > self.fallback_ttl_seconds:
+                return None
+            return self._rules
+
+    def set(self, rules: List[Dict[str, Any]], db_version: Optional[int]) -> None:
+        """Store freshly loaded rules along with the database version they were read at"""
+        with self._lock:
+            self._store(rules, db_version)
+
+    def replace(self, rule: Dict[str, Any], db_version: Optional[int]) -> bool:
+        """Swap in one rule as returned by the write that changed it; False if the copy needs a reload
+
+        `db_version` is the version right after that write. If it is not the next version after
+        the cached one, another change landed in between and the copy is stale.
+        """
+        with self._lock:
+            if self._rules is None:
+                return False
+            if db_version is not None and db_version != self.version + 1:
+                self._checked_at = 0.0
+                return False
+            loaded_at = self._loaded_at
+            rules = [r for r in self._rules if r.get("rule_id") != rule.get("rule_id")] + [rule]
+            self._store(rules, db_version)
+            if db_version is None:
+                # The other rules are no fresher than before: keep the fallback TTL running
+                self._loaded_at = loaded_at
+            return True
+
+    def _store(self, rules: List[Dict[str, Any]], db_version: Optional[int]) -> None:
+        # Sort so the ETag doesn't depend on the order PostgREST returns rows in
+        rules = sorted(rules, key=lambda r: str(r.get("rule_id")))
+        payload = json.dumps(rules, sort_keys=True, default=str).encode()
+        digest = hashlib.sha1(payload).hexdigest()
+        self._rules = rules
+        self._loaded_at = self._checked_at = time.monotonic()
+        self.etag = f'"rules-{digest[:16]}"'
+        # Same rules -> same version on every worker, even without rules_version
+        self.version = db_version if db_version is not None else int(digest[:12], 16)
+
+    def find(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            rules = self._rules or []
+        return next((r for r in rules if r.get("rule_id") == rule_id), None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"version": self.version, "etag": self.etag}
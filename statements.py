@@ -0,0 +1,181 @@
+import csv
+import io
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Monthly account statements: data is fetched on the job worker, rendering (render_statement)
+# runs in the job runner's process pool, so this module must stay importable without main.py.
+
+PAGE_SIZE = 1000
+
+
+def month_range(month: str) -> Tuple[datetime, datetime]:
+    """'2026-09' -> (2026-09-01T00:00Z, 2026-10-01T00:00Z)"""
+    start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+def _paged(build_query: Callable[[], Any]) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    offset = 0
+    while True:
+        result = build_query().range(offset, offset + PAGE_SIZE - 1).execute()
+        page = result.data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        offset += PAGE_SIZE
+
+
+def fetch_statement_data(client: Any, user_id: str, month: str) -> Dict[str, Any]:
+    """Completed and pending/reviewed transfers for one user and month"""
+    start, end = month_range(month)
+    transactions = _paged(
+        lambda: client.table("transactions").select(
+            "id, from_user_id, to_user_id, amount, created_at"
+        ).or_(
+            f"from_user_id.eq.{user_id},to_user_id.eq.{user_id}"
+        ).gte("created_at", start.isoformat()).lt("created_at", end.isoformat()).order("created_at").order("id")
+    )
+    try:
+        pending = _paged(
+            lambda: client.table("pending_transactions").select(
+                "id, from_user_id, to_user_id, amount, status, created_at"
+            ).eq("from_user_id", user_id).gte("created_at", start.isoformat()).lt(
+                "created_at", end.isoformat()
+            ).order("created_at").order("id")
+        )
+    except Exception:
+        pending = []  # If table doesn't exist, continue without pending
+
+    user_ids = {user_id}
+    for tx in transactions + pending:
+        user_ids.add(tx["from_user_id"])
+        user_ids.add(tx["to_user_id"])
+    emails: Dict[str, str] = {}
+    try:
+        users = client.table("users").select("id, email").in_("id", list(user_ids)).execute()
+        emails = {u["id"]: u["email"] for u in users.data or []}
+    except Exception:
+        pass
+
+    return {"transactions": transactions, "pending": pending, "emails": emails}
+
+
+def build_statement_rows(user_id: str, data: Dict[str, Any]) -> List[List[str]]:
+    """Flatten statement data into table rows: date, type, counterparty, status, amount (signed)"""
+    emails = data["emails"]
+    rows: List[List[str]] = []
+    for tx in data["transactions"]:
+        outgoing = tx["from_user_id"] == user_id
+        counterparty = tx["to_user_id"] if outgoing else tx["from_user_id"]
+        amount = float(tx["amount"])
+        rows.append([
+            tx["created_at"][:19].replace("T", " "),
+            "sent" if outgoing else "received",
+            emails.get(counterparty, counterparty),
+            "completed",
+            f"{-amount if outgoing else amount:.2f}",
+        ])
+    for tx in data["pending"]:
+        rows.append([
+            tx["created_at"][:19].replace("T", " "),
+            "sent",
+            emails.get(tx["to_user_id"], tx["to_user_id"]),
+            tx.get("status", "pending"),
+            f"{-float(tx['amount']):.2f}",
+        ])
+    rows.sort(key=lambda r: r[0])
+    return rows
+
+
+STATEMENT_COLUMNS = ["Date (UTC)", "Type", "Counterparty", "Status", "Amount"]
+
+
+def render_statement(fmt: str, header: Dict[str, Any], rows: List[List[str]]) -> bytes:
+    """CPU-bound rendering entry point (runs in the process pool)"""
+    if fmt == "pdf":
+        return _render_pdf(header, rows)
+    return _render_csv(header, rows)
+
+
+def _summary_lines(header: Dict[str, Any]) -> List[str]:
+    lines = [
+        f"Account statement for {header['email']}",
+        f"Period: {header['month']}",
+    ]
+    if header.get("opening_balance") is not None:
+        lines.append(f"Opening balance: {header['opening_balance']:.2f}")
+    if header.get("closing_balance") is not None:
+        lines.append(f"Closing balance: {header['closing_balance']:.2f}")
+    lines.append(f"Generated: {header['generated_at']}")
+    return lines
+
+
+def _render_csv(header: Dict[str, Any], rows: List[List[str]]) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for line in _summary_lines(header):
+        writer.writerow([f"# {line}"])
+    writer.writerow(STATEMENT_COLUMNS)
+    writer.writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+
+def _pdf_escape(text: str) -> str:
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _render_pdf(header: Dict[str, Any], rows: List[List[str]]) -> bytes:
+    """Minimal multi-page PDF (Courier, A4) without third-party libraries"""
+    widths = [20, 9, 32, 10, 12]
+    lines = _summary_lines(header) + [""]
+    lines.append("".join(c.ljust(w) for c, w in zip(STATEMENT_COLUMNS, widths)))
+    lines.append("-" * sum(widths))
+    for row in rows:
+        lines.append("".join(str(c)[:w - 1].ljust(w) for c, w in zip(row, widths)))
+
+    per_page = 60
+    pages = [lines[i:i + per_page] for i in range(0, len(lines), per_page)] or [[]]
+
+    objects: List[bytes] = []
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{' '.join(f'{p} 0 R' for p in page_ids)}] /Count {len(pages)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
+    for i, page_lines in enumerate(pages):
+        stream = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        for line in page_lines:
+            stream.append(f"({_pdf_escape(line)}) Tj T*")
+        stream.append("ET")
+        content = "\n".join(stream).encode("latin-1")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_ids[i] + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length " + str(len(content)).encode() + b" >>\nstream\n" + content + b"\nendstream")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def statement_header(email: str, month: str, opening: Optional[float], closing: Optional[float]) -> Dict[str, Any]:
+    return {
+        "email": email,
+        "month": month,
+        "opening_balance": opening,
+        "closing_balance": closing,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
@@ -0,0 +1,220 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from balance_history import DAY_SECONDS, BalanceHistory, _bucket_entries, pick_interval
+
+UTC = timezone.utc
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def select(self, *columns):
+        return self
+
+    def eq(self, column, value):
+        self.rows = [r for r in self.rows if r[column] == value]
+        return self
+
+    def gte(self, column, value):
+        self.rows = [r for r in self.rows if r[column] >= value]
+        return self
+
+    def lt(self, column, value):
+        self.rows = [r for r in self.rows if r[column] < value]
+        return self
+
+    def lte(self, column, value):
+        self.rows = [r for r in self.rows if r[column] <= value]
+        return self
+
+    def order(self, column, desc=False):
+        self.rows.sort(key=lambda r: r[column], reverse=desc)
+        return self
+
+    def limit(self, n):
+        self.rows = self.rows[:n]
+        return self
+
+    def range(self, start, end):
+        self.rows = self.rows[start:end + 1]
+        return self
+
+    def execute(self):
+        class Result:
+            data = self.rows
+        return Result()
+
+
+class FakeWallet:
+    """ledger_entries plus a Python copy of refresh_daily_balances() (create_balance_rollups.sql)"""
+
+    def __init__(self, now):
+        self.now = now
+        self.entries = []
+        self.rollups = []
+
+    def add(self, when, direction, amount):
+        self.entries.append({
+            "user_id": "u", "seq": len(self.entries), "direction": direction,
+            "amount": amount, "created_at": when.isoformat(),
+        })
+
+    def table(self, name):
+        return FakeQuery(self.entries if name == "ledger_entries" else self.rollups)
+
+    def rpc(self, name, params):
+        assert name == "refresh_daily_balances"
+        self.refresh()
+        return FakeQuery([])
+
+    def refresh(self):
+        # Days close five minutes after midnight
+        open_day = (self.now - timedelta(minutes=5)).date()
+        last = max((r for r in self.rollups), key=lambda r: r["day"], default=None)
+        balance = last["closing_balance"] if last else 0.0
+        days = {}
+        for e in sorted(self.entries, key=lambda e: e["seq"]):
+            day = datetime.fromisoformat(e["created_at"]).date()
+            if day >= open_day or (last and day.isoformat() <= last["day"]):
+                continue
+            signed = e["amount"] if e["direction"] == "credit" else -e["amount"]
+            row = days.setdefault(day, {"low": balance, "high": balance})
+            balance += signed
+            row.update(close=balance, low=min(row["low"], balance), high=max(row["high"], balance))
+        for day, row in sorted(days.items()):
+            self.rollups.append({
+                "user_id": "u", "day": day.isoformat(), "closing_balance": row["close"],
+                "low_balance": row["low"], "high_balance": row["high"],
+            })
+
+    # Ledger.balance()
+    def balance(self, user_id, as_of):
+        return sum(
+            e["amount"] if e["direction"] == "credit" else -e["amount"]
+            for e in self.entries if e["created_at"] <= as_of
+        )
+
+    def expected(self, start, end):
+        """Closing balance, low and high over [start, end) by replaying every entry"""
+        balance = self.balance("u", (start - timedelta(microseconds=1)).isoformat())
+        low = high = balance
+        for e in sorted(self.entries, key=lambda e: e["created_at"]):
+            when = datetime.fromisoformat(e["created_at"])
+            if start <= when < end:
+                balance += e["amount"] if e["direction"] == "credit" else -e["amount"]
+                low, high = min(low, balance), max(high, balance)
+        return round(balance, 2), round(low, 2), round(high, 2)
+
+
+def history_for(wallet):
+    return BalanceHistory(lambda: wallet, wallet)
+
+
+def populate(wallet):
+    wallet.add(datetime(2026, 9, 1, 8, tzinfo=UTC), "credit", 1000)
+    wallet.add(datetime(2026, 9, 20, 9, tzinfo=UTC), "debit", 300)
+    wallet.add(datetime(2026, 9, 20, 10, tzinfo=UTC), "credit", 50)
+    wallet.add(datetime(2026, 10, 2, 14, tzinfo=UTC), "debit", 600)
+    wallet.add(datetime(2026, 10, 2, 15, tzinfo=UTC), "credit", 900)
+    wallet.add(datetime(2026, 10, 17, 23, 59, 59, tzinfo=UTC), "debit", 75)
+    wallet.add(datetime(2026, 10, 18, 0, 1, tzinfo=UTC), "credit", 20)
+
+
+def assert_matches_replay(wallet, result, end):
+    step = timedelta(seconds=result["interval_seconds"])
+    for point in result["points"]:
+        bucket_start = datetime.fromisoformat(point["t"])
+        assert (point["balance"], point["low"], point["high"]) == wallet.expected(bucket_start, min(bucket_start + step, end)), point["t"]
+
+
+def test_pick_interval():
+    now = datetime(2026, 10, 18, 12, tzinfo=UTC)
+    assert pick_interval(now - timedelta(hours=1), now, 100) == 60
+    assert pick_interval(now - timedelta(days=1), now, 4) == 6 * 3600
+    assert pick_interval(now - timedelta(days=30), now, 200) == DAY_SECONDS
+    # 366 calendar days touched, 200 points: two days per bucket
+    assert pick_interval(now - timedelta(days=365), now, 200) == 2 * DAY_SECONDS
+
+
+def test_bucket_entries_tracks_low_high_and_carries_over_empty_buckets():
+    t0 = datetime(2026, 10, 1, tzinfo=UTC)
+    entries = [
+        {"direction": "debit", "amount": 40, "created_at": (t0 + timedelta(minutes=10)).isoformat()},
+        {"direction": "credit", "amount": 100, "created_at": (t0 + timedelta(minutes=20)).isoformat()},
+    ]
+    starts = [t0 + timedelta(hours=i) for i in range(3)]
+    points = _bucket_entries(50.0, entries, starts, timedelta(hours=1))
+    assert [(p["balance"], p["low"], p["high"]) for p in points] == [(110.0, 10.0, 110.0), (110.0, 110.0, 110.0), (110.0, 110.0, 110.0)]
+
+
+@pytest.mark.parametrize("points", [31, 10, 4])
+def test_daily_series_matches_ledger_replay_across_rollup_boundaries(points):
+    now = datetime(2026, 10, 18, 12, tzinfo=UTC)
+    wallet = FakeWallet(now)
+    populate(wallet)
+    # Rollups already exist for part of the range: the refresh extends them
+    wallet.now = datetime(2026, 9, 25, tzinfo=UTC)
+    wallet.refresh()
+    wallet.now = now
+
+    start = now - timedelta(days=30)
+    result = history_for(wallet).series("u", start, now, points, now=now)
+    assert result["source"] == "rollups"
+    assert result["interval_seconds"] >= DAY_SECONDS
+    assert len(result["points"]) <= points
+    assert_matches_replay(wallet, result, now)
+    assert result["points"][-1]["balance"] == 995.0
+
+
+def test_yesterday_is_replayed_until_it_is_rolled_up():
+    # Just after midnight: 23:59:59's transfer may still be committing, so yesterday isn't rolled up
+    now = datetime(2026, 10, 18, 0, 3, tzinfo=UTC)
+    wallet = FakeWallet(now)
+    populate(wallet)
+    result = history_for(wallet).series("u", now - timedelta(days=30), now, 31, now=now)
+    assert date(2026, 10, 17).isoformat() not in {r["day"] for r in wallet.rollups}
+    assert_matches_replay(wallet, result, now)
+    by_day = {p["t"][:10]: p for p in result["points"]}
+    assert by_day["2026-10-17"]["balance"] == 975.0
+    assert by_day["2026-10-18"]["balance"] == 995.0
+
+
+def test_rollup_written_during_the_api_grace_period_is_not_counted_twice():
+    # The database has rolled up yesterday (5 min) but the API still replays it (10 min)
+    now = datetime(2026, 10, 18, 0, 7, tzinfo=UTC)
+    wallet = FakeWallet(now)
+    populate(wallet)
+    wallet.refresh()
+    assert date(2026, 10, 17).isoformat() in {r["day"] for r in wallet.rollups}
+    for start in (now - timedelta(days=30), datetime(2026, 10, 18, tzinfo=UTC) - timedelta(days=8)):
+        result = history_for(wallet).series("u", start, now, 200, now=now)
+        assert result["source"] == "rollups"
+        assert_matches_replay(wallet, result, now)
+    # A daily range starting after the replayed day must not start from that day's rollup either
+    today = datetime(2026, 10, 18, tzinfo=UTC)
+    [point] = history_for(wallet)._daily("u", today, now, DAY_SECONDS, now)
+    assert (point["balance"], point["low"], point["high"]) == wallet.expected(today, now)
+
+
+def test_intraday_series_matches_ledger_replay():
+    now = datetime(2026, 10, 18, 12, tzinfo=UTC)
+    wallet = FakeWallet(now)
+    populate(wallet)
+    result = history_for(wallet).series("u", now - timedelta(days=1), now, 8, now=now)
+    assert result["source"] == "ledger"
+    assert result["interval_seconds"] == 3 * 3600
+    assert_matches_replay(wallet, result, now)
+
+
+def test_missing_rollups_disable_daily_series():
+    class Missing(FakeWallet):
+        def rpc(self, name, params):
+            raise Exception("Could not find the function public.refresh_daily_balances")
+
+    now = datetime(2026, 10, 18, 12, tzinfo=UTC)
+    history = history_for(Missing(now))
+    assert history.series("u", now - timedelta(days=30), now, 30, now=now) is None
+    assert history.available is False
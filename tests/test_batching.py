@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_results_fan_out_in_submission_order():
+    batches = []
+
+    async def send(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(send, max_batch_size=10)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5))), batcher
+
+    results, batcher = run(main())
+    assert results == [0, 10, 20, 30, 40]
+    assert batches == [[0, 1, 2, 3, 4]]
+    assert batcher.stats()["batches"] == 1
+    assert batcher.stats()["items"] == 5
+
+
+def test_full_batches_are_split_at_max_batch_size():
+    sizes = []
+
+    async def send(items):
+        sizes.append(len(items))
+        return list(items)
+
+    async def main():
+        batcher = MicroBatcher(send, max_batch_size=3)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(7)))
+
+    assert run(main()) == list(range(7))
+    assert sum(sizes) == 7
+    assert max(sizes) == 3
+
+
+def test_short_result_list_fails_every_item():
+    async def send(items):
+        return list(items)[:-1]
+
+    async def main():
+        batcher = MicroBatcher(send)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    results = run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert "2 results for 3 items" in str(results[0])
+
+
+def test_batch_exception_reaches_every_caller():
+    async def send(items):
+        raise ConnectionError("action blocker down")
+
+    async def main():
+        batcher = MicroBatcher(send)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    results = run(main())
+    assert len(results) == 3
+    assert all(isinstance(r, ConnectionError) for r in results)
+
+
+def test_per_item_exception_only_fails_that_item():
+    async def send(items):
+        return [ValueError(f"bad {item}") if item == 1 else item for item in items]
+
+    async def main():
+        batcher = MicroBatcher(send)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    first, second, third = run(main())
+    assert (first, third) == (0, 2)
+    assert isinstance(second, ValueError)
+
+
+def test_callers_that_gave_up_are_not_sent():
+    sent = []
+
+    async def send(items):
+        sent.extend(items)
+        return list(items)
+
+    async def main():
+        batcher = MicroBatcher(send)
+        leaver = asyncio.ensure_future(batcher.submit("gone"))
+        stayer = asyncio.ensure_future(batcher.submit("kept"))
+        # Let both enqueue, then cancel one before the batch is flushed
+        await asyncio.sleep(0)
+        leaver.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaver
+        return await stayer
+
+    assert run(main()) == "kept"
+    assert sent == ["kept"]
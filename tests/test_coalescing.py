@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+import pytest
+
+from coalescing import SingleFlight, coalescing_stats, single_flight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def load(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return {"value": value}
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", load, 1) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert calls == [1]
+    assert results == [{"value": 1}] * 5
+    assert results[0] is results[4]
+    assert flight.stats()["executions"] == 1
+    assert flight.stats()["coalesced"] == 4
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight("test")
+
+    async def load(value):
+        await asyncio.sleep(0)
+        return value
+
+    async def main():
+        return await asyncio.gather(flight.do("a", load, 1), flight.do("b", load, 2))
+
+    assert asyncio.run(main()) == [1, 2]
+    assert flight.executions == 2
+
+
+def test_exception_reaches_every_waiter_and_is_not_cached():
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        if calls == 1:
+            raise ValueError("upstream down")
+        return "ok"
+
+    async def main():
+        first = await asyncio.gather(*(flight.do("k", load) for _ in range(3)), return_exceptions=True)
+        # The failed call is dropped from the group, so the next caller retries
+        second = await flight.do("k", load)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert all(isinstance(e, ValueError) for e in first)
+    assert second == "ok"
+    assert calls == 2
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    flight = SingleFlight("test")
+
+    async def load():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        leaver = asyncio.ensure_future(flight.do("k", load))
+        stayer = asyncio.ensure_future(flight.do("k", load))
+        await asyncio.sleep(0.005)
+        leaver.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaver
+        return await stayer
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_do_sync_runs_blocking_function_in_a_thread():
+    flight = SingleFlight("test")
+    main_thread = threading.get_ident()
+
+    def load(x):
+        return x * 2, threading.get_ident()
+
+    value, thread = asyncio.run(flight.do_sync("k", load, 21))
+    assert value == 42
+    assert thread != main_thread
+
+
+def test_named_groups_are_shared_and_reported():
+    group = single_flight("test-registry")
+    assert single_flight("test-registry") is group
+    names = [g["name"] for g in coalescing_stats()["groups"]]
+    assert "test-registry" in names
@@ -0,0 +1,121 @@
+import asyncio
+import gzip
+import json
+
+from starlette.requests import Request
+
+from conditional import ADMIN_SCOPE, ConditionalResponder, VersionTracker
+
+
+def make_request(**headers):
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+class Builder:
+    """Async build callback that counts calls and returns whatever `payload` is set to"""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.payload
+
+
+def respond(responder, request, build, key=("balance", "u1"), scope="u1"):
+    return asyncio.run(responder.respond(request, key, scope, build))
+
+
+def test_version_bump_moves_user_and_admin_scopes():
+    versions = VersionTracker()
+    versions.bump("u1", "u2", None, "u1")
+    assert versions.get("u1") == 1
+    assert versions.get("u2") == 1
+    assert versions.get(ADMIN_SCOPE) == 1
+    assert versions.get("u3") == 0
+
+
+def test_matching_if_none_match_returns_304_without_rebuilding():
+    responder = ConditionalResponder(VersionTracker(), revalidate_after=60)
+    build = Builder({"balance": 10.0})
+    first = respond(responder, make_request(), build)
+    assert first.status_code == 200
+    assert json.loads(first.body) == {"balance": 10.0}
+
+    second = respond(responder, make_request(if_none_match=first.headers["etag"]), build)
+    assert second.status_code == 304
+    assert second.headers["etag"] == first.headers["etag"]
+    assert build.calls == 1
+    assert responder.stats()["not_modified"] == 1
+
+
+def test_version_bump_rebuilds_and_changes_etag_only_if_body_changed():
+    versions = VersionTracker()
+    responder = ConditionalResponder(versions, revalidate_after=60)
+    build = Builder({"balance": 10.0})
+    etag = respond(responder, make_request(), build).headers["etag"]
+
+    # Bumped but unchanged: rebuilt, same ETag, still a 304
+    versions.bump("u1")
+    unchanged = respond(responder, make_request(if_none_match=etag), build)
+    assert build.calls == 2
+    assert unchanged.status_code == 304
+
+    # Bumped and changed: new body, new ETag, the old one no longer matches
+    versions.bump("u1")
+    build.payload = {"balance": 5.0}
+    changed = respond(responder, make_request(if_none_match=etag), build)
+    assert build.calls == 3
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert json.loads(changed.body) == {"balance": 5.0}
+
+
+def test_other_users_bumps_do_not_invalidate():
+    versions = VersionTracker()
+    responder = ConditionalResponder(versions, revalidate_after=60)
+    build = Builder({"balance": 10.0})
+    respond(responder, make_request(), build)
+    versions.bump("u2")
+    respond(responder, make_request(), build)
+    assert build.calls == 1
+
+
+def test_entries_are_revalidated_after_the_time_limit():
+    responder = ConditionalResponder(VersionTracker(), revalidate_after=0)
+    build = Builder({"balance": 10.0})
+    respond(responder, make_request(), build)
+    respond(responder, make_request(), build)
+    assert build.calls == 2
+
+
+def test_gzip_variant_has_its_own_etag_and_still_matches():
+    responder = ConditionalResponder(VersionTracker(), revalidate_after=60, min_compress_size=10)
+    build = Builder({"transactions": [{"id": i, "amount": 1.0} for i in range(50)]})
+    plain = respond(responder, make_request(), build)
+    zipped = respond(responder, make_request(accept_encoding="gzip"), build)
+    assert zipped.headers["content-encoding"] == "gzip"
+    assert zipped.headers["etag"] == plain.headers["etag"][:-1] + '-gzip"'
+    assert gzip.decompress(zipped.body) == plain.body
+
+    # A client holding the gzip ETag gets a 304 whatever encoding it asks for next
+    revalidated = respond(responder, make_request(if_none_match=zipped.headers["etag"]), build)
+    assert revalidated.status_code == 304
+
+
+def test_small_bodies_are_not_compressed():
+    responder = ConditionalResponder(VersionTracker(), min_compress_size=1024)
+    response = respond(responder, make_request(accept_encoding="gzip"), Builder({"balance": 1.0}))
+    assert "content-encoding" not in response.headers
+
+
+def test_if_none_match_parsing():
+    etag = '"abc123"'
+    assert ConditionalResponder._matches('"abc123"', etag)
+    assert ConditionalResponder._matches('W/"abc123"', etag)
+    assert ConditionalResponder._matches('"other", "abc123-br"', etag)
+    assert ConditionalResponder._matches("*", etag)
+    assert not ConditionalResponder._matches('"abc1234"', etag)
+    assert not ConditionalResponder._matches(None, etag)
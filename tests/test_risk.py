@@ -0,0 +1,126 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from risk import BURST_WINDOW_SECONDS, ID_CHUNK_SIZE, PAGE_SIZE, fetch_risk_context, score_transactions
+
+T0 = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def at(seconds):
+    return (T0 + timedelta(seconds=seconds)).isoformat()
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.ids = []
+        self.bounds = (0, None)
+
+    def select(self, *columns):
+        return self
+
+    def in_(self, column, values):
+        self.ids = list(values)
+        return self
+
+    def gte(self, column, value):
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    def execute(self):
+        self.client.calls.append((self.table, self.ids))
+        if self.table == "wallets":
+            rows = [{"user_id": user_id, "balance": "100.00"} for user_id in self.ids]
+        else:
+            rows = [row for row in self.client.history if row["from_user_id"] in self.ids]
+            start, end = self.bounds
+            rows = rows[start:end + 1]
+
+        class Result:
+            data = rows
+        return Result()
+
+
+class FakeClient:
+    def __init__(self, history=()):
+        self.history = list(history)
+        self.calls = []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+def pending(sender, recipient, amount, seconds, violations=()):
+    return {"from_user_id": sender, "to_user_id": recipient, "amount": amount, "created_at": at(seconds), "violations": list(violations)}
+
+
+def test_sender_ids_are_queried_in_chunks():
+    senders = [f"user-{i}" for i in range(2 * ID_CHUNK_SIZE + 50)]
+    client = FakeClient()
+    context = fetch_risk_context(client, senders, now=T0)
+
+    history_calls = [ids for table, ids in client.calls if table == "transactions"]
+    wallet_calls = [ids for table, ids in client.calls if table == "wallets"]
+    assert [len(ids) for ids in history_calls] == [ID_CHUNK_SIZE, ID_CHUNK_SIZE, 50]
+    assert [len(ids) for ids in wallet_calls] == [ID_CHUNK_SIZE, ID_CHUNK_SIZE, 50]
+    assert sorted(sum(history_calls, [])) == sorted(senders)
+    assert len(context["balances"]) == len(senders)
+    assert context["balances"]["user-0"] == 100.0
+
+
+def test_history_is_paged_within_a_chunk():
+    history = [{"from_user_id": "a", "to_user_id": "b", "amount": 1, "created_at": at(-i)} for i in range(PAGE_SIZE + 5)]
+    client = FakeClient(history)
+    context = fetch_risk_context(client, ["a"], now=T0)
+    assert len(context["history"]) == PAGE_SIZE + 5
+    assert len([c for c in client.calls if c[0] == "transactions"]) == 2
+
+
+def test_no_senders_makes_no_queries():
+    client = FakeClient()
+    assert fetch_risk_context(client, [], now=T0) == {"history": [], "balances": {}}
+    assert client.calls == []
+
+
+def test_burst_counts_the_senders_transfers_in_the_window():
+    history = [
+        {"from_user_id": "a", "to_user_id": "b", "amount": 10, "created_at": at(-BURST_WINDOW_SECONDS - 60)},  # too old
+        {"from_user_id": "a", "to_user_id": "b", "amount": 10, "created_at": at(-1800)},
+        {"from_user_id": "a", "to_user_id": "b", "amount": 10, "created_at": at(-60)},
+        {"from_user_id": "c", "to_user_id": "b", "amount": 10, "created_at": at(-30)},  # other sender
+    ]
+    scored = score_transactions(
+        [pending("a", "b", 10, 0), pending("a", "b", 10, 3600 * 5)],
+        {"history": history, "balances": {"a": 1000.0}},
+    )
+    # The transfer itself plus the two completed ones inside the hour
+    assert scored[0]["risk_factors"]["burst"] == round(math.log2(3), 3)
+    # Hours later, only the pending transfer itself is in its window
+    assert scored[1]["risk_factors"]["burst"] == 0.0
+
+
+def test_features_and_score_order():
+    history = [{"from_user_id": "a", "to_user_id": "b", "amount": 20 + i % 3, "created_at": at(-86400 * (i + 1))} for i in range(20)]
+    context = {"history": history, "balances": {"a": 1000.0, "n": 50.0}}
+    usual, unusual = score_transactions(
+        [pending("a", "b", 21, 0), pending("n", "z", 500, 0, violations=["LARGE_AMOUNT", "NEW_RECIPIENT"])],
+        context,
+    )
+    assert usual["risk_factors"]["new_recipient"] == 0.0
+    assert unusual["risk_factors"]["new_recipient"] == 1.0
+    # No history: moderately unusual rather than typical
+    assert unusual["risk_factors"]["amount_deviation"] == 1.0
+    assert unusual["risk_factors"]["balance_ratio"] == 2.0
+    assert unusual["risk_factors"]["violations"] == 2.0
+    assert 0 <= usual["risk_score"] < unusual["risk_score"] <= 100
+
+
+def test_empty_pending_list():
+    assert score_transactions([], {"history": [], "balances": {}}) == []
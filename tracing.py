@@ -0,0 +1,251 @@
+import contextvars
+import json
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from app_logging import get_logger
+
+logger = get_logger("tracing")
+
+# Lightweight OpenTelemetry-compatible tracing: W3C `traceparent` propagation and OTLP/JSON
+# export, without pulling the OpenTelemetry SDK into the Vercel bundle.
+#
+#   TRACE_EXPORT_FILE=traces.jsonl          one OTLP/JSON document per span batch
+#   TRACE_EXPORT_URL=http://collector:4318  OTLP/HTTP collector (POSTs to /v1/traces)
+#   TRACE_SAMPLE_RATE=1.0                   fraction of new traces that are recorded
+#
+# With neither exporter configured, tracing is off and span() costs almost nothing.
+
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "wallet-back")
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error", "sampled", "links")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, kind: int = 1):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind  # OTLP SpanKind: 1 internal, 2 server, 3 client
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.sampled = sampled
+        # (trace_id, span_id) of related spans in other traces, e.g. every transfer in a batch
+        self.links: List[tuple] = []
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.links:
+            span["links"] = [{"traceId": trace_id, "spanId": span_id} for trace_id, span_id in self.links]
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_document(spans: List[Span]) -> Dict[str, Any]:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "wallet-back"}, "spans": [s.to_otlp() for s in spans]}],
+        }]
+    }
+
+
+class BatchExporter:
+    """Collects finished spans and writes them in batches from a background thread"""
+
+    def __init__(self, file_path: Optional[str], collector_url: Optional[str], max_batch: int = 256, interval: float = 2.0):
+        self.file_path = file_path
+        self.collector_url = collector_url.rstrip("/") + "/v1/traces" if collector_url else None
+        self.max_batch = max_batch
+        self.interval = interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Span] = []
+            stop = False
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: List[Span]) -> None:
+        document = _otlp_document(batch)
+        try:
+            if self.file_path:
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(document) + "\n")
+            if self.collector_url:
+                httpx.post(self.collector_url, json=document, timeout=5.0)
+        except Exception as e:
+            logger.warning("Trace export failed: %s", e)
+
+
+_exporter: Optional[BatchExporter] = None
+_sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+
+
+def configure_tracing() -> None:
+    global _exporter
+    file_path = os.getenv("TRACE_EXPORT_FILE")
+    collector_url = os.getenv("TRACE_EXPORT_URL")
+    if _exporter is None and (file_path or collector_url):
+        _exporter = BatchExporter(file_path, collector_url)
+
+
+def shutdown_tracing() -> None:
+    global _exporter
+    if _exporter is not None:
+        _exporter.shutdown()
+        _exporter = None
+
+
+def parse_traceparent(header: Optional[str]):
+    """Return (trace_id, parent_span_id, sampled) from a W3C traceparent header, or None"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2], parts[3] == "01"
+
+
+@contextmanager
+def span(
+    name: str, kind: int = 1, traceparent: Optional[str] = None, links: Optional[List[Optional[str]]] = None, **attributes
+) -> Iterator[Optional[Span]]:
+    """Time a block as a child of the current span (or start a trace, continuing `traceparent` if given)
+
+    `links` are traceparents of other operations this block works for (span links).
+    """
+    if _exporter is None:
+        yield None
+        return
+    parent: Optional[Span] = _current_span.get()
+    if parent is not None:
+        current = Span(name, parent.trace_id, parent.span_id, parent.sampled, kind)
+    else:
+        remote = parse_traceparent(traceparent)
+        if remote:
+            current = Span(name, remote[0], remote[1], remote[2], kind)
+        else:
+            current = Span(name, secrets.token_hex(16), None, random.random() < _sample_rate, kind)
+    current.attributes.update(attributes)
+    for link in links or ():
+        remote = parse_traceparent(link)
+        if remote:
+            current.links.append((remote[0], remote[1]))
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        if current.sampled:
+            _exporter.export(current)
+
+
+def current_traceparent() -> Optional[str]:
+    """traceparent of the current span, to carry trace context inside a payload (e.g. a batched item)"""
+    current: Optional[Span] = _current_span.get()
+    return current.traceparent() if current is not None else None
+
+
+def inject_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Add the current trace context (traceparent) to outgoing request headers"""
+    headers = dict(headers or {})
+    current: Optional[Span] = _current_span.get()
+    if current is not None:
+        headers["traceparent"] = current.traceparent()
+    return headers
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a server span per HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _exporter is None:
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        with span(f"{scope['method']} {scope['path']}", kind=2, traceparent=traceparent,
+                  **{"http.method": scope["method"], "http.target": scope["path"]}) as server_span:
+
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    server_span.set_attribute("http.status_code", message["status"])
+                await send(message)
+
+            await self.app(scope, receive, send_with_status)